@@ -1,15 +1,114 @@
+import operator
+from functools import reduce
+
 from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections, router, transaction
+from django.db.models import Q
+from django.utils.functional import cached_property
+from . import engagement, fulltext
 from .models import Post, Comment, Profile, Review, Reaction, CommentVote, Notification, Subscription
 
+
+def estimated_row_count(model):
+    """
+    Filas de la tabla según las estadísticas del motor (ANALYZE en SQLite,
+    reltuples en PostgreSQL), sin recorrerla; None si no hay estadísticas
+    """
+    conn = connections[router.db_for_read(model)]
+    table = model._meta.db_table
+    try:
+        with conn.cursor() as cursor:
+            if conn.vendor == 'sqlite':
+                # La primera cifra de `stat` son las filas de la tabla (o del índice, si es parcial)
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s', [table])
+                counts = [int(stat.split()[0]) for stat, in cursor.fetchall()]
+                return max(counts) if counts else None
+            if conn.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+                row = cursor.fetchone()
+                return row[0] if row and row[0] >= 0 else None
+    except DatabaseError:
+        # sqlite_stat1 no existe hasta el primer ANALYZE
+        return None
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Sin filtros ni búsqueda, el total del changelist sale de las estadísticas
+    en lugar de un COUNT(*) sobre millones de filas. Por debajo de
+    `exact_below` filas se cuenta de verdad: es barato y evita estadísticas
+    viejas de cuando la tabla estaba vacía. Con una estimación alta de más
+    la última página puede salir corta o vacía.
+    """
+    exact_below = 100000
+
+    @cached_property
+    def count(self):
+        if not self.object_list.query.where:
+            estimate = estimated_row_count(self.object_list.model)
+            if estimate is not None and estimate >= self.exact_below:
+                return estimate
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelist para tablas grandes: ordenado por id (la clave primaria, sin
+    ordenar en memoria), total estimado y sin el segundo COUNT del total sin
+    filtrar. La búsqueda sólo usa índices: `search_fields` son FKs a User
+    que se comparan con el principio del nombre de usuario (un rango sobre
+    su índice único) y `fulltext_search_fields` lleva cada campo (el propio
+    'pk' o una FK) al índice de texto completo de su tabla (blog.fulltext).
+    Cada condición es un IN sobre una columna indexada, que SQLite junta con
+    MULTI-INDEX OR.
+    """
+    ordering = ('-id',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    fulltext_search_fields = {}
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        # username__startswith sería un LIKE, que no usa el índice sin COLLATE NOCASE
+        users = User.objects.filter(username__gte=search_term, username__lt=search_term + '\U0010ffff').values('pk')
+        conditions = [Q(**{f'{field}__in': users}) for field in self.search_fields]
+        for field, index in self.fulltext_search_fields.items():
+            conditions.append(Q(**{f'{field}__in': index.matching(search_term)}))
+        return queryset.filter(reduce(operator.or_, conditions)), False
+
+
+class RatingFilter(admin.SimpleListFilter):
+    """Las cinco calificaciones posibles, sin un SELECT DISTINCT sobre toda la tabla"""
+    title = 'calificación'
+    parameter_name = 'rating'
+
+    def lookups(self, request, model_admin):
+        return [(str(rating), '★' * rating) for rating in range(1, 6)]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(rating=self.value())
+        return queryset
+
+
 @admin.register(Post)
 class PostAdmin(admin.ModelAdmin):
     list_display = ('title', 'slug', 'author', 'created_date', 'published')
     list_filter = ('created_date', 'published_date', 'author', 'published')
+    list_select_related = ('author',)
+    # Sólo para que aparezca el buscador: get_search_results va al índice de texto completo
     search_fields = ('title', 'content')
+    search_help_text = 'Palabras (o su principio) del título o del contenido'
     prepopulated_fields = {'slug': ('title',)}
     date_hierarchy = 'created_date'
     ordering = ('created_date',)
     list_editable = ('published',)
+    actions = ['export_engagement']
     
     fieldsets = (
         (None, {
@@ -21,67 +120,102 @@ class PostAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        return queryset.filter(pk__in=fulltext.POSTS.matching(search_term)), False
+
+    def export_engagement(self, request, queryset):
+        # Por autor: filtrar por autor y seleccionar todos
+        return engagement.csv_response(queryset, 'interaccion.csv')
+    export_engagement.short_description = 'Exportar reseñas, comentarios y reacciones (CSV)'
+
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
-    list_display = ('author', 'post', 'created_date', 'is_approved', 'pinned', 'get_score')
-    list_filter = ('is_approved', 'pinned', 'created_date')
-    search_fields = ('author__username', 'content')
+class CommentAdmin(LargeTableAdmin):
+    list_display = ('author', 'post', 'created_date', 'is_approved', 'pinned', 'upvotes', 'downvotes', 'wilson_score')
+    list_filter = ('is_approved', 'pinned', 'rejected', 'created_date')
+    list_select_related = ('author', 'post')
+    search_fields = ('author',)
+    search_help_text = 'Principio del nombre de usuario o palabras del comentario'
+    fulltext_search_fields = {'pk': fulltext.COMMENTS}
     actions = ['approve_comments', 'pin_comments', 'unpin_comments']
     list_editable = ('is_approved', 'pinned')
 
     def approve_comments(self, request, queryset):
-        queryset.update(is_approved=True)
-        self.message_user(request, f'{queryset.count()} comentarios aprobados.')
+        # Los ids antes del update(): con el filtro "no aprobados" del changelist el queryset
+        # ya no devolvería nada después
+        ids = list(queryset.values_list('pk', flat=True))
+        with transaction.atomic():
+            updated = Comment.objects.filter(pk__in=ids).update(is_approved=True, rejected=False)
+            # update() no envía señales: los contadores de respuestas se rehacen aparte
+            Comment.recount_replies(Comment.objects.filter(pk__in=ids).only('path'))
+        self.message_user(request, f'{updated} comentarios aprobados.')
     approve_comments.short_description = 'Aprobar comentarios seleccionados'
     
     def pin_comments(self, request, queryset):
-        queryset.update(pinned=True)
-        self.message_user(request, f'{queryset.count()} comentarios fijados.')
+        updated = queryset.update(pinned=True)
+        self.message_user(request, f'{updated} comentarios fijados.')
     pin_comments.short_description = 'Fijar comentarios seleccionados'
     
     def unpin_comments(self, request, queryset):
-        queryset.update(pinned=False)
-        self.message_user(request, f'{queryset.count()} comentarios desfijados.')
+        updated = queryset.update(pinned=False)
+        self.message_user(request, f'{updated} comentarios desfijados.')
     unpin_comments.short_description = 'Desfijar comentarios seleccionados'
 
 @admin.register(Profile)
 class ProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'created_date')
+    list_select_related = ('user',)
     search_fields = ('user__username', 'user__email')
     list_filter = ('created_date',)
 
 @admin.register(Review)
-class ReviewAdmin(admin.ModelAdmin):
+class ReviewAdmin(LargeTableAdmin):
     list_display = ('user', 'post', 'rating', 'created_date')
-    list_filter = ('rating', 'created_date')
-    search_fields = ('user__username', 'post__title', 'comment')
+    list_filter = (RatingFilter, 'created_date')
+    list_select_related = ('user', 'post')
+    search_fields = ('user',)
+    search_help_text = 'Principio del nombre de usuario o palabras de la reseña o del título del post'
+    fulltext_search_fields = {'pk': fulltext.REVIEWS, 'post': fulltext.POST_TITLES}
 
 @admin.register(Reaction)
-class ReactionAdmin(admin.ModelAdmin):
+class ReactionAdmin(LargeTableAdmin):
     list_display = ('user', 'post', 'reaction_type', 'created_date')
     list_filter = ('reaction_type', 'created_date')
-    search_fields = ('user__username', 'post__title')
+    list_select_related = ('user', 'post')
+    search_fields = ('user',)
+    search_help_text = 'Principio del nombre de usuario o palabras del título del post'
+    fulltext_search_fields = {'post': fulltext.POST_TITLES}
 
 @admin.register(CommentVote)
-class CommentVoteAdmin(admin.ModelAdmin):
+class CommentVoteAdmin(LargeTableAdmin):
     list_display = ('user', 'comment', 'vote', 'created_date')
     list_filter = ('vote', 'created_date')
-    search_fields = ('user__username', 'comment__content')
+    # El __str__ del comentario usa su autor y el título del post
+    list_select_related = ('user', 'comment__author', 'comment__post')
+    search_fields = ('user',)
+    search_help_text = 'Principio del nombre de usuario o palabras del comentario'
+    fulltext_search_fields = {'comment': fulltext.COMMENTS}
 
 @admin.register(Notification)
-class NotificationAdmin(admin.ModelAdmin):
+class NotificationAdmin(LargeTableAdmin):
     list_display = ('user', 'notification_type', 'title', 'is_read', 'created_date')
     list_filter = ('notification_type', 'is_read', 'created_date')
-    search_fields = ('user__username', 'title', 'message')
+    list_select_related = ('user',)
+    search_fields = ('user',)
+    search_help_text = 'Principio del nombre de usuario o palabras del título o del mensaje'
+    fulltext_search_fields = {'pk': fulltext.NOTIFICATIONS}
     actions = ['mark_as_read']
 
     def mark_as_read(self, request, queryset):
-        queryset.update(is_read=True)
-        self.message_user(request, f'{queryset.count()} notificaciones marcadas como leídas.')
+        updated = queryset.update(is_read=True)
+        self.message_user(request, f'{updated} notificaciones marcadas como leídas.')
     mark_as_read.short_description = 'Marcar como leídas'
 
 @admin.register(Subscription)
 class SubscriptionAdmin(admin.ModelAdmin):
     list_display = ('user', 'subscription_type', 'author', 'tag', 'created_date')
     list_filter = ('subscription_type', 'created_date')
-    search_fields = ('user__username', 'author__username', 'tag')
\ No newline at end of file
+    list_select_related = ('user', 'author')
+    search_fields = ('user__username', 'author__username', 'tag')
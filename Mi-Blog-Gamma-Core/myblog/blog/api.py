@@ -0,0 +1,331 @@
+"""
+API JSON de sólo lectura bajo /api/: posts, comentarios de un post,
+etiquetas y autores.
+
+* ?fields=title,url,... elige los campos. Cada campo sabe de qué columnas
+  sale y sólo esas se piden, con .values(): las filas llegan como
+  diccionarios y nunca se instancian modelos (ni se cargan content o
+  rendered_html si no se piden). Sin ?fields= van los campos por defecto.
+* Paginación por cursor: cada listado ordena por una clave única
+  (-published_date, -id en los posts) y ?after= es la posición de la
+  última fila de la página anterior, así que no hay OFFSET y la página mil
+  cuesta lo mismo que la primera. `next` trae la URL de la siguiente.
+* ETag fuerte: huella de la versión de cada fila de la página (updated_date
+  en los posts, los contadores en comentarios y etiquetas), de los valores
+  que esa versión no cubre (columnas de otras tablas, etiquetas de cada
+  post, lo que rendering.rebuild vuelve a generar) y de la petición
+  (campos, cursor, filtros). Si coincide con If-None-Match se responde 304
+  sin codificar ni enviar el JSON.
+* gzip cuando el cliente lo acepta. Se comprime aquí y no con
+  GZipMiddleware porque éste convierte los ETag fuertes en débiles; la
+  versión comprimida lleva su propio ETag (sufijo -gzip).
+"""
+import hashlib
+import json
+import re
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Q
+from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import urlencode
+from django.utils.text import compress_string
+from taggit.models import TaggedItem
+
+from .models import Comment, Post, TagStats
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+SLUG_PLACEHOLDER = 'slug-placeholder'
+ACCEPTS_GZIP_RE = re.compile(r'\bgzip\b')
+
+
+def get_page_size():
+    return getattr(settings, 'BLOG_API_PAGE_SIZE', 20)
+
+
+def get_max_page_size():
+    return getattr(settings, 'BLOG_API_MAX_PAGE_SIZE', 100)
+
+
+class Field:
+    """
+    Un campo de la API: las columnas de las que sale, cómo se calcula a
+    partir de ellas y si lo cubre la versión de la fila (si no, su valor
+    entra en el ETag)
+    """
+
+    def __init__(self, *columns, transform=None, versioned=True, annotations=None):
+        self.columns = columns
+        self.transform = transform
+        self.versioned = versioned
+        self.annotations = annotations or {}
+
+    def bind(self, rows):
+        """Función fila -> valor para las filas de una página"""
+        if self.transform is None:
+            column, = self.columns
+            return lambda row: row[column]
+        return lambda row: self.transform(*(row[column] for column in self.columns))
+
+
+class UrlField(Field):
+    """URL de una vista con un slug: reverse() una vez por página, no por fila"""
+
+    def __init__(self, url_name, column, **kwargs):
+        super().__init__(column, **kwargs)
+        self.url_name = url_name
+
+    def bind(self, rows):
+        template = reverse(self.url_name, args=[SLUG_PLACEHOLDER])
+        column, = self.columns
+        return lambda row: template.replace(SLUG_PLACEHOLDER, row[column])
+
+
+class TagsField(Field):
+    """Nombres de las etiquetas de cada post, en una consulta para toda la página"""
+
+    def __init__(self):
+        super().__init__('id', versioned=False)
+
+    def bind(self, rows):
+        tagged = TaggedItem.objects.filter(
+            content_type=ContentType.objects.get_for_model(Post), object_id__in=[row['id'] for row in rows],
+        ).order_by('tag__name').values_list('object_id', 'tag__name')
+        tags = {}
+        for post_id, name in tagged:
+            tags.setdefault(post_id, []).append(name)
+        return lambda row: tags.get(row['id'], [])
+
+
+def encode_position(value):
+    if isinstance(value, datetime):
+        return str((value - EPOCH) // timedelta(microseconds=1))
+    return str(value)
+
+
+def parse_datetime(value):
+    return EPOCH + timedelta(microseconds=int(value))
+
+
+class Resource:
+    """
+    Un recurso de la API: sus filas, sus campos, el orden de los listados
+    ((columna, tipo) con '-' si es descendente; la última debe ser única) y
+    las columnas que forman la versión de cada fila
+    """
+
+    def __init__(self, name, queryset, fields, defaults, order=(), version=()):
+        self.name = name
+        self.queryset = queryset
+        self.fields = fields
+        self.defaults = defaults
+        self.order = order
+        self.version = version
+
+    def select(self, value, defaults=None):
+        """Nombres de campo de ?fields=; ValueError si alguno no existe"""
+        names = list(dict.fromkeys(name.strip() for name in (value or '').split(',') if name.strip()))
+        if not names:
+            return list(defaults or self.defaults)
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ValueError(f'Campos desconocidos: {", ".join(unknown)}. Disponibles: {", ".join(self.fields)}')
+        return names
+
+    def rows(self, names, **filters):
+        """.values() con sólo las columnas de `names`, la versión y el orden"""
+        fields = [self.fields[name] for name in names]
+        columns = [column for field in fields for column in field.columns]
+        columns += [*self.version, *(column.lstrip('-') for column, _ in self.order)]
+        annotations = {key: value for field in fields for key, value in field.annotations.items()}
+        return self.queryset().filter(**filters).annotate(**annotations) \
+            .order_by(*(column for column, _ in self.order)).values(*dict.fromkeys(columns))
+
+    def parse_cursor(self, value):
+        """Q de las filas posteriores a la posición `value`; ValueError si no es válida"""
+        parts = value.split(':', len(self.order) - 1)
+        if len(parts) != len(self.order):
+            raise ValueError('Cursor no válido')
+        try:
+            position = [(column, parse(part)) for (column, parse), part in zip(self.order, parts)]
+        except OverflowError:
+            raise ValueError('Cursor no válido')
+        conditions = []
+        for i, (column, value) in enumerate(position):
+            name = column.lstrip('-')
+            lookup = 'lt' if column.startswith('-') else 'gt'
+            previous = {column.lstrip('-'): value for column, value in position[:i]}
+            conditions.append(Q(**previous, **{f'{name}__{lookup}': value}))
+        return reduce(or_, conditions)
+
+    def cursor(self, row):
+        return ':'.join(encode_position(row[column.lstrip('-')]) for column, _ in self.order)
+
+    def serialize(self, rows, names):
+        """(datos de cada fila, lo que entra en el ETag de cada fila)"""
+        getters = {name: self.fields[name].bind(rows) for name in names}
+        unversioned = [name for name in names if not self.fields[name].versioned]
+        data, versions = [], []
+        for row in rows:
+            item = {name: getter(row) for name, getter in getters.items()}
+            data.append(item)
+            versions.append([[row[column] for column in self.version], [item[name] for name in unversioned]])
+        return data, versions
+
+
+def error(message, status):
+    return JsonResponse({'error': message}, status=status)
+
+
+def make_etag(request, resource, versions, next_url=None):
+    payload = json.dumps([resource.name, request.get_full_path(), versions, next_url], cls=DjangoJSONEncoder)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def respond(request, digest, data):
+    """JSON de `data` (en gzip si se acepta) con su ETag, o 304 si el cliente ya lo tiene"""
+    gzipped = bool(ACCEPTS_GZIP_RE.search(request.META.get('HTTP_ACCEPT_ENCODING', '')))
+    etag = f'"{digest}-gzip"' if gzipped else f'"{digest}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        content = json.dumps(data, cls=DjangoJSONEncoder).encode()
+        response = HttpResponse(compress_string(content) if gzipped else content, content_type='application/json')
+        if gzipped:
+            response['Content-Encoding'] = 'gzip'
+    response['ETag'] = etag
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def list_response(request, resource, **filters):
+    """Una página de `resource` a partir de ?after=, con ?fields= y ?limit="""
+    try:
+        names = resource.select(request.GET.get('fields'))
+        rows = resource.rows(names, **filters)
+        after = request.GET.get('after')
+        if after:
+            rows = rows.filter(resource.parse_cursor(after))
+    except ValueError as e:
+        return error(str(e), 400)
+    try:
+        limit = min(max(int(request.GET.get('limit', get_page_size())), 1), get_max_page_size())
+    except ValueError:
+        limit = get_page_size()
+
+    rows = list(rows[:limit + 1])
+    next_url = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        query = request.GET.copy()
+        query['after'] = resource.cursor(rows[-1])
+        next_url = f'{request.path}?{query.urlencode()}'
+    data, versions = resource.serialize(rows, names)
+    return respond(request, make_etag(request, resource, versions, next_url), {'results': data, 'next': next_url})
+
+
+def detail_response(request, resource, defaults=None, **filters):
+    """Una fila de `resource`, con ?fields="""
+    try:
+        names = resource.select(request.GET.get('fields'), defaults)
+    except ValueError as e:
+        return error(str(e), 400)
+    rows = list(resource.rows(names, **filters)[:1])
+    if not rows:
+        return error('No encontrado', 404)
+    data, versions = resource.serialize(rows, names)
+    return respond(request, make_etag(request, resource, versions), data[0])
+
+
+def full_name(first_name, last_name):
+    return f'{first_name} {last_name}'.strip()
+
+
+def author_posts_url(username):
+    return reverse('blog:api_posts') + '?' + urlencode({'author': username})
+
+
+POSTS = Resource(
+    'posts',
+    lambda: Post.objects.filter(published=True, published_date__isnull=False),
+    {
+        'id': Field('id'),
+        'title': Field('title'),
+        'slug': Field('slug'),
+        'url': UrlField('blog:post_detail', 'slug'),
+        'author': Field('author__username', versioned=False),
+        'excerpt': Field('excerpt'),
+        # rendering.rebuild los reescribe sin pasar por save(): updated_date no cambia
+        'summary': Field('summary', versioned=False),
+        'published_date': Field('published_date'),
+        'updated_date': Field('updated_date'),
+        'reading_time': Field('reading_time', versioned=False),
+        'tags': TagsField(),
+        'content': Field('rendered_html', versioned=False),
+        'toc': Field('toc', versioned=False),
+    },
+    defaults=('id', 'title', 'url', 'author', 'summary', 'published_date', 'updated_date', 'reading_time', 'tags'),
+    order=(('-published_date', parse_datetime), ('-id', int)),
+    # updated_date cambia con cada save() que toca el post (ver Post.save)
+    version=('id', 'updated_date'),
+)
+POST_DETAIL_FIELDS = (*POSTS.defaults, 'content', 'toc')
+
+COMMENTS = Resource(
+    'comments',
+    lambda: Comment.objects.filter(is_approved=True),
+    {
+        'id': Field('id'),
+        'author': Field('author__username', 'name', transform=lambda username, name: username or name,
+                        versioned=False),
+        'content': Field('content', versioned=False),
+        'created_date': Field('created_date'),
+        'parent': Field('parent_id'),
+        'depth': Field('depth'),
+        'replies': Field('reply_count'),
+        'upvotes': Field('upvotes'),
+        'downvotes': Field('downvotes'),
+        'pinned': Field('pinned'),
+    },
+    defaults=('id', 'author', 'content', 'created_date', 'parent', 'depth', 'replies', 'upvotes', 'downvotes'),
+    order=(('created_date', parse_datetime), ('id', int)),
+    version=('id', 'reply_count', 'upvotes', 'downvotes', 'pinned'),
+)
+
+TAGS = Resource(
+    'tags',
+    lambda: TagStats.objects.filter(post_count__gt=0),
+    {
+        'name': Field('tag__name', versioned=False),
+        'slug': Field('tag__slug', versioned=False),
+        'url': UrlField('blog:posts_by_tag', 'tag__slug', versioned=False),
+        'posts': Field('post_count'),
+        'last_published': Field('last_published'),
+    },
+    defaults=('name', 'slug', 'url', 'posts', 'last_published'),
+    order=(('tag__slug', str),),
+    version=('tag_id', 'post_count', 'last_published'),
+)
+
+AUTHORS = Resource(
+    'authors',
+    lambda: User.objects.filter(is_active=True),
+    {
+        'username': Field('username', versioned=False),
+        'name': Field('first_name', 'last_name', transform=full_name, versioned=False),
+        'bio': Field('profile__bio', versioned=False),
+        'joined': Field('date_joined'),
+        'posts': Field('post_count', versioned=False, annotations={
+            'post_count': Count('post', filter=Q(post__published=True)),
+        }),
+        'posts_url': Field('username', transform=author_posts_url, versioned=False),
+    },
+    defaults=('username', 'name', 'bio', 'joined', 'posts', 'posts_url'),
+    version=('id',),
+)
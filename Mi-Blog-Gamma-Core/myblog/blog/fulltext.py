@@ -0,0 +1,142 @@
+"""
+Índices de texto completo (FTS5 de SQLite) para buscar en las tablas
+grandes desde el admin: comentarios, reseñas, notificaciones y posts
+(título y contenido; las reseñas y reacciones buscan sólo en el título).
+
+Cada índice es una tabla FTS5 de contenido externo `<tabla>_fts`: sólo
+guarda el índice invertido y lee el texto de la tabla original por rowid
+(= id). Tres triggers la mantienen al día con cualquier escritura, también
+las de bulk_create, update() o SQL a mano.
+
+Las tablas FTS las crean las migraciones (0013, 0017 y 0018). Cuando una
+migración rehace una tabla indexada (SQLite copia la tabla para casi
+cualquier AlterField/AddField) los triggers se pierden con la tabla vieja;
+`install()` se llama tras cada migrate, vuelve a crear los que falten y en
+ese caso reconstruye el índice, por si hubo escrituras sin ellos. Un
+índice cuya migración aún no se ha aplicado (p. ej. tras migrar hacia
+atrás) no se toca: crearlo aquí haría fallar esa migración después.
+
+Con otros motores no hay índice y `matching` cae a icontains.
+"""
+import operator
+import re
+from functools import reduce
+
+from django.apps import apps
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def is_available(conn=None):
+    return (conn or connection).vendor == 'sqlite'
+
+
+def match_expression(term, columns=None):
+    """
+    Consulta FTS5 para lo que escribe el usuario: cada palabra entre comillas
+    (así no se interpreta la sintaxis de FTS5) y como prefijo, todas a la vez
+    y, si se dan `columns`, sólo en esas columnas
+    """
+    prefix = f"{{{' '.join(columns)}}} : " if columns else ''
+    return ' '.join(f'{prefix}"{token}"*' for token in TOKEN_RE.findall(term))
+
+
+class FullTextIndex:
+    """
+    Índice FTS5 de las columnas `columns` de la tabla del modelo
+    `model_label`; `search_columns` limita la búsqueda a parte de ellas
+    """
+
+    def __init__(self, model_label, source, columns, search_columns=None):
+        self.model_label = model_label
+        self.source = source
+        self.columns = columns
+        self.search_columns = search_columns or columns
+        self.table = f'{source}_fts'
+
+    @property
+    def triggers(self):
+        columns = ', '.join(self.columns)
+        new = ', '.join(f'new.{column}' for column in self.columns)
+        old = ', '.join(f'old.{column}' for column in self.columns)
+        insert = f'INSERT INTO {self.table}(rowid, {columns}) VALUES (new.id, {new});'
+        delete = f"INSERT INTO {self.table}({self.table}, rowid, {columns}) VALUES ('delete', old.id, {old});"
+        return {
+            f'{self.table}_insert': f"""
+                CREATE TRIGGER {self.table}_insert AFTER INSERT ON {self.source} BEGIN
+                    {insert}
+                END
+            """,
+            f'{self.table}_delete': f"""
+                CREATE TRIGGER {self.table}_delete AFTER DELETE ON {self.source} BEGIN
+                    {delete}
+                END
+            """,
+            f'{self.table}_update': f"""
+                CREATE TRIGGER {self.table}_update AFTER UPDATE OF {columns} ON {self.source} BEGIN
+                    {delete}
+                    {insert}
+                END
+            """,
+        }
+
+    def install(self, conn=None):
+        """Crea los triggers que falten; devuelve True si reconstruyó el índice"""
+        conn = conn or connection
+        if not is_available(conn):
+            return False
+        with conn.cursor() as cursor:
+            cursor.execute(
+                'SELECT name FROM sqlite_master WHERE name IN (%s, %s) OR tbl_name = %s',
+                [self.table, self.source, self.source],
+            )
+            existing = {row[0] for row in cursor.fetchall()}
+            if self.source not in existing or self.table not in existing:
+                return False
+            triggers = self.triggers
+            missing = [name for name in triggers if name not in existing]
+            if not missing:
+                return False
+            for name in missing:
+                cursor.execute(triggers[name])
+            cursor.execute(f"INSERT INTO {self.table}({self.table}) VALUES ('rebuild')")
+        return True
+
+    def matching(self, term):
+        """
+        Condición `pk__in` con las filas que contienen las palabras de `term`
+        en alguna de las columnas: una subconsulta al índice, o icontains si
+        no está disponible
+        """
+        model = apps.get_model(self.model_label)
+        restricted = self.search_columns != self.columns
+        expression = match_expression(term, self.search_columns if restricted else None)
+        if not expression:
+            return model.objects.none().values('pk')
+        if not is_available():
+            conditions = [Q(**{f'{column}__icontains': term}) for column in self.search_columns]
+            return model.objects.filter(reduce(operator.or_, conditions)).values('pk')
+        return RawSQL(f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s', [expression])
+
+
+COMMENTS = FullTextIndex('blog.Comment', 'blog_comment', ['content'])
+REVIEWS = FullTextIndex('blog.Review', 'blog_review', ['comment'])
+NOTIFICATIONS = FullTextIndex('blog.Notification', 'blog_notification', ['title', 'message'])
+POSTS = FullTextIndex('blog.Post', 'blog_post', ['title', 'content'])
+# La misma tabla que POSTS, buscando sólo en el título
+POST_TITLES = FullTextIndex('blog.Post', 'blog_post', ['title', 'content'], search_columns=['title'])
+
+INDEXES = (COMMENTS, REVIEWS, NOTIFICATIONS, POSTS)
+
+
+def install(conn=None):
+    """Repara los triggers de todos los índices; devuelve True si reconstruyó alguno"""
+    rebuilt = [index.install(conn) for index in INDEXES]
+    return any(rebuilt)
+
+
+def matching_comments(term):
+    return COMMENTS.matching(term)
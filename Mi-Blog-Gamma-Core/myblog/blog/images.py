@@ -0,0 +1,195 @@
+"""
+Optimización de las imágenes que se suben desde CKEditor (ckeditor/upload/).
+
+La subida no espera a nada: UploadBackend guarda el fichero tal cual, igual
+que el backend de Pillow, y lo apunta en la cola UploadedImage. El comando
+optimize_images (cron, o --interval como proceso aparte) la vacía fuera de
+las peticiones:
+
+* gira la imagen según su EXIF, la reduce a BLOG_IMAGE_MAX_WIDTH de ancho y
+  la vuelve a codificar sin metadatos (EXIF, GPS, perfiles, textos PNG), en
+  la misma ruta, así que las URLs ya pegadas en los posts siguen valiendo;
+* guarda una variante por cada ancho de BLOG_IMAGE_WIDTHS menor que ella,
+  bajo BLOG_IMAGE_VARIANTS_PATH (fuera de la carpeta que lista el
+  navegador de ficheros de CKEditor);
+* vuelve a renderizar los posts que la usan.
+
+Al renderizar un post (blog/rendering.py) las <img> de imágenes ya
+procesadas reciben srcset y sizes con esas variantes, y su tamaño sale de
+UploadedImage sin abrir el fichero. Los GIF animados y los formatos que no
+sabemos volver a codificar se marcan como procesados sin tocarlos.
+"""
+import logging
+import os
+from functools import reduce
+from io import BytesIO
+from operator import or_
+from urllib.parse import unquote
+
+from ckeditor_uploader.backends import PillowBackend
+from ckeditor_uploader.utils import storage
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db.models import Q
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from . import rendering
+from .models import Post, UploadedImage
+
+logger = logging.getLogger(__name__)
+
+# Formato -> opciones de Pillow al volver a codificar
+SAVE_OPTIONS = {
+    'JPEG': {'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+    'WEBP': {'method': 6},
+}
+LOSSY_FORMATS = {'JPEG', 'WEBP'}
+# Lo único de image.info que se conserva: sin él los PNG de paleta o RGB
+# pierden su color transparente
+KEEP_INFO = ('transparency',)
+
+
+def get_max_width():
+    return getattr(settings, 'BLOG_IMAGE_MAX_WIDTH', 1600)
+
+
+def get_widths():
+    return sorted(getattr(settings, 'BLOG_IMAGE_WIDTHS', (480, 960)))
+
+
+def get_quality():
+    return getattr(settings, 'BLOG_IMAGE_QUALITY', 82)
+
+
+def get_variants_path():
+    return getattr(settings, 'BLOG_IMAGE_VARIANTS_PATH', 'responsive/')
+
+
+class UploadBackend(PillowBackend):
+    """Backend de CKEDITOR_IMAGE_BACKEND: el de Pillow, más la cola de optimización"""
+
+    def save_as(self, filepath):
+        saved_path = super().save_as(filepath)
+        if self.is_image:
+            UploadedImage.objects.get_or_create(path=saved_path)
+        return saved_path
+
+
+def variant_path(path, width):
+    """uploads/2024/foto.jpg -> responsive/uploads/2024/foto-480w.jpg"""
+    root, ext = os.path.splitext(path)
+    return f'{get_variants_path()}{root}-{width}w{ext}'
+
+
+def resize(image, width):
+    if image.width <= width:
+        return image
+    return image.resize((width, max(1, round(image.height * width / image.width))), Image.Resampling.LANCZOS)
+
+
+def encode(image, image_format):
+    """Fichero con `image` codificada de nuevo, sin sus metadatos (EXIF, perfil ICC, textos)"""
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    # PNG copia por su cuenta parte de image.info (perfil ICC, textos...)
+    image.info = {key: image.info[key] for key in KEEP_INFO if key in image.info}
+    options = dict(SAVE_OPTIONS[image_format])
+    if image_format in LOSSY_FORMATS:
+        options['quality'] = get_quality()
+    buffer = BytesIO()
+    image.save(buffer, format=image_format, **options)
+    return ContentFile(buffer.getvalue())
+
+
+def replace(path, content):
+    """Guarda `content` en `path`, sustituyendo lo que hubiera"""
+    if storage.exists(path):
+        storage.delete(path)
+    return storage.save(path, content)
+
+
+def optimize(upload):
+    """Procesa una UploadedImage (sin guardarla)"""
+    with storage.open(upload.path) as f:
+        image = Image.open(f)
+        image.load()
+    image_format = image.format
+    upload.variants = []
+    if getattr(image, 'is_animated', False) or image_format not in SAVE_OPTIONS:
+        upload.width, upload.height = image.size
+        return upload
+
+    image = resize(ImageOps.exif_transpose(image), get_max_width())
+    replace(upload.path, encode(image, image_format))
+    for width in get_widths():
+        if width < image.width:
+            path = replace(variant_path(upload.path, width), encode(resize(image, width), image_format))
+            upload.variants.append([path, width])
+    upload.width, upload.height = image.size
+    return upload
+
+
+def process_pending(limit=100):
+    """Optimiza hasta `limit` imágenes de la cola y vuelve a renderizar sus posts; devuelve cuántas"""
+    pending = list(UploadedImage.objects.filter(processed_at__isnull=True).order_by('id')[:limit])
+    for upload in pending:
+        try:
+            optimize(upload)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            # Se queda sin tamaño ni variantes: se sirve tal cual se subió
+            logger.warning('No se pudo optimizar %s', upload.path, exc_info=True)
+        upload.processed_at = timezone.now()
+        upload.save(update_fields=['width', 'height', 'variants', 'processed_at'])
+    rerender_posts([upload.path for upload in pending])
+    return len(pending)
+
+
+def rerender_posts(paths):
+    """Vuelve a renderizar los posts cuyo contenido enlaza alguna de las imágenes"""
+    if not paths:
+        return 0
+    query = reduce(or_, (Q(content__contains=storage.url(path)) for path in paths))
+    return rendering.rebuild(Post.objects.filter(query), image_lookup=responsive_images)
+
+
+def discover():
+    """Encola las imágenes de CKEDITOR_UPLOAD_PATH subidas antes de existir la cola; devuelve cuántas"""
+    known = set(UploadedImage.objects.values_list('path', flat=True))
+    found = []
+    directories = [settings.CKEDITOR_UPLOAD_PATH.rstrip('/')]
+    while directories:
+        directory = directories.pop()
+        if not storage.exists(directory):
+            continue
+        subdirectories, files = storage.listdir(directory)
+        directories.extend(f'{directory}/{name}' for name in subdirectories)
+        for name in files:
+            path = f'{directory}/{name}'
+            if path not in known and '_thumb' not in name and os.path.splitext(name)[1].lower() in (
+                '.jpg', '.jpeg', '.png', '.webp', '.gif'
+            ):
+                found.append(UploadedImage(path=path))
+    UploadedImage.objects.bulk_create(found, ignore_conflicts=True)
+    return len(found)
+
+
+def responsive_images(content):
+    """
+    {ruta en MEDIA: {'width', 'height', 'srcset': [(url, ancho)]}} de las
+    imágenes ya optimizadas que enlaza `content` (ver rendering.render)
+    """
+    media_url = settings.MEDIA_URL
+    paths = {
+        unquote(src[len(media_url):].split('?')[0])
+        for src in rendering.image_sources(content) if media_url and src.startswith(media_url)
+    }
+    if not paths:
+        return {}
+    images = {}
+    for upload in UploadedImage.objects.filter(path__in=paths, width__isnull=False):
+        srcset = [(storage.url(path), width) for path, width in upload.variants]
+        srcset.append((storage.url(upload.path), upload.width))
+        images[upload.path] = {'width': upload.width, 'height': upload.height, 'srcset': srcset}
+    return images
@@ -0,0 +1,564 @@
+"""
+Motor del comando `loadtest`: genera una secuencia de peticiones a partir de
+una mezcla de tráfico, la lanza contra la aplicación WSGI/ASGI en el mismo
+proceso o contra una URL, y resume latencias, rendimiento y errores.
+"""
+import asyncio
+import http.client
+import itertools
+import logging
+import math
+import sys
+import threading
+import time
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.cookies import SimpleCookie
+from importlib import import_module
+from io import BytesIO
+from urllib.parse import urlencode, urlsplit
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.signals import got_request_exception
+from django.db import connections
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from .models import Comment, Post, Reaction
+
+# Mezcla por defecto: nombre del escenario -> peso relativo
+DEFAULT_MIX = {
+    'post_list': 30,
+    'post_detail': 30,
+    'search': 10,
+    'add_reaction': 8,
+    'vote_comment': 8,
+    'notification_count': 10,
+    'rss_feed': 4,
+}
+
+LOCKED_ERROR = 'database is locked'
+
+Request = namedtuple('Request', 'scenario method path body login')
+Sample = namedtuple('Sample', 'scenario status latency error queries')
+
+# Excepciones de la petición en curso (las anota got_request_exception)
+_exceptions = ContextVar('blog_loadtest_exceptions', default=None)
+
+
+class TrafficData:
+    """Slugs, comentarios, palabras y usuarios reales sobre los que generar tráfico"""
+
+    def __init__(self, users=20, limit=500):
+        self.slugs = list(
+            Post.objects.filter(published=True).order_by('-published_date').values_list('slug', flat=True)[:limit]
+        )
+        self.comment_ids = list(
+            Comment.objects.filter(is_approved=True, post__published=True)
+            .order_by('-id').values_list('id', flat=True)[:limit]
+        )
+        self.words = sorted({
+            word.lower() for title in Post.objects.filter(published=True).values_list('title', flat=True)[:limit]
+            for word in title.split() if len(word) > 3
+        })
+        self.users = list(User.objects.filter(is_active=True).order_by('id')[:users])
+
+
+def parse_mix(value):
+    """'post_list=30,search=5' -> {'post_list': 30, 'search': 5}"""
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f'Escenario desconocido: {name}')
+        mix[name] = float(weight) if weight else 1.0
+    return mix
+
+
+def _post_list(data, rng):
+    return Request('post_list', 'GET', reverse('blog:post_list'), None, False)
+
+
+def _post_detail(data, rng):
+    if not data.slugs:
+        return None
+    return Request('post_detail', 'GET', reverse('blog:post_detail', args=[rng.choice(data.slugs)]), None, False)
+
+
+def _search(data, rng):
+    if not data.words:
+        return None
+    query = urlencode({'q': rng.choice(data.words)})
+    return Request('search', 'GET', f"{reverse('blog:post_list')}?{query}", None, False)
+
+
+def _add_reaction(data, rng):
+    if not data.slugs or not data.users:
+        return None
+    body = urlencode({'reaction_type': rng.choice(Reaction.REACTION_TYPES)[0]})
+    return Request('add_reaction', 'POST', reverse('blog:add_reaction', args=[rng.choice(data.slugs)]), body, True)
+
+
+def _vote_comment(data, rng):
+    if not data.comment_ids or not data.users:
+        return None
+    body = urlencode({'vote': rng.choice((1, 1, 1, -1))})
+    return Request('vote_comment', 'POST', reverse('blog:vote_comment', args=[rng.choice(data.comment_ids)]), body, True)
+
+
+def _notification_count(data, rng):
+    if not data.users:
+        return None
+    return Request('notification_count', 'GET', reverse('blog:notification_count'), None, True)
+
+
+def _rss_feed(data, rng):
+    return Request('rss_feed', 'GET', reverse('blog:rss_feed'), None, False)
+
+
+SCENARIOS = {
+    'post_list': _post_list,
+    'post_detail': _post_detail,
+    'search': _search,
+    'add_reaction': _add_reaction,
+    'vote_comment': _vote_comment,
+    'notification_count': _notification_count,
+    'rss_feed': _rss_feed,
+}
+
+
+def build_script(mix, data, count, rng):
+    """
+    Secuencia fija de `count` peticiones: con la misma semilla y los mismos
+    datos se repite exactamente, así que dos ejecuciones son comparables.
+    Los escenarios que no tienen datos (p. ej. sin usuarios) se descartan.
+    """
+    available = {name: weight for name, weight in mix.items() if weight > 0 and SCENARIOS[name](data, rng)}
+    if not available:
+        return []
+    names = list(available)
+    weights = [available[name] for name in names]
+    return [SCENARIOS[name](data, rng) for name in rng.choices(names, weights=weights, k=count)]
+
+
+# ---------------------------
+# Sesiones de los usuarios virtuales
+# ---------------------------
+def create_sessions(users):
+    """Sesión autenticada y token CSRF para cada usuario (como Client.force_login)"""
+    engine = import_module(settings.SESSION_ENGINE)
+    backend = settings.AUTHENTICATION_BACKENDS[0]
+    jars = []
+    for user in users:
+        session = engine.SessionStore()
+        session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+        session[BACKEND_SESSION_KEY] = backend
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        jars.append(CookieJar({
+            settings.SESSION_COOKIE_NAME: session.session_key,
+            settings.CSRF_COOKIE_NAME: get_random_string(32),
+        }))
+    return jars
+
+
+def delete_sessions(jars):
+    engine = import_module(settings.SESSION_ENGINE)
+    for jar in jars:
+        engine.SessionStore(jar.cookies[settings.SESSION_COOKIE_NAME]).delete()
+
+
+class CookieJar:
+    """Cookies de un usuario virtual; guarda las que le devuelve el servidor"""
+
+    def __init__(self, cookies):
+        self.cookies = dict(cookies)
+
+    def headers(self):
+        return {
+            'Cookie': '; '.join(f'{name}={value}' for name, value in self.cookies.items()),
+            'X-CSRFToken': self.cookies[settings.CSRF_COOKIE_NAME],
+        }
+
+    def update(self, set_cookie_headers):
+        for header in set_cookie_headers:
+            for name, morsel in SimpleCookie(header).items():
+                if morsel['max-age'] == '0' or not morsel.value:
+                    self.cookies.pop(name, None)
+                else:
+                    self.cookies[name] = morsel.value
+
+
+# ---------------------------
+# Transportes
+# ---------------------------
+def _local_host():
+    """Host aceptado por ALLOWED_HOSTS para las peticiones dentro del proceso"""
+    for host in settings.ALLOWED_HOSTS:
+        if host and host != '*' and not host.startswith('.'):
+            return host
+    return 'localhost'
+
+
+def _request_headers(request, jar):
+    headers = {'Host': _local_host()}
+    if request.body is not None:
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+    if request.login and jar is not None:
+        headers.update(jar.headers())
+    return headers
+
+
+def _classify(status, body, exceptions):
+    """Etiqueta de error de una respuesta o None si fue bien"""
+    for exc in exceptions:
+        if LOCKED_ERROR in str(exc):
+            return LOCKED_ERROR
+    if exceptions:
+        return type(exceptions[0]).__name__
+    if status >= 500 and LOCKED_ERROR.encode() in body:
+        return LOCKED_ERROR
+    if status >= 400:
+        return f'HTTP {status}'
+    return None
+
+
+def _record_exception(sender, request=None, **kwargs):
+    holder = _exceptions.get()
+    if holder is not None:
+        holder.append(sys.exc_info()[1])
+
+
+@contextmanager
+def capture_exceptions():
+    """Recoge las excepciones de las vistas y silencia su traza en django.request"""
+    logger = logging.getLogger('django.request')
+    level = logger.level
+    logger.setLevel(logging.CRITICAL)
+    got_request_exception.connect(_record_exception, dispatch_uid='blog_loadtest')
+    try:
+        yield
+    finally:
+        got_request_exception.disconnect(dispatch_uid='blog_loadtest')
+        logger.setLevel(level)
+
+
+class WSGITransport:
+    """Llama a la aplicación WSGI del proyecto dentro del proceso"""
+
+    def __init__(self):
+        from django.core.wsgi import get_wsgi_application
+        self.application = get_wsgi_application()
+
+    def send(self, request, jar):
+        path, _, query = request.path.partition('?')
+        body = (request.body or '').encode()
+        environ = {
+            'REQUEST_METHOD': request.method,
+            'PATH_INFO': path,
+            'SCRIPT_NAME': '',
+            'QUERY_STRING': query,
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': '127.0.0.1',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in _request_headers(request, jar).items():
+            key = name.upper().replace('-', '_')
+            environ[key if key == 'CONTENT_TYPE' else f'HTTP_{key}'] = value
+
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = headers
+
+        exceptions = []
+        token = _exceptions.set(exceptions)
+        try:
+            response = self.application(environ, start_response)
+            try:
+                content = b''.join(response)
+            finally:
+                if hasattr(response, 'close'):
+                    response.close()
+        finally:
+            _exceptions.reset(token)
+        return started['status'], started['headers'], content, exceptions
+
+
+class ASGITransport:
+    """Llama a la aplicación ASGI del proyecto dentro del proceso"""
+
+    def __init__(self):
+        from django.core.asgi import get_asgi_application
+        self.application = get_asgi_application()
+
+    async def send(self, request, jar):
+        path, _, query = request.path.partition('?')
+        body = (request.body or '').encode()
+        headers = [(name.lower().encode(), value.encode()) for name, value in _request_headers(request, jar).items()]
+        headers.append((b'content-length', str(len(body)).encode()))
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': request.method,
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': query.encode(),
+            'root_path': '',
+            'headers': headers,
+            'client': ('127.0.0.1', 0),
+            'server': ('localhost', 80),
+        }
+        finished = asyncio.Event()
+        sent_body = False
+
+        async def receive():
+            nonlocal sent_body
+            if not sent_body:
+                sent_body = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            await finished.wait()
+            return {'type': 'http.disconnect'}
+
+        response = {'status': 0, 'headers': [], 'body': []}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+                response['headers'] = [(k.decode('latin-1'), v.decode('latin-1')) for k, v in message['headers']]
+            elif message['type'] == 'http.response.body':
+                response['body'].append(message.get('body', b''))
+                if not message.get('more_body'):
+                    finished.set()
+
+        exceptions = []
+        token = _exceptions.set(exceptions)
+        try:
+            await self.application(scope, receive, send)
+        finally:
+            finished.set()
+            _exceptions.reset(token)
+        return response['status'], response['headers'], b''.join(response['body']), exceptions
+
+
+class HTTPTransport:
+    """Envía las peticiones a un servidor ya arrancado (una conexión por hilo)"""
+
+    def __init__(self, url, timeout=30):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port
+        self.secure = parts.scheme == 'https'
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.secure else http.client.HTTPConnection
+            conn = self.local.conn = cls(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def send(self, request, jar):
+        headers = _request_headers(request, jar)
+        headers['Host'] = self.host if self.port is None else f'{self.host}:{self.port}'
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request(request.method, self.prefix + request.path, body=request.body, headers=headers)
+                response = conn.getresponse()
+                content = response.read()
+                return response.status, response.getheaders(), content, []
+            except (http.client.HTTPException, OSError):
+                # Conexión keep-alive cerrada por el servidor: se reintenta una vez
+                conn.close()
+                self.local.conn = None
+                if attempt:
+                    raise
+
+    def close(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            conn.close()
+
+
+# ---------------------------
+# Ejecución
+# ---------------------------
+def _sample(request, jar, status, headers, body, exceptions, latency):
+    if jar is not None and request.login:
+        jar.update(value for name, value in headers if name.lower() == 'set-cookie')
+    queries = next((int(value) for name, value in headers if name.lower() == 'x-query-count'), None)
+    return Sample(request.scenario, status, latency, _classify(status, body, exceptions), queries)
+
+
+class LoadTest:
+    """
+    Reparte `script` entre `concurrency` usuarios virtuales. Cada usuario
+    tiene su propia sesión (jars[i % len(jars)]) y toma la siguiente petición
+    pendiente de la secuencia hasta agotarla o hasta `duration` segundos.
+    """
+
+    def __init__(self, transport, script, jars, concurrency=4, duration=0):
+        self.transport = transport
+        self.script = script
+        self.jars = jars
+        self.concurrency = max(1, concurrency)
+        self.duration = duration
+        self.samples = []
+        self.elapsed = 0.0
+
+    def _jar(self, worker):
+        return self.jars[worker % len(self.jars)] if self.jars else None
+
+    def _expired(self, start):
+        return self.duration and time.perf_counter() - start >= self.duration
+
+    def run(self):
+        with capture_exceptions():
+            if isinstance(self.transport, ASGITransport):
+                async_to_sync(self._run_async)()
+            else:
+                self._run_threads()
+        return self.samples
+
+    def _run_threads(self):
+        next_index = itertools.count()
+        start = time.perf_counter()
+
+        def worker(number):
+            jar = self._jar(number)
+            try:
+                for index in next_index:
+                    if index >= len(self.script) or self._expired(start):
+                        break
+                    request = self.script[index]
+                    began = time.perf_counter()
+                    try:
+                        status, headers, body, exceptions = self.transport.send(request, jar)
+                    except Exception as exc:
+                        self.samples.append(Sample(
+                            request.scenario, 0, time.perf_counter() - began, type(exc).__name__, None
+                        ))
+                        continue
+                    self.samples.append(
+                        _sample(request, jar, status, headers, body, exceptions, time.perf_counter() - began)
+                    )
+            finally:
+                if isinstance(self.transport, HTTPTransport):
+                    self.transport.close()
+                elif threading.current_thread() is not threading.main_thread():
+                    connections.close_all()
+
+        if self.concurrency == 1:
+            # Sin hilos: usa la misma conexión a la base de datos que quien llama
+            worker(0)
+        else:
+            threads = [threading.Thread(target=worker, args=(i,)) for i in range(self.concurrency)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.elapsed = time.perf_counter() - start
+
+    async def _run_async(self):
+        next_index = itertools.count()
+        start = time.perf_counter()
+
+        async def worker(number):
+            jar = self._jar(number)
+            for index in next_index:
+                if index >= len(self.script) or self._expired(start):
+                    break
+                request = self.script[index]
+                began = time.perf_counter()
+                try:
+                    status, headers, body, exceptions = await self.transport.send(request, jar)
+                except Exception as exc:
+                    self.samples.append(Sample(
+                        request.scenario, 0, time.perf_counter() - began, type(exc).__name__, None
+                    ))
+                    continue
+                self.samples.append(
+                    _sample(request, jar, status, headers, body, exceptions, time.perf_counter() - began)
+                )
+
+        await asyncio.gather(*(worker(i) for i in range(self.concurrency)))
+        self.elapsed = time.perf_counter() - start
+
+
+# ---------------------------
+# Resultados
+# ---------------------------
+def percentile(sorted_values, fraction):
+    """Percentil por rango más cercano sobre valores ya ordenados"""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(fraction * len(sorted_values)) - 1
+    return sorted_values[max(0, min(rank, len(sorted_values) - 1))]
+
+
+def _stats(samples, elapsed):
+    latencies = sorted(sample.latency * 1000 for sample in samples)
+    errors = sum(1 for sample in samples if sample.error)
+    queries = [sample.queries for sample in samples if sample.queries is not None]
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'error_rate': round(errors / len(samples), 4) if samples else 0.0,
+        'throughput': round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        'mean_ms': round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'max_ms': round(latencies[-1], 3) if latencies else 0.0,
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+def summarize(samples, elapsed):
+    by_scenario = {}
+    for sample in samples:
+        by_scenario.setdefault(sample.scenario, []).append(sample)
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'total': _stats(samples, elapsed),
+        'scenarios': {name: _stats(group, elapsed) for name, group in sorted(by_scenario.items())},
+        'errors': dict(Counter(sample.error for sample in samples if sample.error).most_common()),
+    }
+
+
+def compare(current, baseline):
+    """Diferencia relativa (%) de throughput y p50/p95/p99 respecto a una ejecución anterior"""
+    def delta(new, old):
+        return round((new - old) / old * 100, 1) if old else None
+
+    rows = {}
+    for name, stats in [('total', current['total'])] + list(current['scenarios'].items()):
+        old = baseline['total'] if name == 'total' else baseline.get('scenarios', {}).get(name)
+        if not old:
+            continue
+        rows[name] = {
+            key: delta(stats[key], old[key])
+            for key in ('throughput', 'p50_ms', 'p95_ms', 'p99_ms')
+        }
+        rows[name]['error_rate'] = round(stats['error_rate'] - old['error_rate'], 4)
+    return rows
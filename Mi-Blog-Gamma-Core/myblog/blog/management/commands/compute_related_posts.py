@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog import related
+
+
+class Command(BaseCommand):
+    help = 'Calcula los posts relacionados por etiquetas (sólo los pendientes, o todos con --all)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Recalcula todos los posts publicados, no sólo los que cambiaron')
+        parser.add_argument('--top-k', type=int, default=None,
+                            help='Posts relacionados por post (default: BLOG_RELATED_POSTS)')
+        parser.add_argument('--max-postings', type=int, default=1000,
+                            help='Las etiquetas con más posts que esto no generan candidatos (default: 1000)')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        compute = related.compute_all if options['all'] else related.compute_stale
+        count = compute(k=options['top_k'], max_postings=options['max_postings'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Posts relacionados recalculados para {count} posts en {time.perf_counter() - start:.1f} s'
+        ))
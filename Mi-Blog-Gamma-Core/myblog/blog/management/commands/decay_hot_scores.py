@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from blog import trending
+
+
+class Command(BaseCommand):
+    help = 'Reescala las puntuaciones de tendencia a la hora actual (lanzar periódicamente, p. ej. cada hora)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recalcula todas las puntuaciones desde las interacciones guardadas')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            count = trending.rebuild()
+            self.stdout.write(self.style.SUCCESS(f'Puntuaciones recalculadas: {count} posts en tendencia'))
+        else:
+            factor = trending.decay()
+            self.stdout.write(self.style.SUCCESS(f'Puntuaciones reescaladas (factor {factor:.4f})'))
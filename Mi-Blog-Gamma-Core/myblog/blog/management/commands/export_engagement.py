@@ -0,0 +1,30 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import engagement
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Exporta a CSV las reseñas, comentarios y reacciones de los posts de un autor (ver blog/engagement.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Autor de los posts')
+        parser.add_argument('output', nargs='?', default='-',
+                            help='Fichero de salida; "-" para la salida estándar (default: -)')
+
+    def handle(self, *args, **options):
+        try:
+            author = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'No existe el usuario "{options["username"]}"')
+        chunks = engagement.render_csv(Post.objects.filter(author=author))
+        if options['output'] == '-':
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+        else:
+            # newline='': csv ya termina cada fila en \r\n
+            with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+                f.writelines(chunks)
+        # Por stderr: stdout puede ser el propio CSV
+        self.stderr.write(f'Interacción de {author.username} exportada', style_func=self.style.SUCCESS)
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from blog import transfer
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Exporta los posts, con etiquetas, comentarios, reseñas y rutas de sus imágenes, a JSONL (ver blog/transfer.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', nargs='?', default='-',
+                            help='Fichero de salida; "-" para la salida estándar (default: -)')
+        parser.add_argument('--published', action='store_true', help='Sólo los posts publicados')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Posts por consulta (default: 500)')
+
+    def handle(self, *args, **options):
+        posts = Post.objects.filter(published=True) if options['published'] else Post.objects.all()
+        if options['output'] == '-':
+            count = transfer.export_posts(self.stdout, posts, options['chunk_size'])
+        else:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                count = transfer.export_posts(f, posts, options['chunk_size'])
+        # Por stderr: stdout puede ser el propio JSONL
+        self.stderr.write(f'{count} posts exportados', style_func=self.style.SUCCESS)
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from blog import duplicates
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Lista los grupos de posts casi duplicados (MinHash + LSH)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recalcula las firmas de todos los posts, no sólo de los que no tienen')
+        parser.add_argument('--threshold', type=float, default=None,
+                            help='Jaccard estimado mínimo (default: BLOG_DUPLICATE_THRESHOLD)')
+
+    def handle(self, *args, **options):
+        posts = Post.objects.all() if options['rebuild'] else Post.objects.filter(minhash__isnull=True)
+        indexed = duplicates.rebuild(posts)
+        if indexed:
+            self.stdout.write(f'Firmas calculadas para {indexed} posts')
+
+        clusters = duplicates.find_clusters(options['threshold'])
+        titles = dict(Post.objects.filter(id__in=[i for c in clusters for i in c]).values_list('id', 'title'))
+        for number, cluster in enumerate(clusters, start=1):
+            self.stdout.write(f'Grupo {number} ({len(cluster)} posts):')
+            for post_id in cluster:
+                self.stdout.write(f'  [{post_id}] {titles[post_id]}')
+        self.stdout.write(self.style.SUCCESS(f'{len(clusters)} grupos de posts casi duplicados'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import transfer
+
+
+class Command(BaseCommand):
+    help = 'Importa posts desde un JSONL de export_posts; los slugs que ya existen se saltan (ver blog/transfer.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='Fichero JSONL')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Posts por transacción (default: 500)')
+        parser.add_argument('--checkpoint',
+                            help='Fichero donde se apunta el avance; si existe se sigue desde ahí')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Procesos que leen y renderizan los posts mientras éste los guarda (default: 1)')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('--workers y --chunk-size deben ser al menos 1.')
+        try:
+            imported, skipped = transfer.import_posts(
+                options['input'], options['chunk_size'], options['checkpoint'], options['workers'],
+            )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f'{imported} posts importados, {skipped} ya existían'))
@@ -0,0 +1,137 @@
+import json
+import random
+import subprocess
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from blog import loadtest
+
+
+def git_commit():
+    """Commit actual del repositorio, para saber qué versión se midió"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Prueba de carga sobre las URLs del blog con una mezcla de tráfico reproducible'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--target', default='wsgi',
+            help='wsgi o asgi (aplicación en este proceso) o una URL como http://127.0.0.1:8000 '
+                 'de un servidor que use la misma base de datos (default: wsgi)'
+        )
+        parser.add_argument('--requests', type=int, default=1000, help='Peticiones en total (default: 1000)')
+        parser.add_argument('--concurrency', type=int, default=4, help='Usuarios virtuales en paralelo (default: 4)')
+        parser.add_argument('--duration', type=float, default=0,
+                            help='Corta la prueba tras estos segundos; 0 = sin límite (default: 0)')
+        parser.add_argument(
+            '--mix',
+            help='Pesos por escenario, p. ej. "post_list=30,search=5" (default: '
+                 + ','.join(f'{name}={weight}' for name, weight in loadtest.DEFAULT_MIX.items()) + ')'
+        )
+        parser.add_argument('--users', type=int, default=20,
+                            help='Usuarios existentes con los que se hacen las peticiones autenticadas (default: 20)')
+        parser.add_argument('--seed', type=int, default=42, help='Semilla de la secuencia de peticiones (default: 42)')
+        parser.add_argument('--output', help='Guarda los resultados en este fichero JSON')
+        parser.add_argument('--compare', help='JSON de una ejecución anterior con el que comparar')
+
+    def handle(self, *args, **options):
+        target = options['target']
+        if target == 'wsgi':
+            transport = loadtest.WSGITransport()
+        elif target == 'asgi':
+            transport = loadtest.ASGITransport()
+        elif target.startswith(('http://', 'https://')):
+            transport = loadtest.HTTPTransport(target)
+        else:
+            raise CommandError('--target debe ser wsgi, asgi o una URL http(s)://')
+
+        try:
+            mix = loadtest.parse_mix(options['mix']) if options['mix'] else dict(loadtest.DEFAULT_MIX)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        baseline = None
+        if options['compare']:
+            try:
+                baseline = json.loads(Path(options['compare']).read_text())
+            except (OSError, ValueError) as e:
+                raise CommandError(f'No se pudo leer {options["compare"]}: {e}')
+
+        data = loadtest.TrafficData(users=options['users'])
+        script = loadtest.build_script(mix, data, options['requests'], random.Random(options['seed']))
+        if not script:
+            raise CommandError('No hay datos para ningún escenario; genera algunos con seed_blog.')
+        skipped = sorted(set(mix) - {request.scenario for request in script})
+        if skipped:
+            self.stdout.write(self.style.WARNING(f'Escenarios sin datos o sin peticiones: {", ".join(skipped)}'))
+
+        jars = loadtest.create_sessions(data.users)
+        self.stdout.write(
+            f'{len(script)} peticiones contra {target} con {options["concurrency"]} usuarios virtuales...'
+        )
+        try:
+            runner = loadtest.LoadTest(
+                transport, script, jars, concurrency=options['concurrency'], duration=options['duration']
+            )
+            samples = runner.run()
+        finally:
+            loadtest.delete_sessions(jars)
+
+        results = loadtest.summarize(samples, runner.elapsed)
+        results['meta'] = {
+            'started_at': timezone.now().isoformat(),
+            'commit': git_commit(),
+            'target': target,
+            'concurrency': options['concurrency'],
+            'requests': options['requests'],
+            'duration': options['duration'],
+            'seed': options['seed'],
+            'mix': mix,
+            'database': f'{connection.vendor}:{connection.settings_dict["NAME"]}',
+        }
+        self.print_results(results)
+
+        if baseline:
+            results['comparison'] = loadtest.compare(results, baseline)
+            self.print_comparison(results['comparison'], baseline)
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, indent=2, ensure_ascii=False))
+            self.stdout.write(self.style.SUCCESS(f'Resultados guardados en {options["output"]}'))
+
+    def print_results(self, results):
+        header = f'{"escenario":<20}{"peticiones":>11}{"error %":>9}{"req/s":>9}' \
+                 f'{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"max ms":>9}{"consultas":>10}'
+        self.stdout.write(header)
+        rows = list(results['scenarios'].items()) + [('TOTAL', results['total'])]
+        for name, stats in rows:
+            queries = stats['queries_per_request']
+            self.stdout.write(
+                f'{name:<20}{stats["requests"]:>11}{stats["error_rate"] * 100:>9.1f}{stats["throughput"]:>9.1f}'
+                f'{stats["p50_ms"]:>9.1f}{stats["p95_ms"]:>9.1f}{stats["p99_ms"]:>9.1f}{stats["max_ms"]:>9.1f}'
+                f'{"-" if queries is None else f"{queries:.1f}":>10}'
+            )
+        for error, count in results['errors'].items():
+            self.stdout.write(self.style.ERROR(f'  {error}: {count}'))
+
+    def print_comparison(self, comparison, baseline):
+        commit = baseline.get('meta', {}).get('commit') or '?'
+        self.stdout.write(f'Cambio respecto a la ejecución de {commit} (%):')
+        for name, deltas in comparison.items():
+            values = ', '.join(
+                f'{key} {"-" if value is None else f"{value:+.1f}"}' for key, value in deltas.items()
+                if key != 'error_rate'
+            )
+            self.stdout.write(f'  {name:<20}{values}, error_rate {deltas["error_rate"] * 100:+.2f}')
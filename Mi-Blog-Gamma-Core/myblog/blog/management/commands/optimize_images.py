@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog import images
+
+
+class Command(BaseCommand):
+    help = 'Reduce, recodifica sin metadatos y genera las variantes de las imágenes subidas con CKEditor'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Imágenes por vuelta (default: 100)')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Segundos entre vueltas; si es 0 se vacía la cola y termina (default: 0)')
+        parser.add_argument('--discover', action='store_true',
+                            help='Encola antes las imágenes de CKEDITOR_UPLOAD_PATH que no estén en la cola')
+
+    def handle(self, *args, **options):
+        if options['discover']:
+            found = images.discover()
+            self.stdout.write(f'{found} imágenes encoladas')
+
+        while True:
+            count = images.process_pending(options['batch_size'])
+            if count:
+                self.stdout.write(self.style.SUCCESS(f'{count} imágenes optimizadas'))
+            elif not options['interval']:
+                break
+            else:
+                time.sleep(options['interval'])
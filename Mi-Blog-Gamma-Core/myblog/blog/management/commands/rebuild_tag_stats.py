@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from blog.models import TagStats
+
+
+class Command(BaseCommand):
+    help = 'Recalcula TagStats para todas las etiquetas (p. ej. tras importar datos sin señales)'
+
+    def handle(self, *args, **options):
+        count = TagStats.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Estadísticas recalculadas para {count} etiquetas'))
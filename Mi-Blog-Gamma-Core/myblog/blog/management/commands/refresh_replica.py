@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.exceptions import ImproperlyConfigured
+from blog.routers import refresh_replica
+
+class Command(BaseCommand):
+    help = 'Copia la base de datos principal sobre la réplica de lectura (SQLite backup API)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help='Segundos entre copias; si es 0 se copia una sola vez (default: 0)'
+        )
+        parser.add_argument(
+            '--target',
+            help='Ruta del fichero destino (default: NAME del alias BLOG_READ_DATABASE)'
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        target = options['target']
+
+        while True:
+            start = time.perf_counter()
+            try:
+                refresh_replica(target=target)
+            except ImproperlyConfigured as e:
+                raise CommandError(str(e))
+            elapsed = (time.perf_counter() - start) * 1000
+            self.stdout.write(self.style.SUCCESS(f'Réplica actualizada en {elapsed:.1f} ms'))
+
+            if not interval:
+                break
+            time.sleep(interval)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from blog import rendering
+from blog.images import responsive_images
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Vuelve a generar el HTML publicado, el índice y el resumen de los posts (tras cambiar blog/rendering.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Posts por transacción (default: 500)')
+
+    def handle(self, *args, **options):
+        count = rendering.rebuild(Post.objects.all(), options['batch_size'], image_lookup=responsive_images)
+        self.stdout.write(self.style.SUCCESS(f'{count} posts renderizados'))
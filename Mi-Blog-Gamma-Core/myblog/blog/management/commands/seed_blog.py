@@ -0,0 +1,409 @@
+import bisect
+import itertools
+import random
+import time
+from array import array
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.text import slugify
+from taggit.models import Tag, TaggedItem
+
+from blog import trending
+from blog.utils import historic_dates
+from blog.models import Post, Comment, Profile, Review, Reaction, CommentVote, Notification, Subscription, TagStats
+
+WORDS = (
+    'django python blog código proyecto datos consulta índice servidor plantilla vista modelo '
+    'usuario rendimiento caché memoria página contenido diseño prueba error función clase '
+    'objeto lista tabla campo formulario seguridad despliegue aplicación web api red base '
+    'desarrollo equipo idea ejemplo paso tiempo versión cambio mejora sistema archivo imagen '
+    'búsqueda etiqueta comentario reacción voto autor lector noticia tutorial guía práctica'
+).split()
+
+TAG_WORDS = (
+    'django python javascript css html sql sqlite postgres rendimiento seguridad testing '
+    'devops docker linux git api rest frontend backend diseño ux datos ia algoritmos '
+    'tutorial opinión noticias carrera productividad herramientas arquitectura caché'
+).split()
+
+REACTIONS = [choice[0] for choice in Reaction.REACTION_TYPES]
+NOTIFICATION_TYPES = [choice[0] for choice in Notification.NOTIFICATION_TYPES]
+
+
+def zipf_cum_weights(n, s):
+    """Pesos acumulados de una distribución Zipf de exponente `s` sobre n rangos"""
+    total = 0.0
+    cum = []
+    for rank in range(1, n + 1):
+        total += 1.0 / rank ** s if s else 1.0
+        cum.append(total)
+    return cum
+
+
+class Popularity:
+    """Elige índices 0..n-1 según su popularidad (Zipf o uniforme)"""
+
+    def __init__(self, rng, n, s):
+        self.rng = rng
+        self.n = n
+        self.cum = zipf_cum_weights(n, s)
+        # El más popular no tiene por qué ser el primero creado
+        self.order = list(range(n))
+        rng.shuffle(self.order)
+
+    def pick(self):
+        rank = bisect.bisect_left(self.cum, self.rng.random() * self.cum[-1])
+        return self.order[min(rank, self.n - 1)]
+
+    def counts(self, total, cap=None):
+        """
+        Reparte `total` elementos entre los n índices. Con `cap` ningún índice
+        recibe más de `cap` y el sobrante cae en otro índice al azar.
+        """
+        total = min(total, self.n * cap) if cap else total
+        counts = [0] * self.n
+        for _ in range(total):
+            index = self.pick()
+            while cap and counts[index] >= cap:
+                index = self.rng.randrange(self.n)
+            counts[index] += 1
+        return counts
+
+    def pick_distinct(self, k):
+        k = min(k, self.n)
+        chosen = set()
+        while len(chosen) < k:
+            chosen.add(self.pick())
+        return chosen
+
+
+class Command(BaseCommand):
+    help = 'Genera un conjunto de datos de volumen realista (reproducible a partir de --seed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200, help='Usuarios a crear (default: 200)')
+        parser.add_argument('--authors', type=float, default=0.1,
+                            help='Fracción de usuarios que publican (default: 0.1)')
+        parser.add_argument('--posts', type=int, default=1000, help='Posts a crear (default: 1000)')
+        parser.add_argument('--tags', type=int, default=50, help='Etiquetas distintas (default: 50)')
+        parser.add_argument('--tags-per-post', type=int, default=3, help='Etiquetas por post (default: 3)')
+        parser.add_argument('--comments', type=int, default=10000, help='Comentarios en total (default: 10000)')
+        parser.add_argument('--votes', type=int, default=30000, help='Votos de comentarios en total (default: 30000)')
+        parser.add_argument('--reviews', type=int, default=5000, help='Reseñas en total (default: 5000)')
+        parser.add_argument('--reactions', type=int, default=20000, help='Reacciones en total (default: 20000)')
+        parser.add_argument('--notifications', type=int, default=5000,
+                            help='Notificaciones en total (default: 5000)')
+        parser.add_argument('--subscriptions', type=int, default=3,
+                            help='Suscripciones por usuario (default: 3)')
+        parser.add_argument('--popularity', choices=['zipf', 'uniform'], default='zipf',
+                            help='Distribución de la popularidad de posts, etiquetas y autores (default: zipf)')
+        parser.add_argument('--zipf-s', type=float, default=1.1, help='Exponente de la Zipf (default: 1.1)')
+        parser.add_argument('--days', type=int, default=365,
+                            help='Días hacia atrás en los que se reparten las fechas (default: 365)')
+        parser.add_argument('--approved', type=float, default=0.8,
+                            help='Fracción de comentarios aprobados (default: 0.8)')
+        parser.add_argument('--drafts', type=float, default=0.05, help='Fracción de borradores (default: 0.05)')
+        parser.add_argument('--seed', type=int, default=42, help='Semilla del generador (default: 42)')
+        parser.add_argument('--prefix', default='seed',
+                            help='Prefijo de usernames y slugs, para poder generar varias veces (default: seed)')
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Filas por bulk_create y transacción (default: 5000)')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['posts'] < 1 or options['tags'] < 1:
+            raise CommandError('--users, --posts y --tags deben ser al menos 1.')
+
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        self.chunk_size = options['chunk_size']
+        self.s = options['zipf_s'] if options['popularity'] == 'zipf' else 0
+        self.now = timezone.now()
+        prefix = options['prefix']
+
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(f'Ya existen usuarios con el prefijo "{prefix}_"; usa otro --prefix.')
+
+        start = time.perf_counter()
+        self.fast_sqlite()
+        with historic_dates(Post, Comment, Profile, Review, Reaction, CommentVote, Notification, Subscription):
+            self.user_ids = self.create_users(prefix)
+            self.tag_ids = self.create_tags(prefix)
+            self.post_ids, self.post_dates = self.create_posts(prefix)
+            self.create_tagged_items()
+            # bulk_create no envía señales: TagStats se recalcula aparte
+            TagStats.rebuild(self.tag_ids)
+            self.create_comments()
+            self.create_votes()
+            self.create_reviews()
+            self.create_reactions()
+            self.create_notifications()
+            self.create_subscriptions()
+        # Igual que TagStats: las puntuaciones de tendencia salen de las interacciones
+        trending.rebuild()
+
+        self.stdout.write(self.style.SUCCESS(f'Datos generados en {time.perf_counter() - start:.1f} s'))
+
+    # ---------------------------
+    # Utilidades
+    # ---------------------------
+    def fast_sqlite(self):
+        """En SQLite la carga masiva no necesita fsync por transacción"""
+        # Dentro de una transacción ya abierta (p. ej. en tests) no se puede cambiar
+        if connection.vendor == 'sqlite' and not connection.in_atomic_block:
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA synchronous = OFF')
+
+    def bulk(self, model, objects, label):
+        """bulk_create por trozos, cada uno en su propia transacción"""
+        created = 0
+        start = time.perf_counter()
+        iterator = iter(objects)
+        while True:
+            chunk = list(itertools.islice(iterator, self.chunk_size))
+            if not chunk:
+                break
+            with transaction.atomic():
+                model.objects.bulk_create(chunk, batch_size=self.chunk_size)
+            created += len(chunk)
+        elapsed = time.perf_counter() - start
+        rate = created / elapsed if elapsed else 0
+        self.stdout.write(f'  {label}: {created} filas ({rate:,.0f}/s)')
+        return created
+
+    def random_date(self, after=None):
+        """Fecha aleatoria entre `after` (o --days atrás) y ahora"""
+        earliest = after or self.now - timedelta(days=self.options['days'])
+        span = (self.now - earliest).total_seconds()
+        return earliest + timedelta(seconds=self.rng.random() * span)
+
+    def sentence(self, low=6, high=16):
+        words = [self.rng.choice(WORDS) for _ in range(self.rng.randint(low, high))]
+        return ' '.join(words).capitalize() + '.'
+
+    def paragraph(self):
+        return ' '.join(self.sentence() for _ in range(self.rng.randint(2, 6)))
+
+    def post_html(self, slug):
+        """HTML parecido al que produce CKEditor"""
+        rng = self.rng
+        blocks = [f'<p>{self.paragraph()}</p>']
+        for section in range(rng.randint(1, 5)):
+            blocks.append(f'<h2>{self.sentence(2, 6)[:-1]}</h2>')
+            blocks.append(f'<p><strong>{self.sentence()}</strong> {self.paragraph()}</p>')
+            kind = rng.random()
+            if kind < 0.3:
+                items = ''.join(f'<li>{self.sentence(3, 8)}</li>' for _ in range(rng.randint(2, 6)))
+                blocks.append(f'<ul>{items}</ul>')
+            elif kind < 0.5:
+                blocks.append(
+                    f'<p><img alt="{self.sentence(2, 4)[:-1]}" '
+                    f'src="/media/uploads/{slug}-{section}.jpg" style="width:800px" /></p>'
+                )
+            elif kind < 0.65:
+                blocks.append('<pre><code>python manage.py migrate\npython manage.py runserver</code></pre>')
+            elif kind < 0.75:
+                blocks.append(f'<blockquote><p><em>{self.sentence()}</em></p></blockquote>')
+            blocks.append(f'<p>{self.paragraph()} <a href="https://example.com/{slug}">{rng.choice(WORDS)}</a></p>')
+        return ''.join(blocks)
+
+    # ---------------------------
+    # Entidades
+    # ---------------------------
+    def create_users(self, prefix):
+        password = make_password('seed12345')
+        n = self.options['users']
+        self.bulk(User, (
+            User(
+                username=f'{prefix}_{i}', email=f'{prefix}_{i}@example.com', password=password,
+                first_name=self.rng.choice(WORDS).capitalize(), last_name=self.rng.choice(WORDS).capitalize(),
+                date_joined=self.random_date(),
+            )
+            for i in range(n)
+        ), 'usuarios')
+        user_ids = list(
+            User.objects.filter(username__startswith=f'{prefix}_').order_by('id').values_list('id', flat=True)
+        )
+        self.bulk(Profile, (
+            Profile(user_id=user_id, bio=self.sentence(), created_date=self.now) for user_id in user_ids
+        ), 'perfiles')
+        return user_ids
+
+    def create_tags(self, prefix):
+        existing = set(Tag.objects.values_list('slug', flat=True))
+        names = []
+        for i in itertools.count():
+            if len(names) == self.options['tags']:
+                break
+            base = TAG_WORDS[i % len(TAG_WORDS)]
+            name = base if i < len(TAG_WORDS) else f'{base}-{i // len(TAG_WORDS)}'
+            if slugify(name) not in existing:
+                names.append(name)
+        self.bulk(Tag, (Tag(name=name, slug=slugify(name)) for name in names), 'etiquetas')
+        by_slug = dict(Tag.objects.filter(slug__in=[slugify(name) for name in names]).values_list('slug', 'id'))
+        tag_ids = [by_slug[slugify(name)] for name in names]
+        # Reutiliza también las etiquetas que ya existían
+        return tag_ids + list(Tag.objects.exclude(id__in=tag_ids).values_list('id', flat=True))
+
+    def create_posts(self, prefix):
+        n_authors = max(1, int(len(self.user_ids) * self.options['authors']))
+        authors = Popularity(self.rng, n_authors, self.s)
+        drafts = self.options['drafts']
+
+        def posts():
+            for i in range(self.options['posts']):
+                slug = f'{prefix}-post-{i}'
+                created = self.random_date()
+                published = self.rng.random() >= drafts
+                title = self.sentence(3, 9)[:-1]
+                post = Post(
+                    title=title[:200], slug=slug, author_id=self.user_ids[authors.pick()],
+                    content=self.post_html(slug), excerpt=self.sentence()[:300],
+                    created_date=created, updated_date=created, published=published,
+                    published_date=created if published else None,
+                )
+                # bulk_create no pasa por Post.save()
+                post.render_content()
+                yield post
+
+        self.bulk(Post, posts(), 'posts')
+        rows = Post.objects.filter(slug__startswith=f'{prefix}-post-').order_by('id').values_list(
+            'id', 'published_date', 'created_date'
+        )
+        post_ids, post_dates = [], []
+        for post_id, published_date, created_date in rows.iterator(chunk_size=self.chunk_size):
+            post_ids.append(post_id)
+            post_dates.append(published_date or created_date)
+        self.posts = Popularity(self.rng, len(post_ids), self.s)
+        return post_ids, post_dates
+
+    def create_tagged_items(self):
+        content_type = ContentType.objects.get_for_model(Post)
+        tags = Popularity(self.rng, len(self.tag_ids), self.s)
+        per_post = self.options['tags_per_post']
+        self.bulk(TaggedItem, (
+            TaggedItem(content_type=content_type, object_id=post_id, tag_id=self.tag_ids[index])
+            for post_id in self.post_ids
+            for index in tags.pick_distinct(self.rng.randint(1, per_post))
+        ), 'etiquetas de posts')
+
+    def create_comments(self):
+        approved = self.options['approved']
+        counts = self.posts.counts(self.options['comments'])
+
+        def comments():
+            for index, count in enumerate(counts):
+                for _ in range(count):
+                    author_id = self.rng.choice(self.user_ids)
+                    content = self.sentence(4, 30)
+                    if self.rng.random() < 0.05:
+                        content = f'@{self.rng.choice(WORDS)} {content}'
+                    yield Comment(
+                        post_id=self.post_ids[index], author_id=author_id, content=content,
+                        created_date=self.random_date(self.post_dates[index]),
+                        is_approved=self.rng.random() < approved, pinned=self.rng.random() < 0.01,
+                    )
+
+        self.bulk(Comment, comments(), 'comentarios')
+        if self.post_ids:
+            # bulk_create no pasa por las señales que fijan el path de cada hilo
+            Comment.rebuild_threads(
+                Comment.objects.filter(post_id__gte=self.post_ids[0], post_id__lte=self.post_ids[-1])
+            )
+
+    def create_votes(self):
+        # Los posts se insertaron seguidos, así que sus comentarios caen en ese rango de ids
+        rows = Comment.objects.filter(
+            post_id__gte=self.post_ids[0], post_id__lte=self.post_ids[-1]
+        ).order_by('id').values_list('id', 'created_date')
+        comment_ids, comment_dates = array('q'), []
+        for comment_id, created in rows.iterator(chunk_size=self.chunk_size):
+            comment_ids.append(comment_id)
+            comment_dates.append(created)
+        if not comment_ids:
+            return
+        comments = Popularity(self.rng, len(comment_ids), self.s)
+        counts = comments.counts(self.options['votes'], cap=len(self.user_ids))
+
+        def votes():
+            for index, count in enumerate(counts):
+                for user_id in self.rng.sample(self.user_ids, count):
+                    date = self.random_date(comment_dates[index])
+                    yield CommentVote(
+                        comment_id=comment_ids[index], user_id=user_id,
+                        vote=1 if self.rng.random() < 0.75 else -1,
+                        created_date=date, updated_date=date,
+                    )
+
+        self.bulk(CommentVote, votes(), 'votos')
+        # Igual que los hilos: los votos guardados no se enteran de bulk_create
+        Comment.refresh_scores(Comment.objects.filter(id__gte=comment_ids[0], id__lte=comment_ids[-1]))
+
+    def per_post_users(self, total):
+        """Pares (índice de post, usuario) sin repetir usuario dentro de un post"""
+        counts = self.posts.counts(total, cap=len(self.user_ids))
+        for index, count in enumerate(counts):
+            for user_id in self.rng.sample(self.user_ids, count):
+                yield index, user_id
+
+    def create_reviews(self):
+        self.bulk(Review, (
+            Review(
+                post_id=self.post_ids[index], user_id=user_id,
+                rating=self.rng.choices((1, 2, 3, 4, 5), weights=(1, 1, 3, 5, 4))[0],
+                comment=self.sentence() if self.rng.random() < 0.4 else '',
+                created_date=self.random_date(self.post_dates[index]),
+            )
+            for index, user_id in self.per_post_users(self.options['reviews'])
+        ), 'reseñas')
+
+    def create_reactions(self):
+        self.bulk(Reaction, (
+            Reaction(
+                post_id=self.post_ids[index], user_id=user_id,
+                reaction_type=self.rng.choices(REACTIONS, weights=(8, 5, 3, 2, 1, 1))[0],
+                created_date=self.random_date(self.post_dates[index]),
+            )
+            for index, user_id in self.per_post_users(self.options['reactions'])
+        ), 'reacciones')
+
+    def create_notifications(self):
+        users = Popularity(self.rng, len(self.user_ids), self.s)
+        self.bulk(Notification, (
+            Notification(
+                user_id=self.user_ids[users.pick()],
+                notification_type=self.rng.choice(NOTIFICATION_TYPES),
+                title=self.sentence(2, 5)[:200], message=self.sentence(),
+                url=f'/post/{self.rng.choice(WORDS)}/',
+                is_read=self.rng.random() < 0.6, created_date=self.random_date(),
+            )
+            for _ in range(self.options['notifications'])
+        ), 'notificaciones')
+
+    def create_subscriptions(self):
+        per_user = self.options['subscriptions']
+        if per_user <= 0:
+            return
+        authors = sorted(set(
+            Post.objects.filter(id__gte=self.post_ids[0], id__lte=self.post_ids[-1])
+            .values_list('author_id', flat=True).distinct()
+        ))
+        tag_names = list(Tag.objects.order_by('id').values_list('name', flat=True))
+        author_count = max(0, min(len(authors), per_user // 2 + 1))
+        tag_count = max(0, min(len(tag_names), per_user - per_user // 2 - 1))
+
+        def subscriptions():
+            for user_id in self.user_ids:
+                for author_id in self.rng.sample(authors, author_count):
+                    yield Subscription(user_id=user_id, subscription_type='author', author_id=author_id,
+                                       created_date=self.random_date())
+                for tag in self.rng.sample(tag_names, tag_count):
+                    yield Subscription(user_id=user_id, subscription_type='tag', tag=tag,
+                                       created_date=self.random_date())
+
+        self.bulk(Subscription, subscriptions(), 'suscripciones')
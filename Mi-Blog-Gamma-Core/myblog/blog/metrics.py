@@ -0,0 +1,214 @@
+import bisect
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Límites superiores (ms) de los buckets del histograma; el último es abierto
+BUCKET_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+# Métricas de la petición en curso (las rellena QueryTimingMiddleware)
+_current = ContextVar('blog_request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Contadores de una sola petición"""
+
+    __slots__ = ('queries', 'sql_time', 'template_time', 'start')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.start = time.perf_counter()
+
+    def record_query(self, execute, sql, params, many, context):
+        """Wrapper para connection.execute_wrapper()"""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self.queries += 1
+
+    @property
+    def wall_time(self):
+        return time.perf_counter() - self.start
+
+
+def activate(metrics):
+    return _current.set(metrics)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+class Histogram:
+    """Histograma de buckets fijos: memoria constante sea cual sea el tráfico"""
+
+    __slots__ = ('counts', 'total', 'count', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def add(self, value_ms):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS_MS, value_ms)] += 1
+        self.total += value_ms
+        self.count += 1
+        if value_ms > self.max:
+            self.max = value_ms
+
+    def merge(self, other):
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.total += other.total
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def percentile(self, fraction):
+        """Cota superior del bucket que contiene el percentil pedido"""
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return float(BUCKET_BOUNDS_MS[i]) if i < len(BUCKET_BOUNDS_MS) else self.max
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count, 3) if self.count else 0.0,
+            'p50': self.percentile(0.50),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+            'max': round(self.max, 3),
+        }
+
+
+class RollingHistogram:
+    """
+    Histograma sobre las últimas `windows` ventanas de `window_seconds`.
+    Las ventanas antiguas se descartan enteras al rotar; tras un rato sin
+    tráfico se rota una vez por periodo transcurrido, así que lo que queda
+    es siempre de los últimos windows * window_seconds segundos.
+    """
+
+    def __init__(self, window_seconds=60, windows=5, clock=time.monotonic):
+        self.window_seconds = window_seconds
+        self.clock = clock
+        self.windows = deque(maxlen=windows)
+        self._window_start = None
+
+    def _rotate(self):
+        now = self.clock()
+        if self._window_start is None:
+            self.windows.append(Histogram())
+            self._window_start = now
+            return
+        elapsed = int((now - self._window_start) // self.window_seconds)
+        if elapsed > 0:
+            # Una ventana vacía por periodo; más de maxlen no cambiaría nada
+            for _ in range(min(elapsed, self.windows.maxlen)):
+                self.windows.append(Histogram())
+            self._window_start += elapsed * self.window_seconds
+
+    def add(self, value_ms):
+        self._rotate()
+        self.windows[-1].add(value_ms)
+
+    def snapshot(self):
+        self._rotate()
+        merged = Histogram()
+        for window in self.windows:
+            merged.merge(window)
+        return merged
+
+
+class MetricsRegistry:
+    """Histogramas por vista (nombre de URL resuelto) y por métrica"""
+
+    FIELDS = ('queries', 'sql_ms', 'template_ms', 'wall_ms')
+
+    def __init__(self, window_seconds=60, windows=5):
+        self.window_seconds = window_seconds
+        self.windows = windows
+        self._views = {}
+        self._lock = threading.Lock()
+
+    def record(self, view_name, metrics):
+        values = (
+            metrics.queries,
+            metrics.sql_time * 1000,
+            metrics.template_time * 1000,
+            metrics.wall_time * 1000,
+        )
+        with self._lock:
+            histograms = self._views.get(view_name)
+            if histograms is None:
+                histograms = self._views[view_name] = [
+                    RollingHistogram(self.window_seconds, self.windows) for _ in self.FIELDS
+                ]
+            for histogram, value in zip(histograms, values):
+                histogram.add(value)
+
+    def summary(self):
+        with self._lock:
+            return {
+                view_name: {
+                    field: histogram.snapshot().summary()
+                    for field, histogram in zip(self.FIELDS, histograms)
+                }
+                for view_name, histograms in sorted(self._views.items())
+            }
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+registry = MetricsRegistry(
+    window_seconds=getattr(settings, 'BLOG_METRICS_WINDOW_SECONDS', 60),
+    windows=getattr(settings, 'BLOG_METRICS_WINDOWS', 5),
+)
+
+
+_template_timer_installed = False
+
+
+def install_template_timer():
+    """
+    Mide el tiempo de render de las plantillas de nivel superior envolviendo
+    Template.render del backend de Django (las inclusiones se miden dentro).
+    """
+    global _template_timer_installed
+    if _template_timer_installed:
+        return
+    from django.template.backends.django import Template
+
+    original_render = Template.render
+
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return original_render(self, context, request)
+        start = time.perf_counter()
+        try:
+            return original_render(self, context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - start
+
+    Template.render = render
+    _template_timer_installed = True
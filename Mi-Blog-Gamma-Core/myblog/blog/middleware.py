@@ -0,0 +1,213 @@
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import FileResponse
+
+from . import metrics, profiling, routers
+
+logger = logging.getLogger('blog.profiling')
+
+# Vistas que sólo leen datos en GET/HEAD y pueden servirse desde la réplica
+DEFAULT_READ_ONLY_VIEWS = (
+    'blog:post_list',
+    'blog:trending',
+    'blog:post_detail',
+    'blog:post_comments',
+    'blog:posts_by_tag',
+    'blog:posts_by_tags',
+    'blog:tag_index',
+    'blog:rss_feed',
+    'blog:rss_feed_filtered',
+)
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+class ReadReplicaMiddleware:
+    """
+    Envía las lecturas de las vistas de solo lectura a la réplica.
+
+    Tras cualquier escritura se deja una cookie con la hora de la escritura:
+    mientras no pasen BLOG_READ_YOUR_WRITES_SECONDS ese usuario lee del
+    primario y ve sus propios cambios aunque la réplica no se haya refrescado.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.read_only_views = frozenset(
+            getattr(settings, 'BLOG_READ_ONLY_VIEWS', DEFAULT_READ_ONLY_VIEWS)
+        )
+
+    def __call__(self, request):
+        request._read_alias_active = False
+        write_token = routers.reset_write_flag()
+        try:
+            response = self.get_response(request)
+        finally:
+            if request._read_alias_active:
+                routers.deactivate_read_database(request._read_alias_previous)
+            wrote = routers.has_written()
+            routers.restore_write_flag(write_token)
+
+        if wrote or request.method not in SAFE_METHODS:
+            response.set_cookie(
+                routers.STICKY_COOKIE_NAME,
+                str(time.time()),
+                max_age=routers.get_sticky_seconds(),
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in SAFE_METHODS:
+            return None
+        if request.resolver_match.view_name not in self.read_only_views:
+            return None
+        if routers.is_sticky(request):
+            return None
+        alias = routers.get_read_database()
+        if alias:
+            request._read_alias_previous = routers.activate_read_database(alias)
+            request._read_alias_active = True
+        return None
+
+
+class QueryTimingMiddleware:
+    """
+    Mide por vista el número de consultas, el tiempo SQL, el tiempo de render
+    de plantillas y el tiempo total, y lo guarda en histogramas en memoria
+    (ver /metrics/). Añade las cabeceras X-Query-Count y Server-Timing.
+
+    Las respuestas en streaming (sitemaps, API, exportaciones) hacen casi
+    todas sus consultas mientras se envía el cuerpo: para ellas los
+    histogramas se apuntan al terminar de recorrerlo y cuentan todo, pero
+    las cabeceras salen antes y sólo cuentan lo que hizo la vista.
+
+    Debe ir el primero en MIDDLEWARE para que el tiempo total incluya al resto.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        metrics.install_template_timer()
+
+    def __call__(self, request):
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.activate(request_metrics)
+        try:
+            with self.counting_queries(request_metrics):
+                response = self.get_response(request)
+        finally:
+            metrics.deactivate(token)
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else '<unresolved>'
+        # Un fichero se lee sin consultas; envolverlo le quitaría el sendfile del servidor
+        if response.streaming and not isinstance(response, FileResponse):
+            response.streaming_content = self.measure_stream(response.streaming_content, view_name, request_metrics)
+        else:
+            metrics.registry.record(view_name, request_metrics)
+
+        response['X-Query-Count'] = str(request_metrics.queries)
+        response['Server-Timing'] = (
+            f'db;dur={request_metrics.sql_time * 1000:.1f};desc="{request_metrics.queries} queries", '
+            f'tpl;dur={request_metrics.template_time * 1000:.1f}, '
+            f'total;dur={request_metrics.wall_time * 1000:.1f}'
+        )
+        return response
+
+    @staticmethod
+    def counting_queries(request_metrics):
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(request_metrics.record_query))
+        return stack
+
+    def measure_stream(self, content, view_name, request_metrics):
+        """Devuelve el cuerpo tal cual; al acabar (o al cortarse) apunta la petición entera"""
+        try:
+            with self.counting_queries(request_metrics):
+                yield from content
+        finally:
+            metrics.registry.record(view_name, request_metrics)
+
+
+class ProfilingMiddleware:
+    """
+    Perfila la petición con cProfile o con el muestreador de pilas y guarda
+    los ficheros .prof y .collapsed en BLOG_PROFILE_DIR.
+
+    * Bajo demanda (solo staff): ?_profile=1 o la cabecera X-Profile: 1
+      (valor 'sampling' para usar el muestreador). La respuesta indica el
+      fichero en la cabecera X-Profile-File.
+    * Por muestreo: una fracción BLOG_PROFILE_SAMPLE_RATE de todas las
+      peticiones. Sólo se guardan las que superan BLOG_PROFILE_SLOW_MS.
+
+    Las peticiones perfiladas que superan BLOG_PROFILE_SLOW_MS se registran
+    en el logger 'blog.profiling' junto con sus funciones más costosas.
+    Debe ir después de AuthenticationMiddleware.
+    """
+
+    QUERY_FLAG = '_profile'
+    HEADER = 'X-Profile'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'BLOG_PROFILE_SAMPLE_RATE', 0.0)
+        self.slow_ms = getattr(settings, 'BLOG_PROFILE_SLOW_MS', 500)
+
+    def requested_profiler(self, request):
+        """Tipo de perfilador pedido por un usuario staff o None"""
+        flag = request.GET.get(self.QUERY_FLAG) or request.headers.get(self.HEADER)
+        if not flag or flag in ('0', 'false'):
+            return None
+        if not (request.user.is_authenticated and request.user.is_staff):
+            return None
+        return flag if flag in profiling.PROFILERS else 'default'
+
+    def __call__(self, request):
+        requested = self.requested_profiler(request)
+        sampled = requested is None and self.sample_rate and random.random() < self.sample_rate
+        if not requested and not sampled:
+            return self.get_response(request)
+
+        profiler = profiling.create_profiler(None if requested == 'default' else requested)
+        request._profiler = profiler
+        start = time.perf_counter()
+        profiler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.stop()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        slow = elapsed_ms >= self.slow_ms
+
+        if requested or slow:
+            path = profiling.profile_path(request, elapsed_ms)
+            profiler.write(path)
+            if requested:
+                response['X-Profile-File'] = path
+            if slow:
+                self.log_slow_request(request, elapsed_ms, path, profiler)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Con ASGI la vista síncrona puede ir en otro hilo que el middleware
+        profiler = getattr(request, '_profiler', None)
+        if profiler is not None:
+            profiler.follow_current_thread()
+
+    def log_slow_request(self, request, elapsed_ms, path, profiler):
+        request_metrics = metrics.current()
+        sql = ''
+        if request_metrics is not None:
+            sql = f' ({request_metrics.queries} consultas, {request_metrics.sql_time * 1000:.0f} ms de SQL)'
+        logger.warning(
+            'Petición lenta %s %s: %.0f ms%s. Perfil: %s\n%s',
+            request.method, request.get_full_path(), elapsed_ms, sql, path, profiler.top(),
+            extra={'profile': path, 'elapsed_ms': elapsed_ms},
+        )
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.23 on 2026-10-19 02:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_tag_stats(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Post = apps.get_model('blog', 'Post')
+    TaggedItem = apps.get_model('taggit', 'TaggedItem')
+    TagStats = apps.get_model('blog', 'TagStats')
+
+    content_type = ContentType.objects.filter(app_label='blog', model='post').first()
+    if content_type is None:
+        return
+    published = dict(Post.objects.filter(published=True).values_list('id', 'published_date'))
+    stats = {}
+    for tag_id, post_id in TaggedItem.objects.filter(content_type=content_type).values_list('tag_id', 'object_id').iterator():
+        count, last = stats.get(tag_id, (0, None))
+        if post_id in published:
+            date = published[post_id]
+            count += 1
+            if date and (last is None or date > last):
+                last = date
+        stats[tag_id] = (count, last)
+    TagStats.objects.bulk_create(
+        [
+            TagStats(tag_id=tag_id, post_count=count, last_published=last)
+            for tag_id, (count, last) in stats.items() if count
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+        ('blog', '0004_composite_indexes'),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagStats',
+            fields=[
+                ('tag', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='taggit.tag', verbose_name='Etiqueta')),
+                ('post_count', models.PositiveIntegerField(default=0, verbose_name='Posts publicados')),
+                ('last_published', models.DateTimeField(blank=True, null=True, verbose_name='Última publicación')),
+            ],
+            options={
+                'verbose_name': 'Estadística de etiqueta',
+                'verbose_name_plural': 'Estadísticas de etiquetas',
+                'indexes': [models.Index(fields=['-post_count'], name='blog_tagstats_count_idx'), models.Index(fields=['-last_published'], name='blog_tagstats_recent_idx')],
+            },
+        ),
+        migrations.RunPython(populate_tag_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.23 on 2026-10-19 03:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0005_tag_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaleRelatedPost',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='blog.post')),
+            ],
+            options={
+                'verbose_name': 'Post relacionado pendiente',
+                'verbose_name_plural': 'Posts relacionados pendientes',
+            },
+        ),
+        migrations.CreateModel(
+            name='RelatedPost',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='Posición')),
+                ('score', models.FloatField(verbose_name='Similitud')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_links', to='blog.post', verbose_name='Post')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='blog.post', verbose_name='Post relacionado')),
+            ],
+            options={
+                'verbose_name': 'Post relacionado',
+                'verbose_name_plural': 'Posts relacionados',
+                'ordering': ['post', 'rank'],
+                'indexes': [models.Index(fields=['related'], name='blog_relatedpost_related_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='relatedpost',
+            constraint=models.UniqueConstraint(fields=('post', 'rank'), name='blog_relatedpost_rank_uniq'),
+        ),
+    ]
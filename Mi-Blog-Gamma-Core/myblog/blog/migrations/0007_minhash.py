@@ -0,0 +1,39 @@
+# Generated by Django 4.2.23 on 2026-10-19 03:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_related_posts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostMinHash',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='minhash', serialize=False, to='blog.post')),
+                ('content_hash', models.CharField(max_length=40, verbose_name='Hash del contenido')),
+                ('signature', models.BinaryField(verbose_name='Firma')),
+            ],
+            options={
+                'verbose_name': 'Firma MinHash',
+                'verbose_name_plural': 'Firmas MinHash',
+            },
+        ),
+        migrations.CreateModel(
+            name='MinHashBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.BigIntegerField(verbose_name='Banda')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='minhash_buckets', to='blog.post')),
+            ],
+            options={
+                'verbose_name': 'Cubeta LSH',
+                'verbose_name_plural': 'Cubetas LSH',
+                'indexes': [models.Index(fields=['key', 'post'], name='blog_minhashbucket_key_idx')],
+            },
+        ),
+    ]
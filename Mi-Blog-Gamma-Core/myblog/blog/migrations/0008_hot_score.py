@@ -0,0 +1,33 @@
+# Generated by Django 4.2.23 on 2026-10-19 03:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0007_minhash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HotScoreState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('decayed_at', models.DateTimeField(verbose_name='Último reescalado')),
+            ],
+            options={
+                'verbose_name': 'Estado de tendencias',
+                'verbose_name_plural': 'Estado de tendencias',
+            },
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='hot_score',
+            field=models.FloatField(default=0, verbose_name='Puntuación de tendencia'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('published', True)), fields=['-hot_score', '-id'], name='blog_post_hot_idx'),
+        ),
+    ]
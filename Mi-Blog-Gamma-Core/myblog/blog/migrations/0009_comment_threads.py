@@ -0,0 +1,49 @@
+# Generated by Django 4.2.23 on 2026-10-19 09:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_paths(apps, schema_editor):
+    # Hasta ahora todos los comentarios eran raíces: el path es su propio id
+    Comment = apps.get_model('blog', 'Comment')
+    ids = Comment.objects.order_by('id').values_list('id', flat=True)
+    quote = schema_editor.connection.ops.quote_name
+    sql = 'UPDATE {} SET {} = %s WHERE {} = %s'.format(quote(Comment._meta.db_table), quote('path'), quote('id'))
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(sql, [(str(comment_id).zfill(10), comment_id) for comment_id in ids])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0008_hot_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='blog.comment', verbose_name='Respuesta a'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Nivel'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Respuestas aprobadas'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'path'], name='blog_comment_path_idx'),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.23 on 2026-10-19 11:05
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_scores(apps, schema_editor):
+    Comment = apps.get_model('blog', 'Comment')
+    CommentVote = apps.get_model('blog', 'CommentVote')
+    votes = CommentVote.objects.filter(comment=OuterRef('pk')).order_by().values('comment')
+    Comment.objects.update(score=Coalesce(Subquery(votes.annotate(value=Sum('vote')).values('value')), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_comment_threads'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='score',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Puntuación'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'depth', '-pinned', '-score', 'created_date', 'id'], name='blog_comment_best_idx'),
+        ),
+        migrations.RunPython(fill_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 4.2.23 on 2026-10-19 12:20
+
+import math
+
+from django.db import migrations, models
+
+
+def wilson_lower_bound(upvotes, downvotes, z=1.96):
+    # Copia de blog.models.wilson_lower_bound: las migraciones no dependen del código vivo
+    n = upvotes + downvotes
+    if not n:
+        return 0.0
+    p = upvotes / n
+    z2 = z * z
+    return (p + z2 / (2 * n) - z * math.sqrt((p * (1 - p) + z2 / (4 * n)) / n)) / (1 + z2 / n)
+
+
+def fill_votes(apps, schema_editor):
+    Comment = apps.get_model('blog', 'Comment')
+    CommentVote = apps.get_model('blog', 'CommentVote')
+    votes = CommentVote.objects.order_by().values('comment').annotate(
+        up=models.Count('pk', filter=models.Q(vote=1)), down=models.Count('pk', filter=models.Q(vote=-1)),
+    ).values_list('comment', 'up', 'down')
+    quote = schema_editor.connection.ops.quote_name
+    sql = 'UPDATE {} SET {} = %s, {} = %s, {} = %s WHERE {} = %s'.format(
+        quote(Comment._meta.db_table), quote('upvotes'), quote('downvotes'), quote('wilson_score'), quote('id'),
+    )
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            (up, down, wilson_lower_bound(up, down), comment_id) for comment_id, up, down in votes
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0010_comment_score'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='comment',
+            name='blog_comment_best_idx',
+        ),
+        migrations.RemoveField(
+            model_name='comment',
+            name='score',
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='upvotes',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Votos positivos'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='downvotes',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Votos negativos'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='wilson_score',
+            field=models.FloatField(default=0, editable=False, verbose_name='Puntuación Wilson'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'depth', '-pinned', '-wilson_score', 'created_date', 'id'], name='blog_comment_wilson_idx'),
+        ),
+        migrations.RunPython(fill_votes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.23 on 2026-10-19 03:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0011_comment_wilson_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='rejected',
+            field=models.BooleanField(default=False, verbose_name='Rechazado'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_approved', False), ('rejected', False)), fields=['post', '-created_date', '-id'], name='blog_comment_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+from django.db import migrations
+
+# Copia de blog.fulltext: las migraciones no dependen del código vivo
+CREATE_SQL = [
+    "CREATE VIRTUAL TABLE blog_comment_fts USING fts5("
+    "content, content='blog_comment', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    """
+    CREATE TRIGGER blog_comment_fts_insert AFTER INSERT ON blog_comment BEGIN
+        INSERT INTO blog_comment_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER blog_comment_fts_delete AFTER DELETE ON blog_comment BEGIN
+        INSERT INTO blog_comment_fts(blog_comment_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER blog_comment_fts_update AFTER UPDATE OF content ON blog_comment BEGIN
+        INSERT INTO blog_comment_fts(blog_comment_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO blog_comment_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    "INSERT INTO blog_comment_fts(blog_comment_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    'DROP TRIGGER IF EXISTS blog_comment_fts_insert',
+    'DROP TRIGGER IF EXISTS blog_comment_fts_delete',
+    'DROP TRIGGER IF EXISTS blog_comment_fts_update',
+    'DROP TABLE IF EXISTS blog_comment_fts',
+]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        # FTS5 sólo existe en SQLite; en otros motores la búsqueda usa icontains
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        with schema_editor.connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0012_comment_moderation_queue'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(CREATE_SQL), run(DROP_SQL)),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.23 on 2026-10-19 03:54
+
+from django.db import migrations, models
+
+
+def fill_rendered(apps, schema_editor):
+    # El saneado es demasiado largo para copiarlo aquí; si cambia después,
+    # `python manage.py render_posts` rehace los posts
+    from blog.rendering import rebuild
+
+    Post = apps.get_model('blog', 'Post')
+    rebuild(Post.objects.using(schema_editor.connection.alias))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0013_comment_fulltext'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='reading_time',
+            field=models.PositiveIntegerField(default=1, editable=False, verbose_name='Minutos de lectura'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='rendered_html',
+            field=models.TextField(blank=True, editable=False, verbose_name='HTML publicado'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='summary',
+            field=models.TextField(blank=True, editable=False, verbose_name='Resumen para listados'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='toc',
+            field=models.JSONField(blank=True, default=list, editable=False, verbose_name='Índice'),
+        ),
+        migrations.RunPython(fill_rendered, migrations.RunPython.noop),
+    ]
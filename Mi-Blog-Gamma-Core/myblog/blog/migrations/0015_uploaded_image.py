@@ -0,0 +1,30 @@
+# Generated by Django 4.2.23 on 2026-10-19 04:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0014_post_rendered_html'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadedImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=255, unique=True, verbose_name='Ruta')),
+                ('width', models.PositiveIntegerField(blank=True, null=True, verbose_name='Ancho')),
+                ('height', models.PositiveIntegerField(blank=True, null=True, verbose_name='Alto')),
+                ('variants', models.JSONField(blank=True, default=list, verbose_name='Variantes')),
+                ('created_date', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de subida')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='Fecha de optimización')),
+            ],
+            options={
+                'verbose_name': 'Imagen subida',
+                'verbose_name_plural': 'Imágenes subidas',
+                'indexes': [models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['id'], name='blog_upload_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+import django.utils.timezone
+
+
+def fill_updated_date(apps, schema_editor):
+    # Sin historial de ediciones: lo más fiable es la publicación o la creación
+    Post = apps.get_model('blog', 'Post')
+    Post.objects.using(schema_editor.connection.alias).update(
+        updated_date=Coalesce('published_date', 'created_date')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0015_uploaded_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='updated_date',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Fecha de modificación'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_updated_date, migrations.RunPython.noop),
+    ]
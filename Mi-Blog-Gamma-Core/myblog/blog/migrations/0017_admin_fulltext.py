@@ -0,0 +1,60 @@
+from django.db import migrations
+
+# Copia de blog.fulltext: las migraciones no dependen del código vivo
+INDEXES = [
+    ('blog_review', ['comment']),
+    ('blog_notification', ['title', 'message']),
+    ('blog_post', ['title']),
+]
+
+
+def create_sql(source, columns):
+    table = f'{source}_fts'
+    names = ', '.join(columns)
+    new = ', '.join(f'new.{column}' for column in columns)
+    old = ', '.join(f'old.{column}' for column in columns)
+    insert = f'INSERT INTO {table}(rowid, {names}) VALUES (new.id, {new});'
+    delete = f"INSERT INTO {table}({table}, rowid, {names}) VALUES ('delete', old.id, {old});"
+    return [
+        f"CREATE VIRTUAL TABLE {table} USING fts5("
+        f"{names}, content='{source}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+        f'CREATE TRIGGER {table}_insert AFTER INSERT ON {source} BEGIN {insert} END',
+        f'CREATE TRIGGER {table}_delete AFTER DELETE ON {source} BEGIN {delete} END',
+        f'CREATE TRIGGER {table}_update AFTER UPDATE OF {names} ON {source} BEGIN {delete} {insert} END',
+        f"INSERT INTO {table}({table}) VALUES ('rebuild')",
+    ]
+
+
+def drop_sql(source):
+    table = f'{source}_fts'
+    return [
+        f'DROP TRIGGER IF EXISTS {table}_insert',
+        f'DROP TRIGGER IF EXISTS {table}_delete',
+        f'DROP TRIGGER IF EXISTS {table}_update',
+        f'DROP TABLE IF EXISTS {table}',
+    ]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        # FTS5 sólo existe en SQLite; en otros motores la búsqueda usa icontains
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        with schema_editor.connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0016_post_updated_date'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run([sql for source, columns in INDEXES for sql in create_sql(source, columns)]),
+            run([sql for source, _ in INDEXES for sql in drop_sql(source)]),
+        ),
+    ]
@@ -0,0 +1,54 @@
+from django.db import migrations
+
+# Copia de blog.fulltext: las migraciones no dependen del código vivo.
+# blog_post_fts pasa de indexar sólo el título a título y contenido.
+TABLE = 'blog_post_fts'
+
+
+def create_sql(columns):
+    names = ', '.join(columns)
+    new = ', '.join(f'new.{column}' for column in columns)
+    old = ', '.join(f'old.{column}' for column in columns)
+    insert = f'INSERT INTO {TABLE}(rowid, {names}) VALUES (new.id, {new});'
+    delete = f"INSERT INTO {TABLE}({TABLE}, rowid, {names}) VALUES ('delete', old.id, {old});"
+    return [
+        f"CREATE VIRTUAL TABLE {TABLE} USING fts5("
+        f"{names}, content='blog_post', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+        f'CREATE TRIGGER {TABLE}_insert AFTER INSERT ON blog_post BEGIN {insert} END',
+        f'CREATE TRIGGER {TABLE}_delete AFTER DELETE ON blog_post BEGIN {delete} END',
+        f'CREATE TRIGGER {TABLE}_update AFTER UPDATE OF {names} ON blog_post BEGIN {delete} {insert} END',
+        f"INSERT INTO {TABLE}({TABLE}) VALUES ('rebuild')",
+    ]
+
+
+DROP_SQL = [
+    f'DROP TRIGGER IF EXISTS {TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {TABLE}_delete',
+    f'DROP TRIGGER IF EXISTS {TABLE}_update',
+    f'DROP TABLE IF EXISTS {TABLE}',
+]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        # FTS5 sólo existe en SQLite; en otros motores la búsqueda usa icontains
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        with schema_editor.connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0017_admin_fulltext'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run(DROP_SQL + create_sql(['title', 'content'])),
+            run(DROP_SQL + create_sql(['title'])),
+        ),
+    ]
@@ -1,12 +1,37 @@
-from django.db import models
+from django.db import connection, models, transaction
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 from ckeditor.fields import RichTextField
 from taggit.managers import TaggableManager
+from taggit.models import Tag
 import math
-from django.utils.html import strip_tags
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db.models import Avg, Count, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Concat
+
+from . import rendering
+
+class PostQuerySet(models.QuerySet):
+    def without_body(self):
+        """Sin el contenido ni el HTML, que las listas no pintan (sólo summary)"""
+        return self.defer('content', 'rendered_html', 'toc')
+
+    def with_stats(self):
+        """
+        Anota promedio y número de reseñas y el número de comentarios
+        aprobados con subconsultas, para no consultar por cada post en listas.
+        """
+        reviews = Review.objects.filter(post=OuterRef('pk')).order_by().values('post')
+        approved = Comment.objects.filter(post=OuterRef('pk'), is_approved=True).order_by().values('post')
+        return self.annotate(
+            rating_avg=Subquery(reviews.annotate(value=Avg('rating')).values('value')),
+            rating_count=Coalesce(Subquery(reviews.annotate(value=Count('pk')).values('value')), 0),
+            approved_comments_count=Coalesce(Subquery(approved.annotate(value=Count('pk')).values('value')), 0),
+        )
 
 class Post(models.Model):
     title = models.CharField(max_length=200, verbose_name='Título')
@@ -19,11 +44,31 @@ class Post(models.Model):
     created_date = models.DateTimeField(default=timezone.now, verbose_name='Fecha de creación')
     published_date = models.DateTimeField(blank=True, null=True, verbose_name='Fecha de publicación')
     published = models.BooleanField(default=False, verbose_name='Publicado')
+    # Última edición (lastmod del sitemap); no cambia con hot_score ni con rebuild
+    updated_date = models.DateTimeField(auto_now=True, verbose_name='Fecha de modificación')
+    hot_score = models.FloatField(default=0, verbose_name='Puntuación de tendencia')
+    # Generados al guardar a partir de content (ver blog/rendering.py)
+    rendered_html = models.TextField(blank=True, editable=False, verbose_name='HTML publicado')
+    toc = models.JSONField(default=list, blank=True, editable=False, verbose_name='Índice')
+    summary = models.TextField(blank=True, editable=False, verbose_name='Resumen para listados')
+    reading_time = models.PositiveIntegerField(default=1, editable=False, verbose_name='Minutos de lectura')
+
+    objects = PostQuerySet.as_manager()
+
+    # Campos que dependen de content y excerpt
+    RENDERED_FIELDS = ('rendered_html', 'toc', 'summary', 'reading_time')
 
     class Meta:
         ordering = ['-created_date']
         verbose_name = 'Post'
         verbose_name_plural = 'Posts'
+        indexes = [
+            # Parciales: Django filtra published=True como `WHERE "published"`,
+            # condición que SQLite sólo aprovecha si coincide con la del índice
+            models.Index(fields=['published_date'], condition=models.Q(published=True), name='blog_post_pub_date_idx'),
+            models.Index(fields=['author', 'published_date'], condition=models.Q(published=True), name='blog_post_author_pub_idx'),
+            models.Index(fields=['-hot_score', '-id'], condition=models.Q(published=True), name='blog_post_hot_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -31,12 +76,21 @@ class Post(models.Model):
     def get_absolute_url(self):
         return reverse('blog:post_detail', kwargs={'slug': self.slug})
 
-    @property
-    def reading_time(self):
-        text = strip_tags(self.content or "")
-        word_count = len(text.split())
-        minutes = math.ceil(word_count / 200) if word_count > 0 else 1
-        return max(1, int(minutes))
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'content', 'excerpt'} & set(update_fields):
+            self.render_content()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, *self.RENDERED_FIELDS, 'updated_date'}
+        super().save(*args, **kwargs)
+
+    def render_content(self):
+        """Rellena los RENDERED_FIELDS a partir de content (también antes de un bulk_create)"""
+        from .images import responsive_images
+
+        self.rendered_html, self.toc, text = rendering.render(self.content, responsive_images(self.content))
+        self.summary = rendering.summarize(text, self.excerpt)
+        self.reading_time = rendering.reading_time(text)
 
     def publish(self):
         self.published_date = timezone.now()
@@ -45,19 +99,40 @@ class Post(models.Model):
 
     def get_average_rating(self):
         """Calcula el promedio de calificaciones del post"""
-        reviews = self.reviews.all()
-        if reviews:
-            return round(sum(review.rating for review in reviews) / len(reviews), 1)
-        return 0
+        if hasattr(self, 'rating_avg'):
+            average = self.rating_avg
+        else:
+            average = self.reviews.aggregate(value=Avg('rating'))['value']
+        return round(average, 1) if average else 0
 
     def get_rating_count(self):
         """Obtiene el número total de calificaciones"""
+        if hasattr(self, 'rating_count'):
+            return self.rating_count
         return self.reviews.count()
 
     def get_approved_comments_count(self):
         """Obtiene el número de comentarios aprobados"""
+        if hasattr(self, 'approved_comments_count'):
+            return self.approved_comments_count
         return self.comments.filter(is_approved=True).count()
 
+def wilson_lower_bound(upvotes, downvotes, z=1.96):
+    """
+    Cota inferior del intervalo de Wilson (95 %) para la proporción de votos
+    positivos: 1 a favor y 0 en contra puntúa menos que 500 y 499, porque
+    con tan pocos votos la proporción real puede ser mucho más baja.
+    """
+    n = upvotes + downvotes
+    if not n:
+        return 0.0
+    p = upvotes / n
+    z2 = z * z
+    return (p + z2 / (2 * n) - z * math.sqrt((p * (1 - p) + z2 / (4 * n)) / n)) / (1 + z2 / n)
+
+def get_comment_max_depth():
+    return getattr(settings, 'BLOG_COMMENT_MAX_DEPTH', 5)
+
 class Comment(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
     author = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Autor', null=True, blank=True)
@@ -67,11 +142,51 @@ class Comment(models.Model):
     created_date = models.DateTimeField(auto_now_add=True, verbose_name='Fecha')
     is_approved = models.BooleanField(default=False, verbose_name='Aprobado')
     pinned = models.BooleanField(default=False, verbose_name='Fijado')
+    # Rechazado por el autor del post: sale de la cola de moderación
+    rejected = models.BooleanField(default=False, verbose_name='Rechazado')
+    # Hilo: `path` son los ids de los ancestros y el propio, con ancho fijo
+    # ("0000000012/0000000034"), así que ordenar por path recorre el árbol en
+    # profundidad y un subárbol es un rango del índice (post, path)
+    parent = models.ForeignKey(
+        'self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies', verbose_name='Respuesta a'
+    )
+    path = models.CharField(max_length=255, blank=True, editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Nivel')
+    reply_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Respuestas aprobadas')
+    # Votos guardados y cota inferior de Wilson para ordenar los hilos por índice
+    upvotes = models.PositiveIntegerField(default=0, editable=False, verbose_name='Votos positivos')
+    downvotes = models.PositiveIntegerField(default=0, editable=False, verbose_name='Votos negativos')
+    wilson_score = models.FloatField(default=0, editable=False, verbose_name='Puntuación Wilson')
+
+    PATH_DIGITS = 10
+    PATH_SEP = '/'
 
     class Meta:
         ordering = ['created_date']
         verbose_name = 'Comentario'
         verbose_name_plural = 'Comentarios'
+        indexes = [
+            models.Index(fields=['post', 'is_approved', 'pinned', 'created_date'], name='blog_comment_thread_idx'),
+            models.Index(fields=['post', 'path'], name='blog_comment_path_idx'),
+            # Raíces de un post en orden de "mejores comentarios" (paginación por cursor)
+            models.Index(
+                fields=['post', 'depth', '-pinned', '-wilson_score', 'created_date', 'id'],
+                name='blog_comment_wilson_idx',
+            ),
+            # Cola de moderación (/moderation/): sólo los pendientes de cada post
+            models.Index(
+                fields=['post', '-created_date', '-id'], condition=models.Q(is_approved=False, rejected=False),
+                name='blog_comment_pending_idx',
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Para saber en post_save si cambió la aprobación sin volver a consultar
+        if 'is_approved' in field_names:
+            instance._approved_in_db = instance.is_approved
+        return instance
 
     def __str__(self):
         if self.author:
@@ -80,16 +195,109 @@ class Comment(models.Model):
             return f'Comentario de {self.name} en {self.post.title}'
     
     def get_score(self):
-        """Calcula el score del comentario basado en votos"""
-        return sum(vote.vote for vote in self.votes.all())
+        """Score del comentario basado en votos (positivos menos negativos)"""
+        return self.upvotes - self.downvotes
+
+    def refresh_score(self):
+        """Vuelve a contar los votos de este comentario y guarda su puntuación Wilson"""
+        counts = self.votes.aggregate(
+            up=Count('pk', filter=models.Q(vote=1)), down=Count('pk', filter=models.Q(vote=-1))
+        )
+        self.upvotes, self.downvotes = counts['up'], counts['down']
+        self.wilson_score = wilson_lower_bound(self.upvotes, self.downvotes)
+        Comment.objects.filter(pk=self.pk).update(
+            upvotes=self.upvotes, downvotes=self.downvotes, wilson_score=self.wilson_score
+        )
+
+    @classmethod
+    def refresh_scores(cls, comments=None):
+        """Lo mismo que refresh_score para muchos comentarios (tras cargas sin vote_comment)"""
+        comments = cls.objects.all() if comments is None else comments
+        counts = dict.fromkeys(comments.values_list('id', flat=True).iterator(chunk_size=5000), (0, 0))
+        votes = CommentVote.objects.filter(comment__in=comments).order_by().values('comment') \
+            .annotate(up=Count('pk', filter=models.Q(vote=1)), down=Count('pk', filter=models.Q(vote=-1))) \
+            .values_list('comment', 'up', 'down')
+        for comment_id, up, down in votes.iterator(chunk_size=5000):
+            counts[comment_id] = (up, down)
+        # executemany por lo mismo que en rebuild_threads
+        quote = connection.ops.quote_name
+        sql = 'UPDATE {} SET {} = %s, {} = %s, {} = %s WHERE {} = %s'.format(
+            quote(cls._meta.db_table), quote('upvotes'), quote('downvotes'), quote('wilson_score'), quote('id'),
+        )
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, [
+                (up, down, wilson_lower_bound(up, down), comment_id) for comment_id, (up, down) in counts.items()
+            ])
+        return len(counts)
     
     def get_user_vote(self, user):
         """Obtiene el voto del usuario para este comentario"""
-        try:
-            vote = self.votes.get(user=user)
-            return vote.vote
-        except CommentVote.DoesNotExist:
-            return 0
+        vote = self.votes.filter(user=user).values_list('vote', flat=True).first()
+        return vote or 0
+
+    @classmethod
+    def make_path(cls, comment_id, parent_path=''):
+        segment = str(comment_id).zfill(cls.PATH_DIGITS)
+        return f'{parent_path}{cls.PATH_SEP}{segment}' if parent_path else segment
+
+    def ancestor_ids(self):
+        """Ids de los ancestros, de la raíz al padre, sacados del path"""
+        return [int(segment) for segment in self.path.split(self.PATH_SEP)[:-1]]
+
+    def subtree(self, include_self=True):
+        """El comentario y sus respuestas en orden de hilo, con una consulta por rango"""
+        lower = {'path__gte': self.path} if include_self else {'path__gt': self.path + self.PATH_SEP}
+        # '0' es el carácter siguiente a '/': nada del subárbol llega a path + '0'
+        return Comment.objects.filter(post_id=self.post_id, path__lt=self.path + '0', **lower).order_by('path')
+
+    @classmethod
+    def adjust_reply_counts(cls, ancestor_ids, delta):
+        if ancestor_ids and delta:
+            cls.objects.filter(pk__in=ancestor_ids).update(reply_count=models.F('reply_count') + delta)
+
+    @classmethod
+    def recount_replies(cls, comments):
+        """Recalcula reply_count de los ancestros de `comments` (tras un update() masivo)"""
+        ancestor_ids = {ancestor_id for comment in comments for ancestor_id in comment.ancestor_ids()}
+        if not ancestor_ids:
+            return
+        descendants = cls.objects.filter(
+            post=OuterRef('post'), is_approved=True,
+            path__gt=Concat(OuterRef('path'), Value(cls.PATH_SEP)), path__lt=Concat(OuterRef('path'), Value('0')),
+        ).order_by().values('post')
+        cls.objects.filter(pk__in=ancestor_ids).update(
+            reply_count=Coalesce(Subquery(descendants.annotate(value=Count('pk')).values('value')), 0)
+        )
+
+    @classmethod
+    def rebuild_threads(cls, comments=None):
+        """
+        Rehace path, depth y reply_count (tras cargas sin señales). `comments`
+        debe traer hilos completos, p. ej. todos los de unos posts.
+        """
+        comments = cls.objects.all() if comments is None else comments
+        rows = comments.order_by('id').values_list('id', 'parent_id', 'is_approved')
+        paths, counts = {}, {}
+        for comment_id, parent_id, approved in rows.iterator(chunk_size=5000):
+            # Un padre siempre tiene un id menor que sus respuestas
+            path = cls.make_path(comment_id, paths.get(parent_id, ''))
+            paths[comment_id] = path
+            counts[comment_id] = 0
+            if approved:
+                for ancestor_id in path.split(cls.PATH_SEP)[:-1]:
+                    counts[int(ancestor_id)] += 1
+        # Un UPDATE por fila con executemany: bulk_update arma un CASE por
+        # campo y lote que en decenas de miles de filas es ~40 veces más lento
+        quote = connection.ops.quote_name
+        sql = 'UPDATE {} SET {} = %s, {} = %s, {} = %s WHERE {} = %s'.format(
+            quote(cls._meta.db_table), quote('path'), quote('depth'), quote('reply_count'), quote('id'),
+        )
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, [
+                (path, path.count(cls.PATH_SEP), counts[comment_id], comment_id)
+                for comment_id, path in paths.items()
+            ])
+        return len(paths)
 
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, verbose_name='Usuario')
@@ -142,6 +350,9 @@ class Reaction(models.Model):
         unique_together = ['post', 'user']
         verbose_name = 'Reacción'
         verbose_name_plural = 'Reacciones'
+        indexes = [
+            models.Index(fields=['post', 'reaction_type'], name='blog_reaction_type_idx'),
+        ]
     
     def __str__(self):
         return f'{self.user.username} reaccionó {self.reaction_type} a {self.post.title}'
@@ -189,6 +400,10 @@ class Notification(models.Model):
         ordering = ['-created_date']
         verbose_name = 'Notificación'
         verbose_name_plural = 'Notificaciones'
+        indexes = [
+            models.Index(fields=['user', 'is_read', 'created_date'], name='blog_notif_unread_idx'),
+            models.Index(fields=['user', 'created_date'], name='blog_notif_user_date_idx'),
+        ]
     
     def __str__(self):
         return f'{self.user.username} - {self.title}'
@@ -210,9 +425,177 @@ class Subscription(models.Model):
         unique_together = ['user', 'subscription_type', 'author', 'tag']
         verbose_name = 'Suscripción'
         verbose_name_plural = 'Suscripciones'
+        indexes = [
+            models.Index(fields=['subscription_type', 'author'], name='blog_sub_type_author_idx'),
+            models.Index(fields=['subscription_type', 'tag'], name='blog_sub_type_tag_idx'),
+        ]
     
     def __str__(self):
         if self.subscription_type == 'author':
             return f'{self.user.username} suscrito a {self.author.username}'
         else:
             return f'{self.user.username} suscrito a etiqueta {self.tag}'
+
+
+# Nombre del fragmento {% cache %} de la nube de etiquetas
+TAG_CLOUD_FRAGMENT = 'tag_cloud'
+
+class TagStatsQuerySet(models.QuerySet):
+    def cloud(self, limit=30, weights=5):
+        """
+        Las `limit` etiquetas con más posts publicados, en orden alfabético y
+        con un peso de 1 a `weights` (escala logarítmica) para la nube.
+        """
+        stats = list(self.select_related('tag').order_by('-post_count', 'tag_id')[:limit])
+        if not stats:
+            return []
+        low, high = math.log(stats[-1].post_count), math.log(stats[0].post_count)
+        for item in stats:
+            spread = (math.log(item.post_count) - low) / (high - low) if high > low else 1
+            item.weight = 1 + round(spread * (weights - 1))
+        return sorted(stats, key=lambda item: item.tag.name.lower())
+
+class TagStats(models.Model):
+    """
+    Número de posts publicados y última publicación por etiqueta. Sólo hay
+    fila para las etiquetas con algún post publicado. Se mantiene al día desde
+    blog/signals.py para no unir TaggedItem con Post al mostrar la nube o el
+    índice de etiquetas.
+    """
+    tag = models.OneToOneField(Tag, on_delete=models.CASCADE, primary_key=True, related_name='stats', verbose_name='Etiqueta')
+    post_count = models.PositiveIntegerField(default=0, verbose_name='Posts publicados')
+    last_published = models.DateTimeField(null=True, blank=True, verbose_name='Última publicación')
+
+    objects = TagStatsQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Estadística de etiqueta'
+        verbose_name_plural = 'Estadísticas de etiquetas'
+        indexes = [
+            models.Index(fields=['-post_count'], name='blog_tagstats_count_idx'),
+            models.Index(fields=['-last_published'], name='blog_tagstats_recent_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.tag.name}: {self.post_count}'
+
+    @classmethod
+    def refresh(cls, tag_ids):
+        """Recalcula las estadísticas de las etiquetas indicadas (una consulta agregada)"""
+        tag_ids = set(tag_ids)
+        if not tag_ids:
+            return
+        rows = (
+            Post.objects.filter(published=True, tags__id__in=tag_ids)
+            .order_by().values_list('tags__id').annotate(Count('id'), Max('published_date'))
+        )
+        stats = [cls(tag_id=tag_id, post_count=count, last_published=last) for tag_id, count, last in rows]
+        cls.objects.bulk_create(
+            stats, update_conflicts=True, unique_fields=['tag'], update_fields=['post_count', 'last_published'],
+        )
+        cls.objects.filter(tag_id__in=tag_ids - {item.tag_id for item in stats}).delete()
+        cache.delete(make_template_fragment_key(TAG_CLOUD_FRAGMENT))
+
+    @classmethod
+    def rebuild(cls, tag_ids=None, chunk_size=500):
+        """Recalcula `tag_ids` o todas las etiquetas (tras cargas masivas que no envían señales)"""
+        if tag_ids is None:
+            tag_ids = Tag.objects.order_by('id').values_list('id', flat=True)
+        tag_ids = list(tag_ids)
+        for start in range(0, len(tag_ids), chunk_size):
+            cls.refresh(tag_ids[start:start + chunk_size])
+        return len(tag_ids)
+
+class RelatedPost(models.Model):
+    """
+    Los `rank` posts publicados más parecidos a `post` por etiquetas compartidas.
+    Se calcula fuera de línea con el comando compute_related_posts (blog/related.py).
+    """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='related_links', verbose_name='Post')
+    related = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+', verbose_name='Post relacionado')
+    rank = models.PositiveSmallIntegerField(verbose_name='Posición')
+    score = models.FloatField(verbose_name='Similitud')
+
+    class Meta:
+        ordering = ['post', 'rank']
+        verbose_name = 'Post relacionado'
+        verbose_name_plural = 'Posts relacionados'
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'rank'], name='blog_relatedpost_rank_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['related'], name='blog_relatedpost_related_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.post_id} -> {self.related_id} ({self.score:.3f})'
+
+class StaleRelatedPost(models.Model):
+    """Posts cuyas etiquetas o publicación cambiaron desde el último cálculo"""
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='+')
+
+    class Meta:
+        verbose_name = 'Post relacionado pendiente'
+        verbose_name_plural = 'Posts relacionados pendientes'
+
+    @classmethod
+    def mark(cls, post_ids):
+        post_ids = set(post_ids)
+        if post_ids:
+            cls.objects.bulk_create([cls(post_id=post_id) for post_id in post_ids], ignore_conflicts=True)
+
+class PostMinHash(models.Model):
+    """Firma MinHash del texto de un post (ver blog/duplicates.py)"""
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='minhash')
+    content_hash = models.CharField(max_length=40, verbose_name='Hash del contenido')
+    signature = models.BinaryField(verbose_name='Firma')
+
+    class Meta:
+        verbose_name = 'Firma MinHash'
+        verbose_name_plural = 'Firmas MinHash'
+
+class MinHashBucket(models.Model):
+    """Cubeta LSH: posts con una banda de la firma idéntica"""
+    key = models.BigIntegerField(verbose_name='Banda')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='minhash_buckets')
+
+    class Meta:
+        verbose_name = 'Cubeta LSH'
+        verbose_name_plural = 'Cubetas LSH'
+        indexes = [
+            models.Index(fields=['key', 'post'], name='blog_minhashbucket_key_idx'),
+        ]
+
+class HotScoreState(models.Model):
+    """
+    Fila única con el instante al que están referidas las puntuaciones de
+    tendencia (ver blog/trending.py): el último reescalado masivo.
+    """
+    decayed_at = models.DateTimeField(verbose_name='Último reescalado')
+
+    class Meta:
+        verbose_name = 'Estado de tendencias'
+        verbose_name_plural = 'Estado de tendencias'
+
+class UploadedImage(models.Model):
+    """
+    Imagen subida con CKEditor y cola de su optimización (ver blog/images.py):
+    pendiente mientras processed_at esté vacío
+    """
+    path = models.CharField(max_length=255, unique=True, verbose_name='Ruta')
+    width = models.PositiveIntegerField(null=True, blank=True, verbose_name='Ancho')
+    height = models.PositiveIntegerField(null=True, blank=True, verbose_name='Alto')
+    # [[ruta, ancho], ...] de menor a mayor, sin contar la propia imagen
+    variants = models.JSONField(default=list, blank=True, verbose_name='Variantes')
+    created_date = models.DateTimeField(auto_now_add=True, verbose_name='Fecha de subida')
+    processed_at = models.DateTimeField(null=True, blank=True, verbose_name='Fecha de optimización')
+
+    class Meta:
+        verbose_name = 'Imagen subida'
+        verbose_name_plural = 'Imágenes subidas'
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(processed_at__isnull=True), name='blog_upload_pending_idx'),
+        ]
+
+    def __str__(self):
+        return self.path
@@ -0,0 +1,163 @@
+"""
+Perfilado de peticiones bajo demanda (ver ProfilingMiddleware).
+
+Escribe dos ficheros por petición perfilada en BLOG_PROFILE_DIR:
+
+* `<nombre>.prof`: estadísticas de cProfile (pstats, snakeviz...); sólo
+  con el perfilador 'cprofile'.
+* `<nombre>.collapsed`: pilas colapsadas ("a;b;c <muestras>" por línea)
+  que entienden flamegraph.pl y speedscope.
+"""
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.utils.text import slugify
+
+PROFILERS = ('cprofile', 'sampling')
+
+
+def get_profile_dir():
+    return str(getattr(settings, 'BLOG_PROFILE_DIR', settings.BASE_DIR / 'profiles'))
+
+
+def frame_label(filename, lineno, name):
+    """Etiqueta corta de una función: ruta relativa al proyecto o a site-packages"""
+    if filename.startswith('<'):
+        return name
+    base = str(settings.BASE_DIR)
+    if filename.startswith(base):
+        filename = os.path.relpath(filename, base)
+    elif 'site-packages' in filename:
+        filename = filename.split('site-packages' + os.sep, 1)[1]
+    else:
+        filename = os.path.basename(filename)
+    return f'{name} ({filename}:{lineno})'
+
+
+class SamplingProfiler:
+    """
+    Muestrea la pila del hilo de la petición cada `interval` segundos desde
+    otro hilo. Penaliza mucho menos que cProfile, pero sólo da pilas
+    colapsadas (en número de muestras), no un fichero .prof. La resolución
+    real está limitada por sys.getswitchinterval() (5 ms por defecto).
+
+    Empieza por el hilo que lo crea; con ASGI la vista puede ejecutarse en
+    otro, así que ProfilingMiddleware.process_view llama a
+    follow_current_thread() desde el hilo de la vista.
+    """
+
+    name = 'sampling'
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='blog-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def follow_current_thread(self):
+        """Muestrea a partir de ahora el hilo que llama"""
+        self.thread_id = threading.get_ident()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[self._collapse(frame)] += 1
+
+    @staticmethod
+    def _collapse(frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(frame_label(code.co_filename, code.co_firstlineno, code.co_name))
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
+
+    def write(self, path):
+        write_collapsed(f'{path}.collapsed', self.samples)
+
+    def top(self, limit=15):
+        """Funciones en las que más muestras cayeron (tiempo propio)"""
+        leaves = Counter()
+        for stack, count in self.samples.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        return '\n'.join(
+            f'{count * 100 / total:5.1f}%  {label}' for label, count in leaves.most_common(limit)
+        )
+
+
+class CProfileProfiler:
+    """
+    cProfile alrededor de la petición: tiempos exactos por función (.prof).
+    cProfile no guarda pilas completas, así que las pilas colapsadas salen
+    de un SamplingProfiler que se ejecuta a la vez. cProfile sólo ve el hilo
+    en el que se activa: con ASGI el .prof cubre los middlewares y no una
+    vista síncrona que corra en otro hilo; para esa vista, mejor 'sampling'.
+    """
+
+    name = 'cprofile'
+
+    def __init__(self, interval=0.001):
+        self.profile = cProfile.Profile()
+        self.sampler = SamplingProfiler(interval)
+
+    def start(self):
+        self.sampler.start()
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        self.sampler.stop()
+
+    def follow_current_thread(self):
+        self.sampler.follow_current_thread()
+
+    def write(self, path):
+        self.profile.dump_stats(f'{path}.prof')
+        self.sampler.write(path)
+
+    def top(self, limit=15):
+        output = io.StringIO()
+        pstats.Stats(self.profile, stream=output).sort_stats('cumulative').print_stats(limit)
+        return output.getvalue()
+
+
+def write_collapsed(path, collapsed):
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, value in sorted(collapsed.items()):
+            f.write(f'{stack} {value}\n')
+
+
+def create_profiler(kind=None):
+    kind = kind or getattr(settings, 'BLOG_PROFILER', 'cprofile')
+    interval = getattr(settings, 'BLOG_PROFILE_SAMPLING_INTERVAL', 0.001)
+    if kind == 'sampling':
+        return SamplingProfiler(interval)
+    return CProfileProfiler(interval)
+
+
+def profile_path(request, elapsed_ms):
+    """Ruta base (sin extensión) del perfil de una petición"""
+    directory = get_profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    path_slug = slugify(request.path.replace('/', '-')) or 'root'
+    name = f'{stamp}-{int(time.time() * 1000) % 1000:03d}-{request.method.lower()}-{path_slug[:60]}-{elapsed_ms:.0f}ms'
+    return os.path.join(directory, name)
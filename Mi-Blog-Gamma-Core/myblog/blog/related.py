@@ -0,0 +1,206 @@
+"""
+Posts relacionados por etiquetas (ver el comando compute_related_posts).
+
+La similitud entre dos posts es un Jaccard ponderado por IDF:
+
+    sim(a, b) = Σ idf(t), t ∈ A∩B  /  Σ idf(t), t ∈ A∪B
+    idf(t) = log(1 + N / df(t))
+
+de modo que compartir una etiqueta rara pesa más que compartir una que
+lleva medio blog. Los candidatos de cada post salen de las listas de posts
+por etiqueta (índice invertido), así que nunca se compara con todo el
+archivo; las etiquetas con más de `max_postings` posts no generan
+candidatos, sólo suman a los que ya salieron por otra etiqueta.
+"""
+import heapq
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Count, Min
+from taggit.models import TaggedItem
+
+from .models import Post, RelatedPost, StaleRelatedPost
+
+
+def get_top_k():
+    return getattr(settings, 'BLOG_RELATED_POSTS', 5)
+
+
+def chunked(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class TagSimilarity:
+    """
+    Etiquetas de todos los posts publicados, cargadas en memoria. Los posts
+    con el mismo conjunto de etiquetas tienen la misma similitud con todos
+    los demás, así que se puntúa por grupos (hay muchos menos grupos que
+    posts) y sólo al final se reparte entre los posts de cada grupo, de más
+    reciente a más antiguo.
+    """
+
+    def __init__(self, max_postings=1000):
+        self.max_postings = max_postings
+        self.dates = dict(
+            Post.objects.filter(published=True).values_list('id', 'published_date').iterator(chunk_size=5000)
+        )
+        tags = defaultdict(set)
+        tagged = TaggedItem.objects.filter(content_type=ContentType.objects.get_for_model(Post)) \
+            .values_list('object_id', 'tag_id')
+        for post_id, tag_id in tagged.iterator(chunk_size=5000):
+            if post_id in self.dates:
+                tags[post_id].add(tag_id)
+
+        self.group_of = {post_id: frozenset(tag_ids) for post_id, tag_ids in tags.items()}
+        groups = defaultdict(list)
+        df = defaultdict(int)
+        for post_id, group in self.group_of.items():
+            groups[group].append(post_id)
+            for tag_id in group:
+                df[tag_id] += 1
+        newest_first = lambda post_id: (self.dates[post_id], post_id)
+        self.groups = {group: sorted(post_ids, key=newest_first, reverse=True) for group, post_ids in groups.items()}
+        self.postings = defaultdict(list)
+        for group in self.groups:
+            for tag_id in group:
+                self.postings[tag_id].append(group)
+        total = len(self.group_of)
+        self.idf = {tag_id: math.log(1 + total / count) for tag_id, count in df.items()}
+        self.norms = {group: sum(self.idf[tag_id] for tag_id in group) for group in self.groups}
+
+    def group_scores(self, group):
+        """Similitud del grupo con cada grupo candidato (sin ceros)"""
+        rare = [tag_id for tag_id in group if len(self.postings[tag_id]) <= self.max_postings]
+        common = [tag_id for tag_id in group if tag_id not in rare]
+        shared = defaultdict(float)
+        if rare:
+            for tag_id in rare:
+                weight = self.idf[tag_id]
+                for other in self.postings[tag_id]:
+                    shared[other] += weight
+            for tag_id in common:
+                weight = self.idf[tag_id]
+                for other in shared:
+                    if tag_id in other:
+                        shared[other] += weight
+        else:
+            # Sólo etiquetas muy comunes: candidatos entre los primeros grupos de la más rara
+            rarest = min(group, key=lambda tag_id: len(self.postings[tag_id]))
+            for other in self.postings[rarest][:self.max_postings]:
+                shared[other] = sum(self.idf[tag_id] for tag_id in group & other)
+        norm = self.norms[group]
+        return {other: weight / (norm + self.norms[other] - weight) for other, weight in shared.items()}
+
+    def scores(self, post_id):
+        """Similitud de `post_id` con cada post candidato"""
+        group = self.group_of.get(post_id)
+        if group is None:
+            return {}
+        scores = {
+            other: score
+            for other_group, score in self.group_scores(group).items()
+            for other in self.groups[other_group]
+        }
+        scores.pop(post_id, None)
+        return scores
+
+    def best_groups(self, group, k):
+        """
+        [(score, [grupos])] de mayor a menor: los k + 1 mejores grupos (así
+        hay k posts aunque uno sea el propio) y los empatados con el último
+        """
+        scores = self.group_scores(group)
+        if len(scores) > k + 1:
+            threshold = heapq.nlargest(k + 1, scores.values())[-1]
+            scores = {other: score for other, score in scores.items() if score >= threshold}
+        by_score = defaultdict(list)
+        for other, score in scores.items():
+            by_score[score].append(other)
+        return sorted(by_score.items(), reverse=True)
+
+    def top(self, post_id, k, best_groups=None):
+        """[(related_id, score)] de mayor a menor similitud; a igualdad, el más reciente"""
+        group = self.group_of.get(post_id)
+        if group is None:
+            return []
+        if best_groups is None:
+            best_groups = self.best_groups(group, k)
+        newest_first = lambda other: (self.dates[other], other)
+        result = []
+        for score, tied in best_groups:
+            wanted = k - len(result)
+            if not wanted:
+                break
+            candidates = [
+                other for other_group in tied for other in self.groups[other_group][:wanted + 1] if other != post_id
+            ]
+            result.extend((other, score) for other in heapq.nlargest(wanted, candidates, key=newest_first))
+        return result
+
+
+def save_related(lists, batch_size=500):
+    """Sustituye las listas de los posts de `lists` ({post_id: [(related_id, score)]})"""
+    for batch in chunked(lists, batch_size):
+        with transaction.atomic():
+            RelatedPost.objects.filter(post_id__in=batch).delete()
+            RelatedPost.objects.bulk_create([
+                RelatedPost(post_id=post_id, related_id=related_id, rank=rank, score=score)
+                for post_id in batch
+                for rank, (related_id, score) in enumerate(lists[post_id], start=1)
+            ])
+
+
+def compute_all(k=None, max_postings=1000, batch_size=500):
+    """Recalcula todos los posts y vacía la cola de pendientes"""
+    k = k or get_top_k()
+    stale = list(StaleRelatedPost.objects.values_list('post_id', flat=True))
+    model = TagSimilarity(max_postings)
+    best_groups = {group: model.best_groups(group, k) for group in model.groups}
+    lists = {
+        post_id: model.top(post_id, k, best_groups.get(model.group_of.get(post_id)))
+        for post_id in model.dates
+    }
+    save_related(lists, batch_size)
+    # Posts que ya no están publicados
+    RelatedPost.objects.exclude(post__published=True).delete()
+    StaleRelatedPost.objects.filter(post_id__in=stale).delete()
+    return len(lists)
+
+
+def compute_stale(k=None, max_postings=1000, batch_size=500):
+    """
+    Recalcula sólo lo que puede haber cambiado desde la última vez: los posts
+    pendientes, los que los tenían en su lista y aquellos en cuya lista
+    entrarían ahora. Los IDF se toman del momento actual, así que conviene
+    lanzar de vez en cuando el cálculo completo.
+    """
+    k = k or get_top_k()
+    stale = set(StaleRelatedPost.objects.values_list('post_id', flat=True))
+    if not stale:
+        return 0
+    model = TagSimilarity(max_postings)
+
+    affected = set(RelatedPost.objects.filter(related_id__in=stale).values_list('post_id', flat=True))
+    for post_id in stale & model.dates.keys():
+        candidates = model.scores(post_id)
+        for batch in chunked(candidates, batch_size):
+            rows = RelatedPost.objects.filter(post_id__in=batch).order_by() \
+                .values_list('post_id').annotate(Min('score'), Count('id'))
+            current = {other: (lowest, count) for other, lowest, count in rows}
+            for other in batch:
+                lowest, count = current.get(other, (0, 0))
+                if count < k or candidates[other] >= lowest:
+                    affected.add(other)
+
+    lists = {}
+    for post_id in (affected | stale) & model.dates.keys():
+        lists[post_id] = model.top(post_id, k)
+    save_related(lists, batch_size)
+    RelatedPost.objects.filter(post_id__in=stale - model.dates.keys()).delete()
+    StaleRelatedPost.objects.filter(post_id__in=stale).delete()
+    return len(lists)
@@ -0,0 +1,351 @@
+"""
+HTML publicado de los posts, generado al guardar (Post.render_content).
+
+CKEditor guarda lo que le manda el navegador, así que `content` no es de
+fiar. Al guardar se pasa por un HTMLParser que sólo deja las etiquetas y
+atributos de ALLOWED_TAGS y URLs http(s), mailto o relativas; lo que hay
+dentro de <script>, <style> y compañía se descarta entero y del resto de
+etiquetas desconocidas se queda sólo el texto. Las etiquetas que queden
+abiertas se cierran, para que un post no descuadre la página. De paso:
+
+* las imágenes llevan loading="lazy", decoding="async" y width/height (de
+  sus atributos, de su style o del propio fichero si está en MEDIA_ROOT),
+  para que el navegador reserve su hueco antes de descargarlas; las subidas
+  con CKEditor que ya pasaron por blog/images.py llevan además srcset y
+  sizes con sus variantes;
+* los h2-h4 reciben un id único y forman el índice del post;
+* del texto plano salen el resumen de listas, RSS y correos y los minutos
+  de lectura.
+
+Las vistas sólo leen rendered_html, toc, summary y reading_time; nada se
+transforma por petición. Si cambian estas reglas, `python manage.py render_posts` rehace
+los posts guardados.
+"""
+import math
+import os
+import re
+from html import escape
+from html.parser import HTMLParser
+from urllib.parse import unquote, urlsplit
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils.text import Truncator, slugify
+from PIL import Image
+
+# etiqueta -> atributos permitidos
+ALLOWED_TAGS = {
+    'a': {'href', 'title', 'target'},
+    'abbr': {'title'},
+    'b': set(),
+    'blockquote': set(),
+    'br': set(),
+    'caption': set(),
+    'code': set(),
+    'del': set(),
+    'div': set(),
+    'em': set(),
+    'figcaption': set(),
+    'figure': set(),
+    'h1': set(),
+    'h2': set(),
+    'h3': set(),
+    'h4': set(),
+    'h5': set(),
+    'h6': set(),
+    'hr': set(),
+    'i': set(),
+    'img': {'src', 'alt', 'title', 'width', 'height'},
+    'li': set(),
+    'ol': {'start'},
+    'p': set(),
+    'pre': set(),
+    's': set(),
+    'small': set(),
+    'span': set(),
+    'strike': set(),
+    'strong': set(),
+    'sub': set(),
+    'sup': set(),
+    'table': set(),
+    'tbody': set(),
+    'td': {'colspan', 'rowspan'},
+    'tfoot': set(),
+    'th': {'colspan', 'rowspan', 'scope'},
+    'thead': set(),
+    'tr': set(),
+    'u': set(),
+    'ul': set(),
+}
+VOID_TAGS = {'br', 'hr', 'img'}
+INLINE_TAGS = {'a', 'abbr', 'b', 'code', 'del', 'em', 'i', 's', 'small', 'span', 'strike', 'strong', 'sub', 'sup', 'u'}
+# Se descartan con todo lo que tengan dentro
+DROP_CONTENT_TAGS = {
+    'script', 'style', 'iframe', 'object', 'embed', 'template', 'noscript', 'svg', 'math', 'textarea', 'select',
+    'head', 'title',
+}
+URL_ATTRIBUTES = {'href', 'src'}
+NUMERIC_ATTRIBUTES = {'width', 'height', 'colspan', 'rowspan', 'start'}
+ALLOWED_SCHEMES = {'http', 'https', 'mailto'}
+TOC_TAGS = {'h2', 'h3', 'h4'}
+SUMMARY_WORDS = 30
+WORDS_PER_MINUTE = 200
+
+# El navegador ignora estos caracteres dentro de un esquema ("java\tscript:")
+URL_IGNORED_RE = re.compile(r'[\x00-\x20\x7f]+')
+STYLE_SIZE_RE = re.compile(r'(?:^|;)\s*(width|height)\s*:\s*(\d+)(?:\.\d+)?px', re.IGNORECASE)
+NUMBER_RE = re.compile(r'^\s*(\d+)(?:px)?\s*$')
+IMG_SRC_RE = re.compile(r'<img\b[^>]*?\ssrc\s*=\s*["\']?([^"\'\s>]+)', re.IGNORECASE)
+
+
+def safe_url(value):
+    """La URL si es relativa, http(s) o mailto; None en otro caso"""
+    url = URL_IGNORED_RE.sub('', value)
+    try:
+        scheme = urlsplit(url).scheme
+    except ValueError:
+        return None
+    if scheme and scheme.lower() not in ALLOWED_SCHEMES:
+        return None
+    return value.strip()
+
+
+def image_sources(content):
+    """Los src de las <img> de `content`, sin sanear (para buscar sus variantes antes de renderizar)"""
+    return IMG_SRC_RE.findall(content or '')
+
+
+def media_path(src):
+    """Ruta relativa a MEDIA_ROOT de una URL de MEDIA_URL, o None"""
+    media_url = settings.MEDIA_URL
+    if not media_url or not src.startswith(media_url):
+        return None
+    return unquote(src[len(media_url):].split('?')[0])
+
+
+def media_image_size(src):
+    """(ancho, alto) de una imagen subida a MEDIA_ROOT, o None"""
+    relative = media_path(src)
+    if relative is None:
+        return None
+    root = os.path.realpath(settings.MEDIA_ROOT)
+    path = os.path.realpath(os.path.join(root, relative))
+    if not path.startswith(root + os.sep):
+        return None
+    try:
+        with Image.open(path) as image:
+            return image.size
+    except (OSError, ValueError):
+        return None
+
+
+def image_attributes(attrs, style=None, images=None):
+    """
+    Añade a una <img> sus dimensiones (si se pueden saber), la carga diferida
+    y, si está en `images` (ver images.responsive_images), srcset y sizes
+    """
+    size = {name: int(attrs[name]) for name in ('width', 'height') if name in attrs}
+    for name, value in STYLE_SIZE_RE.findall(style or ''):
+        size.setdefault(name.lower(), int(value))
+    uploaded = (images or {}).get(media_path(attrs['src']))
+    if len(size) < 2:
+        if uploaded:
+            natural = (uploaded['width'], uploaded['height'])
+        else:
+            natural = media_image_size(attrs['src'])
+        if natural and all(natural):
+            natural_width, natural_height = natural
+            if 'width' in size:
+                size['height'] = round(size['width'] * natural_height / natural_width)
+            elif 'height' in size:
+                size['width'] = round(size['height'] * natural_width / natural_height)
+            else:
+                size = {'width': natural_width, 'height': natural_height}
+    for name in ('width', 'height'):
+        if size.get(name):
+            attrs[name] = str(size[name])
+    if uploaded and len(uploaded['srcset']) > 1:
+        # Como mucho se pinta al ancho indicado; en pantallas más estrechas, a todo el ancho
+        shown = size.get('width') or uploaded['width']
+        attrs['srcset'] = ', '.join(f'{url} {width}w' for url, width in uploaded['srcset'])
+        attrs['sizes'] = f'(max-width: {shown}px) 100vw, {shown}px'
+    attrs['loading'] = 'lazy'
+    attrs['decoding'] = 'async'
+    return attrs
+
+
+def clean_attributes(tag, attrs, images=None):
+    """Atributos permitidos de una etiqueta, o None si hay que quitarla"""
+    allowed = ALLOWED_TAGS[tag]
+    clean = {}
+    style = None
+    for name, value in attrs:
+        if name == 'style':
+            style = value
+        if name not in allowed or value is None:
+            continue
+        if name in URL_ATTRIBUTES:
+            value = safe_url(value)
+        elif name in NUMERIC_ATTRIBUTES:
+            match = NUMBER_RE.match(value)
+            value = match.group(1) if match else None
+        elif name == 'target' and value != '_blank':
+            value = None
+        if value is not None:
+            clean[name] = value
+    if tag == 'a' and 'target' in clean:
+        clean['rel'] = 'noopener noreferrer'
+    if tag == 'img':
+        if not clean.get('src'):
+            return None
+        image_attributes(clean, style, images)
+    return clean
+
+
+def start_tag(tag, attrs):
+    return '<%s%s>' % (tag, ''.join(f' {name}="{escape(value)}"' for name, value in attrs.items()))
+
+
+class Renderer(HTMLParser):
+
+    def __init__(self, images=None):
+        super().__init__(convert_charrefs=True)
+        self.images = images
+        self.parts = []
+        self.text = []
+        self.toc = []
+        self.open_tags = []
+        self.anchors = set()
+        self.dropping = None     # (etiqueta, profundidad) mientras se descarta un bloque
+        self.heading = None      # (posición en parts, etiqueta, texto) del encabezado abierto
+
+    def handle_starttag(self, tag, attrs):
+        if self.dropping:
+            dropped, depth = self.dropping
+            if tag == dropped:
+                self.dropping = (dropped, depth + 1)
+            return
+        if tag in DROP_CONTENT_TAGS:
+            self.dropping = (tag, 1)
+            return
+        if tag not in ALLOWED_TAGS:
+            return
+        attrs = clean_attributes(tag, attrs, self.images)
+        if attrs is None:
+            return
+        if tag not in INLINE_TAGS:
+            self.text.append(' ')
+        if tag in VOID_TAGS:
+            self.parts.append(start_tag(tag, attrs))
+            return
+        self.open_tags.append(tag)
+        if tag in TOC_TAGS and self.heading is None:
+            # La etiqueta de apertura se escribe al cerrar, cuando ya se sabe el id
+            self.heading = (len(self.parts), tag, [])
+            self.parts.append(None)
+        else:
+            self.parts.append(start_tag(tag, attrs))
+
+    def handle_endtag(self, tag):
+        if self.dropping:
+            dropped, depth = self.dropping
+            if tag == dropped:
+                self.dropping = (dropped, depth - 1) if depth > 1 else None
+            return
+        if tag not in self.open_tags:
+            return
+        while True:
+            current = self.open_tags.pop()
+            self.close_tag(current)
+            if current == tag:
+                break
+
+    def handle_data(self, data):
+        if self.dropping:
+            return
+        self.parts.append(escape(data, quote=False))
+        self.text.append(data)
+        if self.heading is not None:
+            self.heading[2].append(data)
+
+    def close(self):
+        super().close()
+        while self.open_tags:
+            self.close_tag(self.open_tags.pop())
+
+    def close_tag(self, tag):
+        if self.heading is not None and self.heading[1] == tag:
+            position, _, chunks = self.heading
+            title = ' '.join(''.join(chunks).split())
+            anchor = self.unique_anchor(slugify(title) or 'seccion')
+            self.parts[position] = f'<{tag} id="{anchor}">'
+            self.toc.append({'level': int(tag[1]), 'id': anchor, 'title': title})
+            self.heading = None
+        self.parts.append(f'</{tag}>')
+        if tag not in INLINE_TAGS:
+            self.text.append(' ')
+
+    def unique_anchor(self, base):
+        anchor, n = base, 1
+        while anchor in self.anchors:
+            n += 1
+            anchor = f'{base}-{n}'
+        self.anchors.add(anchor)
+        return anchor
+
+
+def render(content, images=None):
+    """
+    (HTML saneado, índice [{level, id, title}], texto plano) de `content`;
+    `images` son las imágenes optimizadas que enlaza, por ruta en MEDIA
+    """
+    renderer = Renderer(images)
+    renderer.feed(content or '')
+    renderer.close()
+    return ''.join(renderer.parts), renderer.toc, ' '.join(''.join(renderer.text).split())
+
+
+def summarize(text, excerpt=''):
+    """El resumen escrito por el autor o, si no hay, el principio del texto"""
+    return excerpt.strip() or Truncator(text).words(SUMMARY_WORDS)
+
+
+def reading_time(text):
+    """Minutos de lectura, al menos uno"""
+    return max(1, math.ceil(len(text.split()) / WORDS_PER_MINUTE))
+
+
+def rebuild(posts, batch_size=500, image_lookup=None):
+    """
+    Vuelve a generar rendered_html, toc, summary y reading_time de `posts` (un queryset de
+    Post, también el histórico de una migración) por lotes y sin señales; `image_lookup(content)`
+    da las imágenes optimizadas de cada post (images.responsive_images)
+    """
+    model = posts.model
+    connection = connections[posts.db]
+    quote = connection.ops.quote_name
+    toc_field = model._meta.get_field('toc')
+    sql = 'UPDATE {} SET {} = %s, {} = %s, {} = %s, {} = %s WHERE {} = %s'.format(
+        quote(model._meta.db_table), quote('rendered_html'), quote('toc'), quote('summary'), quote('reading_time'),
+        quote('id'),
+    )
+    rows = posts.order_by('id').values_list('id', 'content', 'excerpt')
+    count = 0
+    batch = []
+    for post_id, content, excerpt in rows.iterator(chunk_size=batch_size):
+        html, toc, text = render(content, image_lookup(content) if image_lookup else None)
+        batch.append((
+            html, toc_field.get_db_prep_save(toc, connection), summarize(text, excerpt), reading_time(text), post_id,
+        ))
+        if len(batch) >= batch_size:
+            count += _write(connection, sql, batch)
+            batch = []
+    if batch:
+        count += _write(connection, sql, batch)
+    return count
+
+
+def _write(connection, sql, batch):
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.executemany(sql, batch)
+    return len(batch)
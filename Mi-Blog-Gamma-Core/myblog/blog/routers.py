@@ -0,0 +1,133 @@
+import os
+import sqlite3
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Alias de lectura activo para la petición actual (None = usar el primario)
+_read_alias = ContextVar('blog_read_alias', default=None)
+# Marca si la petición actual escribió en la base de datos
+_wrote = ContextVar('blog_wrote', default=False)
+
+STICKY_COOKIE_NAME = 'blog_last_write'
+
+# Apps cuyos modelos nunca se leen desde la réplica (cambian en cada petición)
+PRIMARY_ONLY_APPS = {'sessions'}
+
+
+def get_read_database():
+    """Devuelve el alias configurado para lecturas o None si no hay réplica"""
+    alias = getattr(settings, 'BLOG_READ_DATABASE', None)
+    if not alias or alias not in settings.DATABASES:
+        return None
+    # En tests la réplica es un espejo de 'default': leer directamente del
+    # primario evita abrir una segunda conexión fuera de la transacción del test
+    settings_dict = connections[alias].settings_dict
+    mirror = settings_dict.get('TEST', {}).get('MIRROR')
+    if mirror:
+        return mirror
+    # Una réplica SQLite que aún no se ha copiado no tiene tablas
+    if settings_dict['ENGINE'].endswith('sqlite3') and not os.path.exists(settings_dict['NAME']):
+        return None
+    return alias
+
+
+def get_sticky_seconds():
+    return getattr(settings, 'BLOG_READ_YOUR_WRITES_SECONDS', 5)
+
+
+def is_sticky(request, now=None):
+    """Indica si el usuario escribió hace poco y debe leer del primario"""
+    value = request.COOKIES.get(STICKY_COOKIE_NAME)
+    if not value:
+        return False
+    try:
+        last_write = float(value)
+    except ValueError:
+        return False
+    now = time.time() if now is None else now
+    return now - last_write < get_sticky_seconds()
+
+
+def activate_read_database(alias):
+    """Envía las lecturas de la petición actual a `alias`; devuelve el alias anterior"""
+    previous = _read_alias.get()
+    _read_alias.set(alias)
+    return previous
+
+
+def deactivate_read_database(previous):
+    # No se usa ContextVar.reset(): con ASGI process_view y __call__ del
+    # middleware se ejecutan en contextos distintos y el token no es válido
+    _read_alias.set(previous)
+
+
+def reset_write_flag():
+    return _wrote.set(False)
+
+
+def restore_write_flag(token):
+    _wrote.reset(token)
+
+
+def has_written():
+    return _wrote.get()
+
+
+class PrimaryReplicaRouter:
+    """
+    Router de lectura/escritura.
+
+    Las escrituras siempre van a 'default'. Las lecturas sólo van a la réplica
+    cuando el middleware activó un alias de lectura para la petición en curso
+    (vistas de solo lectura y usuarios sin escrituras recientes).
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        if alias is None or model._meta.app_label in PRIMARY_ONLY_APPS:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primario y réplica contienen los mismos datos
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # La réplica recibe el esquema junto con los datos al refrescarla
+        alias = getattr(settings, 'BLOG_READ_DATABASE', None)
+        if alias and db == alias:
+            return False
+        return None
+
+
+def refresh_replica(source=DEFAULT_DB_ALIAS, target=None):
+    """
+    Copia la base de datos SQLite `source` sobre la réplica usando la API de
+    backup de SQLite. `target` es la ruta del fichero destino; por defecto el
+    NAME del alias configurado en BLOG_READ_DATABASE.
+    """
+    source_connection = connections[source]
+    if source_connection.vendor != 'sqlite':
+        raise ImproperlyConfigured('refresh_replica sólo admite bases de datos SQLite.')
+
+    if target is None:
+        alias = getattr(settings, 'BLOG_READ_DATABASE', None)
+        if not alias or alias not in settings.DATABASES:
+            raise ImproperlyConfigured('BLOG_READ_DATABASE no apunta a un alias de DATABASES.')
+        target = settings.DATABASES[alias]['NAME']
+
+    source_connection.ensure_connection()
+    destination = sqlite3.connect(str(target))
+    try:
+        source_connection.connection.backup(destination)
+    finally:
+        destination.close()
+
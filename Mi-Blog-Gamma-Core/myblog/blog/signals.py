@@ -0,0 +1,177 @@
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from taggit.models import Tag, TaggedItem
+
+from . import duplicates, fulltext, suggest, tag_bitmaps, trending
+from .models import (
+    Comment, CommentVote, Post, Reaction, RelatedPost, Review, StaleRelatedPost, TagStats, get_comment_max_depth,
+)
+
+
+def update_tag_index(post_id):
+    # Tras el commit: un rollback no debe dejar rastro en el índice en memoria
+    transaction.on_commit(lambda: tag_bitmaps.index.update_post(post_id))
+
+
+def update_suggestions(post_id=None, tag_ids=()):
+    """Título del post y número de posts de sus etiquetas en el autocompletado, tras el commit"""
+    tag_ids = list(tag_ids)
+
+    def apply():
+        if post_id is not None:
+            suggest.index.update_post(post_id)
+        suggest.index.update_tags(tag_ids)
+    transaction.on_commit(apply)
+
+
+@receiver(m2m_changed, sender=TaggedItem)
+def update_tag_stats_on_tag_change(sender, instance, action, pk_set, **kwargs):
+    """Etiquetas añadidas o quitadas de un post (post.tags.add/remove/set/clear)"""
+    if not isinstance(instance, Post):
+        return
+    if action == 'pre_clear':
+        instance._tag_ids_before_clear = list(instance.tags.values_list('id', flat=True))
+    elif action == 'post_clear':
+        tag_ids = getattr(instance, '_tag_ids_before_clear', ())
+        TagStats.refresh(tag_ids)
+        update_tag_index(instance.pk)
+        update_suggestions(tag_ids=tag_ids)
+        StaleRelatedPost.mark([instance.pk])
+    elif action in ('post_add', 'post_remove') and pk_set:
+        TagStats.refresh(pk_set)
+        update_tag_index(instance.pk)
+        update_suggestions(tag_ids=pk_set)
+        StaleRelatedPost.mark([instance.pk])
+
+
+@receiver(pre_save, sender=Post)
+def render_loaded_post(sender, instance, raw=False, **kwargs):
+    # loaddata no pasa por Post.save() y los fixtures no traen el HTML generado
+    if raw and not instance.rendered_html:
+        instance.render_content()
+
+
+@receiver(post_save, sender=Post)
+def update_tag_stats_on_post_save(sender, instance, created, raw=False, **kwargs):
+    """Publicar, despublicar o cambiar la fecha afecta a todas sus etiquetas"""
+    if raw:
+        return
+    update_tag_index(instance.pk)
+    duplicates.index_post(instance)
+    if created:
+        # Un post nuevo aún no tiene etiquetas: llegan después por m2m_changed
+        update_suggestions(instance.pk)
+        return
+    tag_ids = list(instance.tags.values_list('id', flat=True))
+    TagStats.refresh(tag_ids)
+    update_suggestions(instance.pk, tag_ids)
+    StaleRelatedPost.mark([instance.pk])
+
+
+@receiver(pre_delete, sender=Post)
+def remember_tags_before_post_delete(sender, instance, **kwargs):
+    instance._tag_ids_before_delete = list(instance.tags.values_list('id', flat=True))
+    # Sus filas se borran en cascada: los que lo tenían en su lista quedan cortos
+    StaleRelatedPost.mark(RelatedPost.objects.filter(related=instance).values_list('post_id', flat=True))
+
+
+@receiver(post_delete, sender=Post)
+def update_tag_stats_on_post_delete(sender, instance, **kwargs):
+    tag_ids = getattr(instance, '_tag_ids_before_delete', ())
+    TagStats.refresh(tag_ids)
+    post_id = instance.pk
+    transaction.on_commit(lambda: tag_bitmaps.index.remove_post(post_id))
+    transaction.on_commit(lambda: suggest.index.remove_post(post_id))
+    update_suggestions(tag_ids=tag_ids)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def reset_tag_index_on_tag_change(sender, instance, **kwargs):
+    """El índice va por slug: renombrar o borrar una etiqueta obliga a reconstruirlo"""
+    transaction.on_commit(tag_bitmaps.index.reset)
+    # El autocompletado va por id: basta con volver a leerla
+    update_suggestions(tag_ids=[instance.pk])
+
+
+@receiver(post_save, sender=User)
+def update_user_suggestions(sender, instance, raw=False, **kwargs):
+    """Alta, cambio de nombre o baja de un usuario, y su último acceso (orden de las menciones)"""
+    if raw:
+        return
+    user_id = instance.pk
+    transaction.on_commit(lambda: suggest.index.update_user(user_id))
+
+
+@receiver(post_delete, sender=User)
+def remove_user_suggestions(sender, instance, **kwargs):
+    user_id = instance.pk
+    transaction.on_commit(lambda: suggest.index.remove_user(user_id))
+
+
+ENGAGEMENT_KINDS = {Reaction: 'reaction', Comment: 'comment', Review: 'review', CommentVote: 'comment_vote'}
+
+
+@receiver(post_save, sender=Reaction)
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Review)
+@receiver(post_save, sender=CommentVote)
+def update_hot_score_on_engagement(sender, instance, created, raw=False, **kwargs):
+    """Cada interacción nueva sube la puntuación de tendencia de su post"""
+    if not created or raw:
+        return
+    post_id = instance.comment.post_id if sender is CommentVote else instance.post_id
+    trending.record(post_id, ENGAGEMENT_KINDS[sender], instance.created_date)
+
+
+@receiver(pre_save, sender=Comment)
+def place_comment_in_thread(sender, instance, raw=False, **kwargs):
+    """Nivel de una respuesta nueva; por debajo del máximo se cuelga del ancestro de ese nivel"""
+    if raw or not instance._state.adding:
+        return
+    instance._parent_path = ''
+    if instance.parent_id is None:
+        instance.depth = 0
+        return
+    parent = instance.parent
+    max_depth = get_comment_max_depth()
+    if parent.depth >= max_depth:
+        segments = parent.path.split(Comment.PATH_SEP)[:max_depth]
+        instance.parent_id = int(segments[-1])
+        instance._parent_path = Comment.PATH_SEP.join(segments)
+    else:
+        instance._parent_path = parent.path
+    instance.depth = min(parent.depth, max_depth - 1) + 1
+
+
+@receiver(post_save, sender=Comment)
+def update_thread_on_comment_save(sender, instance, created, raw=False, **kwargs):
+    """Fija el path tras el INSERT (lleva el id) y mantiene reply_count de los ancestros"""
+    if raw:
+        return
+    if created:
+        instance.path = Comment.make_path(instance.pk, getattr(instance, '_parent_path', ''))
+        Comment.objects.filter(pk=instance.pk).update(path=instance.path, depth=instance.depth)
+        if instance.is_approved:
+            Comment.adjust_reply_counts(instance.ancestor_ids(), 1)
+    else:
+        was_approved = getattr(instance, '_approved_in_db', instance.is_approved)
+        if was_approved != instance.is_approved:
+            Comment.adjust_reply_counts(instance.ancestor_ids(), 1 if instance.is_approved else -1)
+    instance._approved_in_db = instance.is_approved
+
+
+@receiver(post_delete, sender=Comment)
+def update_thread_on_comment_delete(sender, instance, **kwargs):
+    # También llega por cada respuesta borrada en cascada
+    if instance.is_approved:
+        Comment.adjust_reply_counts(instance.ancestor_ids(), -1)
+
+
+@receiver(post_migrate)
+def restore_fulltext(sender, using, **kwargs):
+    # Una migración que rehace una tabla indexada se lleva los triggers de su índice
+    if sender.name == 'blog':
+        fulltext.install(connections[using])
@@ -0,0 +1,203 @@
+"""
+sitemap.xml por segmentos, generado en streaming y guardado en disco.
+
+django.contrib.sitemaps pagina con Paginator y monta cada página en
+memoria. Aquí cada sección (posts publicados, páginas de etiqueta) se
+parte en segmentos por tramos fijos de clave primaria: el segmento n de
+posts son los de id entre n * BLOG_SITEMAP_SEGMENT_SIZE y el siguiente.
+
+* /sitemap.xml es el índice: una consulta agrupada por segmento da cuántas
+  URLs tiene cada uno y su lastmod (el máximo de updated_date de sus
+  posts, o la última publicación de sus etiquetas). Se cachea
+  BLOG_SITEMAP_INDEX_TTL segundos.
+* /sitemap-<sección>-<n>.xml recorre su tramo con .iterator() y lo escribe
+  a la vez en la respuesta (StreamingHttpResponse) y en un fichero de
+  BLOG_SITEMAP_DIR cuyo nombre lleva la huella del segmento (número de
+  URLs, lastmod, un resumen de sus claves y slugs, y dominio). Mientras la
+  huella no cambie se sirve ese fichero; si cambia algo del segmento
+  cambia la huella y sólo ese segmento se regenera. El resumen recoge lo
+  que no mueve lastmod: una etiqueta renombrada (TagStats no se entera) o
+  un post despublicado a cambio de otro publicado.
+
+La memoria no depende del número de URLs: nunca hay más de un chunk de
+filas a la vez.
+"""
+import hashlib
+import os
+import uuid
+from contextlib import suppress
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Max
+from django.urls import reverse
+
+from .models import Post, TagStats
+
+# Tope del protocolo de sitemaps por fichero
+MAX_URLS = 50000
+CHUNK_SIZE = 2000
+SLUG_PLACEHOLDER = 'slug-placeholder'
+INDEX_CACHE_KEY = 'blog:sitemap:index'
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+URLSET_OPEN = '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+URLSET_CLOSE = '</urlset>\n'
+INDEX_OPEN = '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+INDEX_CLOSE = '</sitemapindex>\n'
+
+
+def get_segment_size():
+    return min(getattr(settings, 'BLOG_SITEMAP_SEGMENT_SIZE', 10000), MAX_URLS)
+
+
+def get_directory():
+    return getattr(settings, 'BLOG_SITEMAP_DIR', settings.BASE_DIR / 'sitemaps')
+
+
+def get_index_ttl():
+    return getattr(settings, 'BLOG_SITEMAP_INDEX_TTL', 600)
+
+
+class Section:
+    """Una sección del sitemap: qué filas, por qué clave se segmenta y qué URL da cada una"""
+
+    def __init__(self, queryset, key, slug, lastmod, url_name):
+        self.queryset = queryset
+        self.key = key
+        self.slug = slug
+        self.lastmod = lastmod
+        self.url_name = url_name
+
+    def segments(self):
+        """[(n, número de URLs, lastmod)] de los segmentos con alguna fila"""
+        rows = (
+            self.queryset().order_by()
+            .annotate(segment=F(self.key) / get_segment_size())
+            .values_list('segment')
+            .annotate(Count(self.key), Max(self.lastmod))
+            .order_by('segment')
+        )
+        return list(rows)
+
+    def rows(self, number):
+        """Filas de un segmento: un tramo de la clave primaria"""
+        size = get_segment_size()
+        return self.queryset().filter(**{
+            f'{self.key}__gte': number * size, f'{self.key}__lt': (number + 1) * size,
+        })
+
+    def fingerprint(self, number):
+        """
+        (número de URLs, lastmod, resumen de claves y slugs) de un segmento:
+        una pasada por su tramo que sólo lee tres columnas
+        """
+        count, lastmod, digest = 0, None, hashlib.sha1()
+        rows = self.rows(number).order_by(self.key).values_list(self.key, self.slug, self.lastmod)
+        for key, slug, modified in rows.iterator(chunk_size=CHUNK_SIZE):
+            count += 1
+            digest.update(f'{key} {slug}\n'.encode())
+            if modified and (lastmod is None or modified > lastmod):
+                lastmod = modified
+        return count, lastmod, digest.hexdigest()
+
+    def urls(self, number):
+        """(ruta, lastmod) de un segmento, en orden de clave y por chunks"""
+        # reverse() una sola vez: con millones de filas se nota
+        template = reverse(self.url_name, args=[SLUG_PLACEHOLDER])
+        rows = self.rows(number).order_by(self.key).values_list(self.slug, self.lastmod)
+        for slug, lastmod in rows.iterator(chunk_size=CHUNK_SIZE):
+            yield template.replace(SLUG_PLACEHOLDER, slug), lastmod
+
+
+SECTIONS = {
+    'posts': Section(
+        lambda: Post.objects.filter(published=True), 'id', 'slug', 'updated_date', 'blog:post_detail',
+    ),
+    'tags': Section(
+        lambda: TagStats.objects.all(), 'tag_id', 'tag__slug', 'last_published', 'blog:posts_by_tag',
+    ),
+}
+
+
+def format_lastmod(value):
+    return value.isoformat(timespec='seconds') if value else ''
+
+
+def url_entry(tag, loc, lastmod):
+    lastmod = f'<lastmod>{format_lastmod(lastmod)}</lastmod>' if lastmod else ''
+    return f'<{tag}><loc>{escape(loc)}</loc>{lastmod}</{tag}>\n'
+
+
+def index_entries():
+    """[(sección, n, lastmod)] de todos los segmentos; cacheado un rato"""
+    entries = cache.get(INDEX_CACHE_KEY)
+    if entries is None:
+        entries = [
+            (name, number, lastmod)
+            for name, section in SECTIONS.items()
+            for number, count, lastmod in section.segments()
+        ]
+        cache.set(INDEX_CACHE_KEY, entries, get_index_ttl())
+    return entries
+
+
+def render_index(base_url):
+    """Chunks del índice de sitemaps"""
+    yield XML_HEADER + INDEX_OPEN
+    for name, number, lastmod in index_entries():
+        loc = base_url + reverse('blog:sitemap_section', args=[name, number])
+        yield url_entry('sitemap', loc, lastmod)
+    yield INDEX_CLOSE
+
+
+def render_segment(base_url, section, number):
+    """Chunks de un segmento, de CHUNK_SIZE URLs"""
+    yield XML_HEADER + URLSET_OPEN
+    batch = []
+    for path, lastmod in section.urls(number):
+        batch.append(url_entry('url', base_url + path, lastmod))
+        if len(batch) >= CHUNK_SIZE:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+    yield URLSET_CLOSE
+
+
+def segment_path(name, number, base_url, count, lastmod, checksum):
+    """Fichero de un segmento; la huella va en el nombre"""
+    digest = hashlib.sha1(
+        f'{base_url}|{get_segment_size()}|{count}|{lastmod.isoformat() if lastmod else ""}|{checksum}'.encode()
+    ).hexdigest()[:16]
+    return os.path.join(get_directory(), f'{name}-{number}-{digest}.xml')
+
+
+def write_through(chunks, path):
+    """
+    Devuelve los chunks (en bytes) a la vez que los escribe en `path`. El
+    fichero sólo aparece si se llegó al final; después se borran las
+    versiones anteriores del mismo segmento.
+    """
+    directory, filename = os.path.split(path)
+    os.makedirs(directory, exist_ok=True)
+    partial = os.path.join(directory, f'.{filename}.{uuid.uuid4().hex}')
+    complete = False
+    try:
+        with open(partial, 'wb') as f:
+            for chunk in chunks:
+                data = chunk.encode()
+                f.write(data)
+                yield data
+        os.replace(partial, path)
+        complete = True
+    finally:
+        if not complete and os.path.exists(partial):
+            os.remove(partial)
+    prefix = filename.rsplit('-', 1)[0] + '-'
+    for other in os.listdir(directory):
+        if other.startswith(prefix) and other != filename:
+            # Otro proceso puede haberlo borrado ya
+            with suppress(FileNotFoundError):
+                os.remove(os.path.join(directory, other))
@@ -0,0 +1,262 @@
+"""
+Índices de prefijos en memoria para el autocompletado del buscador
+(/search/suggest/) y de las menciones @usuario (/users/suggest/).
+
+Cada título de post publicado, cada nombre de etiqueta con posts y cada
+usuario activo ("username nombre apellidos") se normaliza (minúsculas,
+sin acentos, espacios simples) y se guarda una vez por palabra, desde esa
+palabra hasta el final: "Tutorial de Django" da "tutorial de django",
+"de django" y "django", así que se encuentra empezando a escribir
+cualquiera de sus palabras. Las claves están en una lista ordenada de
+(clave, id); las que empiezan por un prefijo forman un tramo contiguo que
+se localiza con dos bisect.
+
+De ese tramo salen las más populares: los posts por hot_score (ver
+blog/trending.py), las etiquetas por TagStats.post_count y los usuarios
+por su último acceso. Los tramos cortos se recorren enteros; los de más
+de SCAN_LIMIT claves (prefijos de una o dos letras) se resuelven una vez
+y se memorizan hasta que cambia alguna entrada que empiece por ellos.
+
+Como tag_bitmaps, el índice es por proceso: se construye en la primera
+consulta, las señales aplican cada cambio tras el commit y se reconstruye
+entero pasados BLOG_SUGGEST_INDEX_MAX_AGE segundos, para recoger lo que
+hayan escrito otros procesos y las puntuaciones de tendencia al día.
+"""
+import heapq
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.contrib.auth.models import User
+
+from .models import Post, TagStats
+
+POSTS = 'posts'
+TAGS = 'tags'
+USERS = 'users'
+# Tramos más largos que esto no se recorren en cada consulta
+SCAN_LIMIT = 256
+# Resultados que se memorizan de cada tramo largo
+MEMO_SIZE = 20
+MAX_QUERY_LENGTH = 100
+# Mayor que cualquier carácter: cierra el tramo de un prefijo
+KEY_END = '\U0010ffff'
+
+
+def get_max_age():
+    return getattr(settings, 'BLOG_SUGGEST_INDEX_MAX_AGE', 600)
+
+
+def get_limits():
+    """Sugerencias por tipo: {POSTS: n, TAGS: n}"""
+    return {POSTS: 7, TAGS: 3, **getattr(settings, 'BLOG_SUGGEST_LIMITS', {})}
+
+
+def normalize(text):
+    """Minúsculas, sin acentos y con los espacios colapsados"""
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ' '.join(''.join(c for c in text if not unicodedata.combining(c)).split())
+
+
+def user_row(user_id, username, first_name, last_name, last_login):
+    """(id, texto, username, popularidad) de un usuario para el índice"""
+    return user_id, f'{username} {first_name} {last_name}', username, last_login.timestamp() if last_login else 0
+
+
+def index_keys(label):
+    """Una clave por palabra de `label`, desde esa palabra hasta el final"""
+    words = normalize(label).split(' ')
+    return {' '.join(words[i:]) for i in range(len(words)) if words[i]}
+
+
+class PrefixIndex:
+    """Claves ordenadas de un tipo de entrada (posts o etiquetas) y su popularidad"""
+
+    def __init__(self, items=()):
+        self.items = {}      # id -> (texto, slug, popularidad)
+        self.entries = []    # (clave, id), ordenado
+        self.memo = {}       # prefijo -> ids, para los tramos largos
+        entries = []
+        for item_id, label, slug, score in items:
+            self.items[item_id] = (label, slug, score)
+            entries.extend((key, item_id) for key in index_keys(label))
+        entries.sort()
+        self.entries = entries
+
+    def rank(self, item_id):
+        return self.items[item_id][2], item_id
+
+    def matches(self, item_id, prefix):
+        item = self.items.get(item_id)
+        return item is not None and any(key.startswith(prefix) for key in index_keys(item[0]))
+
+    def set(self, item_id, label, slug, score):
+        old = self.items.get(item_id)
+        if old == (label, slug, score):
+            return
+        self.remove(item_id)
+        self.items[item_id] = (label, slug, score)
+        keys = index_keys(label)
+        for key in keys:
+            insort(self.entries, (key, item_id))
+        self.forget(keys)
+
+    def remove(self, item_id):
+        old = self.items.pop(item_id, None)
+        if old is None:
+            return
+        keys = index_keys(old[0])
+        for key in keys:
+            position = bisect_left(self.entries, (key, item_id))
+            if position < len(self.entries) and self.entries[position] == (key, item_id):
+                del self.entries[position]
+        self.forget(keys)
+
+    def forget(self, keys):
+        """Descarta lo memorizado para los prefijos de `keys`"""
+        stale = [prefix for prefix in self.memo if any(key.startswith(prefix) for key in keys)]
+        for prefix in stale:
+            del self.memo[prefix]
+
+    def search(self, prefix, limit):
+        """ids de las `limit` entradas más populares con alguna clave que empiece por `prefix`"""
+        if prefix in self.memo:
+            return self.memo[prefix][:limit]
+        start = bisect_left(self.entries, (prefix,))
+        end = bisect_left(self.entries, (prefix + KEY_END,), start)
+        if end - start > SCAN_LIMIT:
+            # Se guardan más de las que se piden: otras consultas pueden pedir más
+            best = self.top({item_id for _, item_id in self.entries[start:end]}, max(limit, MEMO_SIZE))
+            self.memo[prefix] = best
+            return best[:limit]
+        return self.top({item_id for _, item_id in self.entries[start:end]}, limit)
+
+    def top(self, item_ids, limit):
+        return heapq.nlargest(limit, item_ids, key=self.rank)
+
+
+class SuggestionIndex:
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        """Descarta el índice; se reconstruye en la siguiente consulta"""
+        with self._lock:
+            self.built_at = None
+            self.indexes = {POSTS: PrefixIndex(), TAGS: PrefixIndex(), USERS: PrefixIndex()}
+
+    def build(self):
+        posts = Post.objects.filter(published=True).order_by().values_list('id', 'title', 'slug', 'hot_score')
+        tags = TagStats.objects.order_by().values_list('tag_id', 'tag__name', 'tag__slug', 'post_count')
+        users = User.objects.filter(is_active=True).order_by() \
+            .values_list('id', 'username', 'first_name', 'last_name', 'last_login')
+        indexes = {
+            POSTS: PrefixIndex(posts.iterator(chunk_size=5000)),
+            TAGS: PrefixIndex(tags.iterator(chunk_size=5000)),
+            USERS: PrefixIndex(user_row(*row) for row in users.iterator(chunk_size=5000)),
+        }
+        with self._lock:
+            self.indexes = indexes
+            self.built_at = time.monotonic()
+
+    def ensure_built(self):
+        built_at = self.built_at
+        if built_at is None or time.monotonic() - built_at > get_max_age():
+            with self._lock:
+                if self.built_at == built_at:
+                    self.build()
+
+    def update_post(self, post_id):
+        """Vuelve a leer un post (título, publicación, puntuación) tras un cambio"""
+        if self.built_at is None:
+            return
+        row = Post.objects.filter(pk=post_id, published=True).values_list('title', 'slug', 'hot_score').first()
+        with self._lock:
+            if self.built_at is None:
+                return
+            if row is None:
+                self.indexes[POSTS].remove(post_id)
+            else:
+                self.indexes[POSTS].set(post_id, *row)
+
+    def remove_post(self, post_id):
+        with self._lock:
+            self.indexes[POSTS].remove(post_id)
+
+    def update_tags(self, tag_ids):
+        """Vuelve a leer etiquetas (nombre y número de posts publicados) tras un cambio"""
+        tag_ids = set(tag_ids)
+        if self.built_at is None or not tag_ids:
+            return
+        rows = {
+            tag_id: row for tag_id, *row in TagStats.objects.filter(tag_id__in=tag_ids)
+            .values_list('tag_id', 'tag__name', 'tag__slug', 'post_count')
+        }
+        with self._lock:
+            if self.built_at is None:
+                return
+            for tag_id in tag_ids:
+                if tag_id in rows:
+                    self.indexes[TAGS].set(tag_id, *rows[tag_id])
+                else:
+                    self.indexes[TAGS].remove(tag_id)
+
+    def update_user(self, user_id):
+        """Vuelve a leer un usuario (nombre, activo, último acceso) tras un cambio"""
+        if self.built_at is None:
+            return
+        row = User.objects.filter(pk=user_id, is_active=True) \
+            .values_list('id', 'username', 'first_name', 'last_name', 'last_login').first()
+        with self._lock:
+            if self.built_at is None:
+                return
+            if row is None:
+                self.indexes[USERS].remove(user_id)
+            else:
+                self.indexes[USERS].set(*user_row(*row))
+
+    def remove_user(self, user_id):
+        with self._lock:
+            self.indexes[USERS].remove(user_id)
+
+    def suggest_users(self, query, first_ids=(), limit=8):
+        """
+        [(id, username, nombre)] de los usuarios cuyo username o nombre empieza
+        por `query`; primero los de `first_ids` (quienes ya participan en el hilo)
+        """
+        prefix = normalize(query[:MAX_QUERY_LENGTH])
+        if not prefix:
+            return []
+        self.ensure_built()
+        with self._lock:
+            index = self.indexes[USERS]
+            first = sorted((user_id for user_id in first_ids if index.matches(user_id, prefix)), key=index.rank,
+                           reverse=True)[:limit]
+            rest = [user_id for user_id in index.search(prefix, limit + len(first)) if user_id not in first]
+            results = []
+            for user_id in (first + rest)[:limit]:
+                label, username, _ = index.items[user_id]
+                results.append((user_id, username, label[len(username):].strip()))
+            return results
+
+    def suggest(self, query):
+        """{POSTS: [(título, slug)], TAGS: [(nombre, slug, posts)]} para lo que lleva escrito el usuario"""
+        prefix = normalize(query[:MAX_QUERY_LENGTH])
+        results = {POSTS: [], TAGS: []}
+        if not prefix:
+            return results
+        self.ensure_built()
+        with self._lock:
+            for kind, limit in get_limits().items():
+                index = self.indexes[kind]
+                for item_id in index.search(prefix, limit):
+                    label, slug, score = index.items[item_id]
+                    results[kind].append((label, slug) if kind == POSTS else (label, slug, score))
+        return results
+
+
+index = SuggestionIndex()
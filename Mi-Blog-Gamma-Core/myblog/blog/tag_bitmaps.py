@@ -0,0 +1,234 @@
+"""
+Índice invertido en memoria: etiqueta -> posts publicados (ver posts_by_tags).
+
+Cada post publicado ocupa una posición fija, en orden de published_date
+ascendente, y cada etiqueta guarda un mapa de bits (un int de Python) con
+las posiciones de sus posts. Así `a+b` es `bits[a] & bits[b]`, `a,b` es
+`bits[a] | bits[b]`, el total es el número de bits a 1 y una página son las
+posiciones más altas, sin ningún self-join sobre taggit_taggeditem.
+
+El índice es por proceso: se construye en la primera consulta, las señales
+lo mantienen al día tras cada commit y se reconstruye entero cuando tiene
+más de BLOG_TAG_INDEX_MAX_AGE segundos, para recoger lo que hayan escrito
+otros procesos. Si algo no se puede aplicar en su sitio (un post con fecha
+anterior al último publicado) se marca para reconstruir. Un post publicado
+sin published_date también entra, como el más antiguo, tanto al construir
+como al actualizar.
+"""
+import threading
+import time
+from functools import reduce
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import F
+from taggit.models import TaggedItem
+
+from .models import Post
+
+MATCH_ALL = 'all'
+MATCH_ANY = 'any'
+
+
+def get_max_age():
+    return getattr(settings, 'BLOG_TAG_INDEX_MAX_AGE', 600)
+
+
+def date_key(published_date):
+    """Orden del índice: published_date ascendente, sin fecha al principio"""
+    return (published_date is not None, published_date)
+
+
+def build_bitmap(positions, size):
+    """Mapa de bits con las posiciones dadas, montado en un bytearray"""
+    buffer = bytearray((size + 7) // 8)
+    for position in positions:
+        buffer[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def iter_positions_desc(bits, offset=0):
+    """Posiciones activas de mayor a menor (de más reciente a más antiguo)"""
+    digits = format(bits, 'b') if bits else ''
+    top = len(digits) - 1
+    index = digits.find('1')
+    while index != -1:
+        if offset:
+            offset -= 1
+        else:
+            yield top - index
+        index = digits.find('1', index + 1)
+
+
+class TagBitmapIndex:
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        """Descarta el índice; se reconstruye en la siguiente consulta"""
+        with self._lock:
+            self.built_at = None
+            self.positions = {}      # post_id -> posición
+            self.post_ids = []       # posición -> post_id (None si ya no está)
+            self.dates = {}          # post_id -> published_date
+            self.post_tags = {}      # post_id -> slugs
+            self.bitmaps = {}        # slug -> int
+            self.last_date = None
+
+    def build(self):
+        rows = Post.objects.filter(published=True) \
+            .order_by(F('published_date').asc(nulls_first=True), 'id') \
+            .values_list('id', 'published_date')
+        positions, post_ids, dates = {}, [], {}
+        for post_id, published_date in rows.iterator(chunk_size=5000):
+            positions[post_id] = len(post_ids)
+            post_ids.append(post_id)
+            dates[post_id] = published_date
+
+        by_tag, post_tags = {}, {}
+        tagged = TaggedItem.objects.filter(content_type=ContentType.objects.get_for_model(Post)) \
+            .values_list('object_id', 'tag__slug')
+        for post_id, slug in tagged.iterator(chunk_size=5000):
+            position = positions.get(post_id)
+            if position is None:
+                continue
+            by_tag.setdefault(slug, []).append(position)
+            post_tags.setdefault(post_id, set()).add(slug)
+
+        bitmaps = {slug: build_bitmap(items, len(post_ids)) for slug, items in by_tag.items()}
+        with self._lock:
+            self.positions, self.post_ids, self.dates = positions, post_ids, dates
+            self.post_tags, self.bitmaps = post_tags, bitmaps
+            self.last_date = dates[post_ids[-1]] if post_ids else None
+            self.built_at = time.monotonic()
+
+    def ensure_built(self):
+        built_at = self.built_at
+        if built_at is None or time.monotonic() - built_at > get_max_age():
+            with self._lock:
+                if self.built_at == built_at:
+                    self.build()
+
+    def update_post(self, post_id):
+        """Vuelve a leer un post (publicación, fecha y etiquetas) tras un cambio"""
+        if self.built_at is None:
+            return
+        row = Post.objects.filter(pk=post_id, published=True).values_list('published_date').first()
+        if row is None:
+            self.remove_post(post_id)
+            return
+        published_date, = row
+        slugs = set(TaggedItem.objects.filter(
+            content_type=ContentType.objects.get_for_model(Post), object_id=post_id
+        ).values_list('tag__slug', flat=True))
+        with self._lock:
+            if self.built_at is None:
+                return
+            position = self.positions.get(post_id)
+            if position is None:
+                if self.post_ids and date_key(published_date) < date_key(self.last_date):
+                    # Iría en medio del orden: más fácil reconstruir
+                    self.built_at = None
+                    return
+                position = len(self.post_ids)
+                self.positions[post_id] = position
+                self.post_ids.append(post_id)
+                self.last_date = published_date
+            elif self.dates[post_id] != published_date:
+                self.built_at = None
+                return
+            self.dates[post_id] = published_date
+            self._set_tags(post_id, position, slugs)
+
+    def remove_post(self, post_id):
+        with self._lock:
+            position = self.positions.pop(post_id, None)
+            if position is None:
+                return
+            self._set_tags(post_id, position, set())
+            self.post_ids[position] = None
+            del self.dates[post_id]
+
+    def _set_tags(self, post_id, position, slugs):
+        old = self.post_tags.get(post_id, set())
+        mask = 1 << position
+        for slug in old - slugs:
+            bits = self.bitmaps[slug] & ~mask
+            if bits:
+                self.bitmaps[slug] = bits
+            else:
+                del self.bitmaps[slug]
+        for slug in slugs - old:
+            self.bitmaps[slug] = self.bitmaps.get(slug, 0) | mask
+        if slugs:
+            self.post_tags[post_id] = slugs
+        else:
+            self.post_tags.pop(post_id, None)
+
+    def match(self, slugs, mode=MATCH_ALL):
+        """Posts con todas (o alguna) de las etiquetas"""
+        self.ensure_built()
+        with self._lock:
+            bitmaps = [self.bitmaps.get(slug, 0) for slug in slugs]
+            post_ids = self.post_ids
+        if not bitmaps:
+            bits = 0
+        elif mode == MATCH_ANY:
+            bits = reduce(int.__or__, bitmaps)
+        else:
+            bits = reduce(int.__and__, bitmaps)
+        return TagMatch(bits, post_ids)
+
+
+class TagMatch:
+    """
+    Resultado de una consulta al índice. Guarda la tabla posición -> post_id
+    con la que se calculó, por si el índice se reconstruye mientras tanto.
+    """
+
+    def __init__(self, bits, post_ids):
+        self.bits = bits
+        self.post_ids = post_ids
+
+    def count(self):
+        return bin(self.bits).count('1')
+
+    def page(self, offset=0, limit=None):
+        """IDs de los posts, de más reciente a más antiguo"""
+        post_ids = []
+        for position in iter_positions_desc(self.bits, offset):
+            if limit is not None and len(post_ids) >= limit:
+                break
+            post_ids.append(self.post_ids[position])
+        return post_ids
+
+
+class IndexedPostList:
+    """
+    Secuencia para Paginator: el total sale del mapa de bits y cada página
+    se carga con un solo `id__in` sobre `queryset`, en el orden del índice.
+    """
+
+    def __init__(self, match, queryset):
+        self.match = match
+        self.queryset = queryset
+
+    def count(self):
+        return self.match.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start = key.start or 0
+        limit = None if key.stop is None else key.stop - start
+        post_ids = self.match.page(start, limit)
+        posts = self.queryset.in_bulk(post_ids)
+        return [posts[post_id] for post_id in post_ids if post_id in posts]
+
+
+index = TagBitmapIndex()
@@ -1,3 +1,2287 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import pstats
+import random
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from io import BytesIO, StringIO
+from urllib.parse import quote
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.signals import request_finished, request_started
+from django.db import OperationalError, close_old_connections, connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from taggit.models import Tag, TaggedItem
+
+from . import (
+    api, duplicates, engagement, fulltext, images, loadtest, metrics, profiling, related, rendering, routers, suggest, tag_bitmaps,
+    transfer, trending,
+)
+from .admin import EstimatedCountPaginator, estimated_row_count
+from .middleware import ReadReplicaMiddleware
+from .models import (
+    Comment, CommentVote, HotScoreState, MinHashBucket, Notification, Post, PostMinHash, Reaction, RelatedPost,
+    Review, StaleRelatedPost, Subscription, TagStats, UploadedImage, wilson_lower_bound,
+)
+from .views import comment_cursor, get_comments_per_page, moderation_cursor
+
+
+def create_post(author, title='Post de prueba', **kwargs):
+    defaults = {
+        'slug': title.lower().replace(' ', '-'),
+        'content': '<p>Contenido de prueba</p>',
+        'published': True,
+        'published_date': timezone.now(),
+    }
+    defaults.update(kwargs)
+    return Post.objects.create(title=title, author=author, **defaults)
+
+
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = routers.PrimaryReplicaRouter()
+
+    def test_reads_use_primary_without_active_alias(self):
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+
+    def test_reads_use_active_alias(self):
+        previous = routers.activate_read_database('replica')
+        try:
+            self.assertEqual(self.router.db_for_read(Post), 'replica')
+            self.assertEqual(self.router.db_for_read(Session), 'default')
+        finally:
+            routers.deactivate_read_database(previous)
+
+    def test_writes_always_use_primary_and_mark_request(self):
+        token = routers.reset_write_flag()
+        try:
+            self.assertEqual(self.router.db_for_write(Post), 'default')
+            self.assertTrue(routers.has_written())
+        finally:
+            routers.restore_write_flag(token)
+
+    def test_replica_is_not_migrated(self):
+        self.assertIs(self.router.allow_migrate('replica', 'blog'), False)
+        self.assertIsNone(self.router.allow_migrate('default', 'blog'))
+
+
+class ReadReplicaMiddlewareTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.author = User.objects.create_user('autor', password='clave-segura-123')
+        self.post = create_post(self.author)
+
+    def _process(self, request, view_name):
+        seen = {}
+
+        def get_response(req):
+            middleware.process_view(req, None, (), {})
+            seen['alias'] = routers._read_alias.get()
+            return HttpResponse()
+
+        request.resolver_match = type('Match', (), {'view_name': view_name})()
+        middleware = ReadReplicaMiddleware(get_response)
+        response = middleware(request)
+        return seen['alias'], response
+
+    def test_read_only_view_activates_read_alias(self):
+        alias, response = self._process(self.factory.get('/'), 'blog:post_list')
+        self.assertEqual(alias, routers.get_read_database())
+        self.assertNotIn(routers.STICKY_COOKIE_NAME, response.cookies)
+        self.assertIsNone(routers._read_alias.get())
+
+    def test_other_views_stay_on_primary(self):
+        alias, _ = self._process(self.factory.get('/profile/'), 'blog:profile')
+        self.assertIsNone(alias)
+
+    def test_writes_set_sticky_cookie(self):
+        _, response = self._process(self.factory.post('/post/x/'), 'blog:post_detail')
+        self.assertIn(routers.STICKY_COOKIE_NAME, response.cookies)
+
+    def test_recent_writer_reads_from_primary(self):
+        request = self.factory.get('/')
+        request.COOKIES[routers.STICKY_COOKIE_NAME] = str(time.time())
+        alias, _ = self._process(request, 'blog:post_list')
+        self.assertIsNone(alias)
+
+    def test_sticky_window_expires(self):
+        request = self.factory.get('/')
+        request.COOKIES[routers.STICKY_COOKIE_NAME] = str(time.time() - 60)
+        self.assertFalse(routers.is_sticky(request))
+
+    def test_post_list_is_served(self):
+        response = self.client.get(reverse('blog:post_list'))
+        self.assertContains(response, self.post.title)
+
+
+class RefreshReplicaTests(TransactionTestCase):
+    def test_backup_copies_primary(self):
+        author = User.objects.create_user('autor', password='clave-segura-123')
+        create_post(author, title='Copiado a la replica')
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            target = os.path.join(tmpdir, 'replica.sqlite3')
+            routers.refresh_replica(target=target)
+            copy = sqlite3.connect(target)
+            try:
+                rows = copy.execute('SELECT title FROM blog_post').fetchall()
+            finally:
+                copy.close()
+
+        self.assertEqual(rows, [('Copiado a la replica',)])
+
+    @override_settings(BLOG_READ_DATABASE=None)
+    def test_no_read_database_configured(self):
+        self.assertIsNone(routers.get_read_database())
+
+
+class QueryPlanTests(TestCase):
+    """
+    Ejecuta EXPLAIN QUERY PLAN sobre las consultas de las vistas principales y
+    falla si alguna recorre una tabla completa o necesita un B-tree temporal.
+    """
+
+    FULL_SCAN = re.compile(r'^SCAN (\S+)$')
+
+    # Consultas que aún ordenan en memoria, con el motivo
+    KNOWN_SORTS = {
+        'FROM "auth_user" WHERE "auth_user"."id" IN': 'la lista de autores se ordena por nombre',
+        'NOT "blog_comment"."rejected"': 'la cola de moderación junta los pendientes de todos los posts del autor',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('autor', password='clave-segura-123')
+        cls.reader = User.objects.create_user('lector', password='clave-segura-123')
+        for i in range(25):
+            post = create_post(cls.author, title=f'Post {i}')
+            post.tags.add('django', 'python')
+            comment = Comment.objects.create(post=post, author=cls.reader, content='Hola', is_approved=True)
+            CommentVote.objects.create(comment=comment, user=cls.author, vote=1)
+            Reaction.objects.create(post=post, user=cls.reader, reaction_type='👍')
+            Notification.objects.create(user=cls.author, notification_type='comment', title='t', message='m')
+        create_post(cls.author, title='Borrador', published=False, published_date=None)
+        Subscription.objects.create(user=cls.reader, subscription_type='author', author=cls.author)
+        Subscription.objects.create(user=cls.reader, subscription_type='tag', tag='django')
+
+    def explain(self, sql, params=()):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertIndexedPlans(self, url):
+        cache.clear()
+        tag_bitmaps.index.reset()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        problems = []
+        for query in ctx.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or '"blog_' not in sql:
+                continue
+            plan = self.explain(sql)
+            scans = [step for step in plan if self.FULL_SCAN.match(step)]
+            sorts = [step for step in plan if 'USE TEMP B-TREE' in step]
+            if sorts and any(marker in sql for marker in self.KNOWN_SORTS):
+                sorts = []
+            if scans or sorts:
+                problems.append(f'{sql}\n    {plan}')
+        if problems:
+            self.fail(f'{url}: consultas sin índice adecuado:\n' + '\n'.join(problems))
+
+    def test_anonymous_views(self):
+        for url in [
+            reverse('blog:post_list'),
+            reverse('blog:trending'),
+            reverse('blog:trending') + '?after=1.5:3',
+            reverse('blog:post_detail', args=['post-3']),
+            reverse('blog:post_comments', args=['post-3']) + '?after=0:1:1700000000000000:3',
+            reverse('blog:posts_by_tag', args=['django']),
+            reverse('blog:posts_by_tags', args=['django+python']),
+            reverse('blog:tag_index'),
+            reverse('blog:tag_index') + '?sort=popular',
+            reverse('blog:tag_index') + '?sort=recent',
+            reverse('blog:add_reaction', args=['post-3']),
+            reverse('blog:rss_feed'),
+            reverse('blog:rss_feed_filtered', args=['author', self.author.id]),
+            reverse('blog:rss_feed_filtered', args=['tag', 'django']),
+        ]:
+            with self.subTest(url=url):
+                self.assertIndexedPlans(url)
+
+    def test_logged_in_views(self):
+        self.client.force_login(self.author)
+        for url in [
+            reverse('blog:post_detail', args=['post-3']),
+            reverse('blog:notifications'),
+            reverse('blog:notification_count'),
+            reverse('blog:subscriptions'),
+            reverse('blog:moderation_queue'),
+            reverse('blog:moderation_queue') + '?after=1700000000000000:3',
+        ]:
+            with self.subTest(url=url):
+                self.assertIndexedPlans(url)
+
+    def test_subscription_lookups(self):
+        for queryset in [
+            Subscription.objects.filter(subscription_type='author', author=self.author),
+            Subscription.objects.filter(subscription_type='tag', tag='django'),
+        ]:
+            sql, params = queryset.query.sql_with_params()
+            plan = self.explain(sql, params)
+            self.assertFalse([step for step in plan if self.FULL_SCAN.match(step)], plan)
+
+
+class RollingHistogramTests(SimpleTestCase):
+    def test_percentiles_use_bucket_bounds(self):
+        histogram = metrics.Histogram()
+        for value in [0.5] * 90 + [40] * 9 + [3000]:
+            histogram.add(value)
+        summary = histogram.summary()
+        self.assertEqual(summary['count'], 100)
+        self.assertEqual(summary['p50'], 1.0)
+        self.assertEqual(summary['p95'], 50.0)
+        self.assertEqual(summary['max'], 3000)
+
+    def test_old_windows_are_dropped(self):
+        now = [0]
+        histogram = metrics.RollingHistogram(window_seconds=10, windows=2, clock=lambda: now[0])
+        histogram.add(1)
+        now[0] = 10
+        histogram.add(1)
+        now[0] = 20
+        histogram.add(1)
+        self.assertEqual(histogram.snapshot().count, 2)
+
+    def test_idle_periods_expire_old_samples(self):
+        now = [0]
+        histogram = metrics.RollingHistogram(window_seconds=10, windows=3, clock=lambda: now[0])
+        histogram.add(1)
+        now[0] = 15
+        histogram.add(1)
+        self.assertEqual(histogram.snapshot().count, 2)
+        # Dos periodos después sólo queda la muestra de t=15
+        now[0] = 35
+        self.assertEqual(histogram.snapshot().count, 1)
+        now[0] = 3600
+        self.assertEqual(histogram.snapshot().count, 0)
+        histogram.add(1)
+        self.assertEqual(histogram.snapshot().count, 1)
+
+
+class QueryTimingMiddlewareTests(TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        self.author = User.objects.create_user('autor', password='clave-segura-123')
+        create_post(self.author)
+
+    def test_headers_report_queries_and_timing(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('blog:post_list'))
+        self.assertEqual(response['X-Query-Count'], str(len(ctx.captured_queries)))
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('tpl;dur=', response['Server-Timing'])
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+    def test_streaming_queries_are_counted_when_the_body_is_consumed(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('blog:sitemap_index'))
+            self.assertEqual(metrics.registry.summary(), {})
+            b''.join(response.streaming_content)
+        # Las cabeceras salen antes que el cuerpo: sólo cuentan lo que hizo la vista
+        self.assertLess(int(response['X-Query-Count']), len(ctx.captured_queries))
+        queries = metrics.registry.summary()['blog:sitemap_index']['queries']
+        self.assertEqual((queries['count'], queries['max']), (1, len(ctx.captured_queries)))
+
+    def test_summary_is_staff_only(self):
+        url = reverse('blog:metrics_summary')
+        self.client.get(reverse('blog:post_list'))
+
+        self.client.force_login(self.author)
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        staff = User.objects.create_user('staff', password='clave-segura-123', is_staff=True)
+        self.client.force_login(staff)
+        data = self.client.get(url).json()
+        post_list = data['views']['blog:post_list']
+        self.assertEqual(post_list['wall_ms']['count'], 1)
+        self.assertGreater(post_list['queries']['max'], 0)
+        self.assertGreater(post_list['template_ms']['max'], 0)
+
+
+def seed_blog(posts=30, comments_per_post=8, readers=6):
+    """Datos con volumen realista para medir consultas por vista"""
+    author = User.objects.create_user('autor', password='clave-segura-123', first_name='Ana', last_name='Autora')
+    readers = [
+        User.objects.create_user(f'lector{i}', password='clave-segura-123', first_name='Lector', last_name=str(i))
+        for i in range(readers)
+    ]
+    tag_names = ['django', 'python', 'web', 'sql', 'rendimiento']
+    now = timezone.now()
+    new_posts = [
+        Post(
+            title=f'Post {i}', slug=f'post-{i}', author=author,
+            content='<p>' + 'palabra ' * 300 + '</p>',
+            published=True, published_date=now - timezone.timedelta(hours=i),
+        )
+        for i in range(posts)
+    ]
+    for post in new_posts:
+        post.render_content()
+    Post.objects.bulk_create(new_posts)
+    created = list(Post.objects.order_by('id'))
+    for i, post in enumerate(created):
+        post.tags.add(*tag_names[i % 3:i % 3 + 3])
+
+    Comment.objects.bulk_create([
+        Comment(post=post, author=readers[j % len(readers)], content=f'Comentario @autor {j}', is_approved=j % 4 != 0)
+        for post in created for j in range(comments_per_post)
+    ])
+    comments = list(Comment.objects.all())
+    CommentVote.objects.bulk_create([
+        CommentVote(comment=comment, user=reader, vote=1 if (comment.id + k) % 3 else -1)
+        for comment in comments for k, reader in enumerate(readers[:3])
+    ])
+    # bulk_create no pasa por las señales ni por vote_comment
+    Comment.rebuild_threads()
+    Comment.refresh_scores()
+    Review.objects.bulk_create([
+        Review(post=post, user=reader, rating=1 + (post.id + k) % 5, comment='Reseña')
+        for post in created for k, reader in enumerate(readers)
+    ])
+    Reaction.objects.bulk_create([
+        Reaction(post=post, user=reader, reaction_type=Reaction.REACTION_TYPES[k % 6][0])
+        for post in created for k, reader in enumerate(readers)
+    ])
+    Notification.objects.bulk_create([
+        Notification(user=author, notification_type='comment', title='Nuevo comentario', message='m', url='/')
+        for _ in range(40)
+    ])
+    for reader in readers:
+        Subscription.objects.create(user=reader, subscription_type='author', author=author)
+        Subscription.objects.create(user=reader, subscription_type='tag', tag='django')
+    return author, readers, created
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Número máximo de consultas y de filas leídas por cada vista de
+    blog/urls.py, como anónimo, lector y autor. Si una vista se pasa del
+    presupuesto (por ejemplo vuelve un N+1) el fallo lista el SQL ejecutado.
+    """
+
+    # petición: {rol: (máx. consultas, máx. filas)}
+    BUDGETS = {
+        'post_list': {'anonimo': (4, 46), 'lector': (7, 48), 'autor': (7, 48)},
+        'post_list:page2': {'anonimo': (4, 46), 'lector': (7, 48), 'autor': (7, 48)},
+        'trending': {'anonimo': (2, 44), 'lector': (5, 46), 'autor': (5, 46)},
+        'trending:page2': {'anonimo': (2, 44), 'lector': (5, 46), 'autor': (5, 46)},
+        'search_suggest': {'anonimo': (0, 0), 'lector': (0, 0), 'autor': (0, 0)},
+        'post_create': {'anonimo': (0, 0), 'lector': (3, 2), 'autor': (3, 2)},
+        'post_detail': {'anonimo': (5, 15), 'lector': (11, 25), 'autor': (11, 19)},
+        'post_comments': {'anonimo': (3, 6), 'lector': (6, 13), 'autor': (6, 9)},
+        'post_edit': {'anonimo': (0, 0), 'lector': (3, 2), 'autor': (5, 6)},
+        'post_delete': {'anonimo': (0, 0), 'lector': (3, 2), 'autor': (5, 4)},
+        'signup': {'anonimo': (0, 0), 'lector': (3, 2), 'autor': (3, 2)},
+        'login': {'anonimo': (0, 0), 'lector': (2, 2), 'autor': (2, 2)},
+        'profile': {'anonimo': (0, 0), 'lector': (7, 6), 'autor': (7, 6)},
+        'profile_edit': {'anonimo': (0, 0), 'lector': (3, 3), 'autor': (3, 3)},
+        'engagement_export': {'anonimo': (0, 0), 'lector': (5, 2), 'autor': (5, 542)},
+        'moderate_comment': {'anonimo': (0, 0), 'lector': (5, 5), 'autor': (6, 5)},
+        'moderation_queue': {'anonimo': (0, 0), 'lector': (4, 3), 'autor': (4, 24)},
+        'moderation_queue:page2': {'anonimo': (0, 0), 'lector': (4, 3), 'autor': (4, 24)},
+        'moderation_queue:post': {'anonimo': (0, 0), 'lector': (5, 2), 'autor': (6, 4)},
+        'tag_index': {'anonimo': (2, 6), 'lector': (5, 9), 'autor': (5, 9)},
+        'posts_by_tag': {'anonimo': (4, 46), 'lector': (7, 49), 'autor': (7, 49)},
+        'posts_by_tags': {'anonimo': (4, 47), 'lector': (7, 50), 'autor': (7, 50)},
+        'posts_by_tags:any': {'anonimo': (4, 47), 'lector': (7, 50), 'autor': (7, 50)},
+        'add_reaction': {'anonimo': (2, 7), 'lector': (2, 7), 'autor': (2, 7)},
+        'add_reaction:post': {'anonimo': (2, 7), 'lector': (9, 14), 'autor': (12, 18)},
+        'vote_comment': {'anonimo': (0, 0), 'lector': (7, 5), 'autor': (11, 6)},
+        'toggle_comment_pin': {'anonimo': (0, 0), 'lector': (5, 5), 'autor': (6, 5)},
+        'notifications': {'anonimo': (0, 0), 'lector': (5, 4), 'autor': (5, 24)},
+        'mark_notification_read': {'anonimo': (0, 0), 'lector': (3, 2), 'autor': (4, 3)},
+        'notification_count': {'anonimo': (0, 0), 'lector': (3, 3), 'autor': (3, 3)},
+        'user_suggest': {'anonimo': (0, 0), 'lector': (3, 9), 'autor': (3, 9)},
+        'subscriptions': {'anonimo': (0, 0), 'lector': (5, 6), 'autor': (5, 4)},
+        'rss_feed': {'anonimo': (1, 20), 'lector': (1, 20), 'autor': (1, 20)},
+        'rss_feed_filtered:author': {'anonimo': (2, 21), 'lector': (2, 21), 'autor': (2, 21)},
+        'rss_feed_filtered:tag': {'anonimo': (2, 11), 'lector': (2, 11), 'autor': (2, 11)},
+        'sitemap_index': {'anonimo': (2, 3), 'lector': (2, 3), 'autor': (2, 3)},
+        'sitemap_section': {'anonimo': (2, 60), 'lector': (2, 60), 'autor': (2, 60)},
+        'sitemap_section:tags': {'anonimo': (2, 10), 'lector': (2, 10), 'autor': (2, 10)},
+        'api_posts': {'anonimo': (2, 81), 'lector': (2, 81), 'autor': (2, 81)},
+        'api_posts:page2': {'anonimo': (2, 80), 'lector': (2, 80), 'autor': (2, 80)},
+        'api_post': {'anonimo': (2, 4), 'lector': (2, 4), 'autor': (2, 4)},
+        'api_post_comments': {'anonimo': (2, 9), 'lector': (2, 9), 'autor': (2, 9)},
+        'api_tags': {'anonimo': (1, 5), 'lector': (1, 5), 'autor': (1, 5)},
+        'api_author': {'anonimo': (1, 1), 'lector': (1, 1), 'autor': (1, 1)},
+        'metrics_summary': {'anonimo': (0, 0), 'lector': (2, 2), 'autor': (2, 2)},
+        'logout': {'anonimo': (0, 0), 'lector': (4, 1), 'autor': (4, 1)},
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.readers, cls.posts = seed_blog()
+        cls.reader = cls.readers[0]
+        cls.post = cls.posts[3]
+        cls.comment = cls.post.comments.filter(is_approved=True).first()
+        cls.notification = Notification.objects.filter(user=cls.author).first()
+        related.compute_all()
+        trending.rebuild()
+
+    def setUp(self):
+        # Los segmentos del sitemap se escriben a disco
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = self.settings(BLOG_SITEMAP_DIR=directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def users(self):
+        return {'anonimo': None, 'lector': self.reader, 'autor': self.author}
+
+    def requests(self):
+        """(petición, método, url, datos) para cada ruta de blog/urls.py"""
+        slug = self.post.slug
+        return [
+            ('post_list', 'get', reverse('blog:post_list'), None),
+            ('post_list:page2', 'get', reverse('blog:post_list') + '?page=2', None),
+            ('trending', 'get', reverse('blog:trending'), None),
+            ('trending:page2', 'get', reverse('blog:trending') + '?after=' + self.trending_cursor(), None),
+            ('search_suggest', 'get', reverse('blog:search_suggest') + '?q=dj', None),
+            ('post_create', 'get', reverse('blog:post_create'), None),
+            ('post_detail', 'get', reverse('blog:post_detail', args=[slug]), None),
+            ('post_comments', 'get', reverse('blog:post_comments', args=[slug]) + '?after=' + self.comment_cursor(), None),
+            ('post_edit', 'get', reverse('blog:post_edit', args=[slug]), None),
+            ('post_delete', 'get', reverse('blog:post_delete', args=[slug]), None),
+            ('signup', 'get', reverse('blog:signup'), None),
+            ('login', 'get', reverse('blog:login'), None),
+            ('profile', 'get', reverse('blog:profile'), None),
+            ('profile_edit', 'get', reverse('blog:profile_edit'), None),
+            ('engagement_export', 'get', reverse('blog:engagement_export'), None),
+            ('moderate_comment', 'get', reverse('blog:moderate_comment', args=[self.comment.id, 'approve']), None),
+            ('moderation_queue', 'get', reverse('blog:moderation_queue'), None),
+            ('moderation_queue:page2', 'get', reverse('blog:moderation_queue') + '?after=' + self.moderation_cursor(), None),
+            ('moderation_queue:post', 'post', reverse('blog:moderation_queue'),
+             {'action': 'approve', 'comment_ids': self.pending_ids()}),
+            ('tag_index', 'get', reverse('blog:tag_index'), None),
+            ('posts_by_tag', 'get', reverse('blog:posts_by_tag', args=['django']), None),
+            ('posts_by_tags', 'get', reverse('blog:posts_by_tags', args=['django+python']), None),
+            ('posts_by_tags:any', 'get', reverse('blog:posts_by_tags', args=['sql,rendimiento']), None),
+            ('add_reaction', 'get', reverse('blog:add_reaction', args=[slug]), None),
+            ('add_reaction:post', 'post', reverse('blog:add_reaction', args=[slug]), {'reaction_type': '👍'}),
+            ('vote_comment', 'post', reverse('blog:vote_comment', args=[self.comment.id]), {'vote': 1}),
+            ('toggle_comment_pin', 'get', reverse('blog:toggle_comment_pin', args=[self.comment.id]), None),
+            ('notifications', 'get', reverse('blog:notifications'), None),
+            ('mark_notification_read', 'get', reverse('blog:mark_notification_read', args=[self.notification.id]), None),
+            ('notification_count', 'get', reverse('blog:notification_count'), None),
+            ('user_suggest', 'get', reverse('blog:user_suggest') + f'?q=lec&post={self.post.id}', None),
+            ('subscriptions', 'get', reverse('blog:subscriptions'), None),
+            ('rss_feed', 'get', reverse('blog:rss_feed'), None),
+            ('rss_feed_filtered:author', 'get', reverse('blog:rss_feed_filtered', args=['author', self.author.id]), None),
+            ('rss_feed_filtered:tag', 'get', reverse('blog:rss_feed_filtered', args=['tag', 'django']), None),
+            ('sitemap_index', 'get', reverse('blog:sitemap_index'), None),
+            ('sitemap_section', 'get', reverse('blog:sitemap_section', args=['posts', 0]), None),
+            ('sitemap_section:tags', 'get', reverse('blog:sitemap_section', args=['tags', 0]), None),
+            ('api_posts', 'get', reverse('blog:api_posts'), None),
+            ('api_posts:page2', 'get', reverse('blog:api_posts') + '?after=' + self.api_cursor(), None),
+            ('api_post', 'get', reverse('blog:api_post', args=[slug]), None),
+            ('api_post_comments', 'get', reverse('blog:api_post_comments', args=[slug]), None),
+            ('api_tags', 'get', reverse('blog:api_tags'), None),
+            ('api_author', 'get', reverse('blog:api_author', args=[self.author.username]), None),
+            ('metrics_summary', 'get', reverse('blog:metrics_summary'), None),
+            ('logout', 'post', reverse('blog:logout'), None),
+        ]
+
+    def api_cursor(self):
+        return api.POSTS.cursor(Post.objects.filter(published=True).order_by('-published_date', '-id')
+                                .values('published_date', 'id')[9])
+
+    def trending_cursor(self):
+        tenth = Post.objects.filter(published=True, hot_score__gt=0).order_by('-hot_score', '-id')[9]
+        return f'{tenth.hot_score!r}:{tenth.id}'
+
+    def comment_cursor(self):
+        # Tras la segunda raíz: el resto es la página que pide "Cargar más"
+        second = self.post.comments.filter(depth=0).order_by('-pinned', '-wilson_score', 'created_date', 'id')[1]
+        return quote(comment_cursor(second))
+
+    def moderation_cursor(self):
+        pending = Comment.objects.filter(is_approved=False, rejected=False).order_by('-created_date', '-id')
+        return quote(moderation_cursor(pending[get_comments_per_page() - 1]))
+
+    def pending_ids(self):
+        return list(self.post.comments.filter(is_approved=False).values_list('id', flat=True))
+
+    def measure(self, user, method, url, data=None):
+        # Sin fragmentos cacheados: el presupuesto cubre el peor caso. Los índices
+        # en memoria se construyen una vez por proceso y quedan fuera de la medida
+        cache.clear()
+        tag_bitmaps.index.reset()
+        tag_bitmaps.index.ensure_built()
+        suggest.index.reset()
+        suggest.index.ensure_built()
+        self.client.logout()
+        if user is not None:
+            self.client.force_login(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, data or {})
+            if response.streaming:
+                # Las consultas de una respuesta en streaming se hacen al leerla
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 500, url)
+        return ctx.captured_queries
+
+    def count_rows(self, queries):
+        rows = 0
+        with connection.cursor() as cursor:
+            for query in queries:
+                if query['sql'].startswith('SELECT'):
+                    cursor.execute('SELECT COUNT(*) FROM (%s)' % query['sql'])
+                    rows += cursor.fetchone()[0]
+        return rows
+
+    def format_queries(self, queries):
+        return '\n'.join(f'  {i}. {q["sql"]}' for i, q in enumerate(queries, 1))
+
+    def test_every_route_has_a_budget(self):
+        from . import urls
+        names = {pattern.name for pattern in urls.urlpatterns}
+        covered = {key.split(':')[0] for key in self.BUDGETS}
+        self.assertEqual(names - covered, set())
+
+    def test_view_budgets(self):
+        failures = []
+        for key, method, url, data in self.requests():
+            for role, user in self.users().items():
+                max_queries, max_rows = self.BUDGETS[key][role]
+                queries = self.measure(user, method, url, data)
+                rows = self.count_rows(queries)
+                if len(queries) > max_queries or rows > max_rows:
+                    failures.append(
+                        f'{method.upper()} {url} como {role}: {len(queries)} consultas '
+                        f'(máx. {max_queries}), {rows} filas (máx. {max_rows})\n'
+                        + self.format_queries(queries)
+                    )
+        if failures:
+            self.fail('Presupuesto de consultas superado:\n' + '\n'.join(failures))
+
+    def test_queries_do_not_grow_with_related_rows(self):
+        urls = [
+            reverse('blog:post_list'),
+            reverse('blog:post_detail', args=[self.post.slug]),
+            reverse('blog:posts_by_tag', args=['django']),
+            reverse('blog:add_reaction', args=[self.post.slug]),
+            reverse('blog:notifications'),
+            reverse('blog:subscriptions'),
+        ]
+        before = {url: self.measure(self.author, 'get', url) for url in urls}
+
+        extra = User.objects.create_user('extra', password='clave-segura-123')
+        for post in self.posts[:10]:
+            comment = Comment.objects.create(post=post, author=extra, content='Otro', is_approved=True)
+            CommentVote.objects.create(comment=comment, user=self.author, vote=1)
+            Review.objects.create(post=post, user=extra, rating=4)
+            Reaction.objects.create(post=post, user=extra, reaction_type='😂')
+        Subscription.objects.create(user=self.author, subscription_type='author', author=extra)
+        Subscription.objects.create(user=self.author, subscription_type='tag', tag='web')
+
+        for url in urls:
+            after = self.measure(self.author, 'get', url)
+            self.assertEqual(
+                len(after), len(before[url]),
+                f'{url}: las consultas crecen con los datos\nAntes:\n{self.format_queries(before[url])}'
+                f'\nDespués:\n{self.format_queries(after)}'
+            )
+
+
+class ModelMethodQueryTests(TestCase):
+    """Los métodos de Post y Comment no dependen del número de filas relacionadas"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.readers, cls.posts = seed_blog(posts=3, comments_per_post=20)
+        cls.post = cls.posts[0]
+        cls.comment = cls.post.comments.first()
+
+    def test_post_methods_use_one_aggregate_each(self):
+        post = Post.objects.get(pk=self.post.pk)
+        for method in ('get_average_rating', 'get_rating_count', 'get_approved_comments_count'):
+            with self.subTest(method=method), CaptureQueriesContext(connection) as ctx:
+                getattr(post, method)()
+            self.assertEqual(len(ctx.captured_queries), 1)
+            self.assertNotIn('GROUP BY', ctx.captured_queries[0]['sql'])
+        with self.assertNumQueries(0):
+            post.reading_time
+
+    def test_post_methods_read_annotations(self):
+        post = Post.objects.with_stats().get(pk=self.post.pk)
+        with self.assertNumQueries(0):
+            average = post.get_average_rating()
+            self.assertEqual(post.get_rating_count(), len(self.readers))
+            self.assertEqual(post.get_approved_comments_count(), 15)
+        ratings = [review.rating for review in self.post.reviews.all()]
+        self.assertEqual(average, round(sum(ratings) / len(ratings), 1))
+
+    def test_comment_methods_use_one_query_each(self):
+        comment = Comment.objects.get(pk=self.comment.pk)
+        # Los votos están guardados en la fila
+        with self.assertNumQueries(0):
+            score = comment.get_score()
+        self.assertEqual(score, sum(vote.vote for vote in self.comment.votes.all()))
+        with self.assertNumQueries(1):
+            comment.get_user_vote(self.readers[0])
+
+
+class SeedBlogCommandTests(TestCase):
+    OPTIONS = {
+        'users': 6, 'posts': 12, 'tags': 5, 'comments': 40, 'votes': 60, 'reviews': 20,
+        'reactions': 20, 'notifications': 10, 'subscriptions': 2, 'seed': 7, 'chunk_size': 7,
+    }
+
+    def seed(self, prefix):
+        call_command('seed_blog', prefix=prefix, stdout=StringIO(), **self.OPTIONS)
+        posts = Post.objects.filter(slug__startswith=f'{prefix}-post-').order_by('id')
+        return {
+            'titles': list(posts.values_list('title', flat=True)),
+            'comments': list(Comment.objects.filter(post__in=posts).order_by('id').values_list('content', flat=True)),
+            'ratings': list(Review.objects.filter(post__in=posts).order_by('id').values_list('rating', flat=True)),
+        }
+
+    def test_creates_requested_volumes(self):
+        self.seed('a')
+        self.assertEqual(User.objects.filter(username__startswith='a_').count(), 6)
+        self.assertEqual(Post.objects.filter(slug__startswith='a-post-').count(), 12)
+        self.assertEqual(Comment.objects.count(), 40)
+        self.assertEqual(CommentVote.objects.count(), 60)
+        self.assertEqual(Review.objects.count(), 20)
+        self.assertEqual(Reaction.objects.count(), 20)
+        self.assertEqual(Notification.objects.count(), 10)
+        self.assertTrue(Post.objects.filter(tags__isnull=False).exists())
+        self.assertEqual(
+            sum(TagStats.objects.values_list('post_count', flat=True)),
+            Post.objects.filter(published=True, tags__isnull=False).count(),
+        )
+        # Las fechas se reparten en el pasado aunque los campos sean auto_now_add
+        self.assertLess(Comment.objects.order_by('created_date').first().created_date, timezone.now() - timezone.timedelta(days=1))
+
+    def test_same_seed_same_data(self):
+        first = self.seed('a')
+        # Partiendo de la misma base de datos la semilla reproduce los mismos datos
+        User.objects.all().delete()
+        Tag.objects.all().delete()
+        self.assertEqual(first, self.seed('b'))
+
+    def test_zero_subscriptions(self):
+        call_command('seed_blog', prefix='z', stdout=StringIO(), **{**self.OPTIONS, 'subscriptions': 0})
+        self.assertFalse(Subscription.objects.exists())
+        self.assertEqual(Post.objects.filter(slug__startswith='z-post-').count(), 12)
+
+
+class PostTransferTests(TestCase):
+    def setUp(self):
+        call_command('seed_blog', prefix='t', stdout=StringIO(), **SeedBlogCommandTests.OPTIONS)
+        root = Comment.objects.filter(is_approved=True).first()
+        reply = Comment.objects.create(post=root.post, parent=root, author=root.author, content='Respuesta',
+                                       is_approved=True)
+        Comment.objects.create(post=root.post, parent=reply, name='Anónimo', content='Otra', is_approved=True)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'posts.jsonl')
+
+    def snapshot(self):
+        """Lo que debe sobrevivir a exportar e importar, sin ids"""
+        posts = Post.objects.order_by('slug')
+        return {
+            'posts': list(posts.values_list('slug', 'title', 'author__username', 'created_date', 'published_date',
+                                            'updated_date', 'published', 'rendered_html')),
+            'tags': sorted(posts.values_list('slug', 'tags__name')),
+            'comments': sorted(Comment.objects.values_list(
+                'post__slug', 'content', 'created_date', 'parent__content', 'depth', 'reply_count', 'is_approved',
+            )),
+            'reviews': sorted(Review.objects.values_list('post__slug', 'user__username', 'rating', 'created_date')),
+            'stats': sorted(TagStats.objects.values_list('tag__name', 'post_count')),
+            'minhash': sorted(PostMinHash.objects.values_list('post__slug', 'content_hash', 'signature')),
+        }
+
+    def export(self):
+        call_command('export_posts', self.path, '--chunk-size', '5', stderr=StringIO())
+        with open(self.path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def test_round_trip_preserves_posts_threads_and_reviews(self):
+        # seed_blog tampoco pasa por las señales
+        duplicates.rebuild()
+        before = self.snapshot()
+        self.assertEqual(len(before['minhash']), 12)
+        records = self.export()
+        self.assertEqual(len(records), 12)
+        self.assertTrue(any(record['media'] for record in records))
+        self.assertTrue(any(comment['parent'] for record in records for comment in record['comments']))
+
+        Post.objects.all().delete()
+        out = StringIO()
+        call_command('import_posts', self.path, '--chunk-size', '5', stdout=out)
+        self.assertIn('12 posts importados', out.getvalue())
+        self.assertEqual(self.snapshot(), before)
+        self.assertEqual(StaleRelatedPost.objects.count(), 12)
+
+        # Repetirla no duplica nada
+        out = StringIO()
+        call_command('import_posts', self.path, stdout=out)
+        self.assertIn('0 posts importados, 12 ya existían', out.getvalue())
+
+    def test_missing_users_are_created_without_password(self):
+        self.export()
+        Post.objects.all().delete()
+        author = User.objects.get(username='t_0')
+        User.objects.filter(username__startswith='t_').exclude(pk=author.pk).delete()
+        call_command('import_posts', self.path, stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 12)
+        created = User.objects.exclude(pk=author.pk).filter(username__startswith='t_')
+        self.assertTrue(created.exists())
+        self.assertFalse(any(user.has_usable_password() for user in created))
+
+    def test_resumes_from_checkpoint(self):
+        self.export()
+        Post.objects.all().delete()
+        with open(self.path, 'rb') as f:
+            lines = f.readlines()
+
+        # Interrumpida tras las tres primeras líneas: sigue desde ahí
+        checkpoint = self.path + '.checkpoint'
+        transfer.Checkpoint(checkpoint).save(len(b''.join(lines[:3])))
+        call_command('import_posts', self.path, '--checkpoint', checkpoint, '--chunk-size', '4', stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 9)
+        self.assertEqual(transfer.Checkpoint(checkpoint).load(), os.path.getsize(self.path))
+        self.assertFalse(Post.objects.filter(slug__in=[json.loads(line)['slug'] for line in lines[:3]]).exists())
+
+
+class LoadTestCommandTests(TestCase):
+    def setUp(self):
+        seed_blog(posts=6, comments_per_post=3, readers=3)
+        # Como hace el Client de test: las peticiones no cierran la conexión del test
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        self.addCleanup(request_started.connect, close_old_connections)
+        self.addCleanup(request_finished.connect, close_old_connections)
+
+    def run_loadtest(self, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'resultados.json')
+            call_command('loadtest', requests=40, concurrency=1, output=path, stdout=StringIO(), **options)
+            with open(path) as f:
+                return json.load(f)
+
+    def assert_clean_run(self, results):
+        self.assertEqual(results['total']['requests'], 40)
+        self.assertEqual(results['errors'], {})
+        self.assertEqual(set(results['scenarios']), set(loadtest.DEFAULT_MIX))
+        self.assertIsNotNone(results['total']['queries_per_request'])
+        self.assertLessEqual(results['total']['p50_ms'], results['total']['p99_ms'])
+        # Las sesiones de los usuarios virtuales se borran al terminar
+        self.assertFalse(Session.objects.exists())
+
+    def test_wsgi_in_process(self):
+        results = self.run_loadtest(target='wsgi')
+        self.assert_clean_run(results)
+        self.assertEqual(results['meta']['target'], 'wsgi')
+
+    def test_asgi_in_process(self):
+        self.assert_clean_run(self.run_loadtest(target='asgi'))
+
+    def test_same_seed_same_script(self):
+        data = loadtest.TrafficData()
+        first = loadtest.build_script(loadtest.DEFAULT_MIX, data, 50, random.Random(3))
+        self.assertEqual(first, loadtest.build_script(loadtest.DEFAULT_MIX, data, 50, random.Random(3)))
+
+    def test_locked_database_is_reported_separately(self):
+        self.assertEqual(
+            loadtest._classify(500, b'', [OperationalError('database is locked')]), loadtest.LOCKED_ERROR
+        )
+        self.assertEqual(loadtest._classify(500, b'', [ValueError('x')]), 'ValueError')
+        self.assertEqual(loadtest._classify(404, b'', []), 'HTTP 404')
+        self.assertIsNone(loadtest._classify(200, b'', []))
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(loadtest.percentile(values, 0.50), 50)
+        self.assertEqual(loadtest.percentile(values, 0.99), 99)
+        self.assertEqual(loadtest.percentile([7], 0.95), 7)
+
+
+@override_settings(BLOG_SITEMAP_SEGMENT_SIZE=3)
+class SitemapTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        override = self.settings(BLOG_SITEMAP_DIR=self.directory)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.author = User.objects.create_user('autor', password='clave-segura-123')
+        self.posts = [create_post(self.author, f'Post {i}') for i in range(5)]
+        self.posts[0].tags.add('django')
+        create_post(self.author, 'Borrador', published=False, published_date=None)
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/xml')
+        return response, b''.join(response.streaming_content).decode()
+
+    def locs(self, body):
+        return re.findall(r'<loc>http://testserver(.*?)</loc>', body)
+
+    def segment(self, post):
+        return post.pk // 3
+
+    def test_index_lists_segments(self):
+        _, body = self.get(reverse('blog:sitemap_index'))
+        segments = sorted({self.segment(post) for post in self.posts})
+        self.assertEqual(self.locs(body), [
+            reverse('blog:sitemap_section', args=['posts', n]) for n in segments
+        ] + [reverse('blog:sitemap_section', args=['tags', Tag.objects.get(name='django').pk // 3])])
+        self.assertIn('<lastmod>', body)
+
+    def test_segment_streams_urls_and_is_reused_until_it_changes(self):
+        number = self.segment(self.posts[-1])
+        url = reverse('blog:sitemap_section', args=['posts', number])
+        response, body = self.get(url)
+        expected = [post.get_absolute_url() for post in self.posts if self.segment(post) == number]
+        self.assertEqual(self.locs(body), expected)
+        self.assertTrue(response.has_header('Last-Modified'))
+        files = os.listdir(self.directory)
+        self.assertEqual(len(files), 1)
+
+        # Sin cambios se sirve el fichero, sin volver a generar el XML
+        with CaptureQueriesContext(connection) as ctx:
+            _, again = self.get(url)
+        self.assertEqual(again, body)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+        # Un post editado cambia la huella: se regenera y se borra la versión vieja
+        post = Post.objects.get(pk=self.posts[-1].pk)
+        post.title = 'Editado'
+        post.slug = 'editado'
+        post.save()
+        _, body = self.get(url)
+        self.assertIn('/post/editado/', body)
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+        self.assertNotEqual(os.listdir(self.directory), files)
+
+    def test_changes_that_keep_count_and_lastmod_regenerate_the_segment(self):
+        first, second = next((a, b) for a, b in zip(self.posts, self.posts[1:]) if self.segment(a) == self.segment(b))
+        url = reverse('blog:sitemap_section', args=['posts', self.segment(first)])
+        self.get(url)
+        # update() no toca updated_date: mismo número de URLs y mismo lastmod
+        Post.objects.filter(pk=first.pk).update(slug='cambiado')
+        Post.objects.filter(pk=second.pk).update(slug=first.slug)
+        Post.objects.filter(pk=first.pk).update(slug=second.slug)
+        _, body = self.get(url)
+        self.assertLess(body.index(f'/post/{second.slug}/'), body.index(f'/post/{first.slug}/'))
+
+        tag = Tag.objects.get(name='django')
+        url = reverse('blog:sitemap_section', args=['tags', tag.pk // 3])
+        self.assertIn('/tag/django/', self.get(url)[1])
+        tag.name = tag.slug = 'django-orm'
+        tag.save()
+        _, body = self.get(url)
+        self.assertIn('/tag/django-orm/', body)
+        self.assertNotIn('/tag/django/', body)
+
+    def test_unknown_or_empty_segments_are_404(self):
+        self.assertEqual(self.client.get(reverse('blog:sitemap_section', args=['posts', 999])).status_code, 404)
+        self.assertEqual(self.client.get('/sitemap-users-0.xml').status_code, 404)
+        for number in ('99999999999999999999', '9223372036854775807'):
+            self.assertEqual(self.client.get(f'/sitemap-posts-{number}.xml').status_code, 404)
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('autor', password='clave-segura-123', first_name='Ana')
+        self.other = User.objects.create_user('otra', password='clave-segura-123')
+        now = timezone.now()
+        self.posts = [
+            create_post(self.author, f'Post {i}', published_date=now - timezone.timedelta(hours=i)) for i in range(5)
+        ]
+        self.posts[0].tags.add('django', 'python')
+        create_post(self.other, 'Ajeno', published_date=now - timezone.timedelta(days=1))
+        create_post(self.author, 'Borrador', published=False, published_date=None)
+
+    def get_json(self, url, **headers):
+        response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response, json.loads(response.content)
+
+    def test_sparse_fields_only_read_their_columns(self):
+        with CaptureQueriesContext(connection) as ctx:
+            _, data = self.get_json(reverse('blog:api_posts') + '?fields=title,url&limit=1')
+        self.assertEqual(data['results'], [{'title': 'Post 0', 'url': '/post/post-0/'}])
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertNotIn('rendered_html', ctx.captured_queries[0]['sql'])
+        self.assertNotIn('"content"', ctx.captured_queries[0]['sql'])
+
+        _, data = self.get_json(reverse('blog:api_posts') + '?limit=1')
+        self.assertEqual(data['results'][0]['tags'], ['django', 'python'])
+        self.assertNotIn('content', data['results'][0])
+        response = self.client.get(reverse('blog:api_posts') + '?fields=title,password')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', json.loads(response.content)['error'])
+
+    def test_cursor_pagination_walks_every_published_post(self):
+        url, ids = reverse('blog:api_posts') + '?fields=id&limit=2', []
+        while url:
+            _, data = self.get_json(url)
+            ids += [post['id'] for post in data['results']]
+            url = data['next']
+        expected = Post.objects.filter(published=True).order_by('-published_date', '-id').values_list('id', flat=True)
+        self.assertEqual(ids, list(expected))
+
+        _, data = self.get_json(reverse('blog:api_posts') + '?fields=id&author=otra')
+        self.assertEqual(len(data['results']), 1)
+        _, data = self.get_json(reverse('blog:api_posts') + '?fields=id&tag=django')
+        self.assertEqual(data['results'], [{'id': self.posts[0].id}])
+        self.assertEqual(self.client.get(reverse('blog:api_posts') + '?after=1:x').status_code, 400)
+
+    def test_etag_revalidates_until_a_row_changes(self):
+        url = reverse('blog:api_posts')
+        response, _ = self.get_json(url)
+        etag = response['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], etag)
+
+        # gzip: otra representación, otro ETag
+        compressed = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertNotEqual(compressed['ETag'], etag)
+        self.assertEqual(json.loads(gzip.decompress(compressed.content)), json.loads(response.content))
+
+        post = Post.objects.get(pk=self.posts[1].pk)
+        post.content = '<p>Contenido editado</p>'
+        post.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # Las etiquetas no cambian updated_date, pero también cuentan
+        etag = response['ETag']
+        self.posts[2].tags.add('sql')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_changes_when_posts_are_rendered_again(self):
+        post = self.posts[0]
+        urls = [
+            reverse('blog:api_post', args=[post.slug]), reverse('blog:api_posts') + '?fields=id,summary,reading_time',
+        ]
+        etags = [self.get_json(url)[0]['ETag'] for url in urls]
+        # Como al optimizar una imagen: rebuild() reescribe el HTML, no updated_date
+        Post.objects.filter(pk=post.pk).update(content='<h2>Nuevo</h2><p>' + 'palabra ' * 400 + '</p>')
+        self.assertEqual(rendering.rebuild(Post.objects.filter(pk=post.pk)), 1)
+        for url, etag in zip(urls, etags):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('Nuevo', self.get_json(urls[0])[1]['content'])
+
+    def test_post_comments_tags_and_author(self):
+        post = self.posts[0]
+        _, data = self.get_json(reverse('blog:api_post', args=[post.slug]))
+        self.assertEqual(data['content'], post.rendered_html)
+        self.assertEqual(self.client.get(reverse('blog:api_post', args=['borrador'])).status_code, 404)
+
+        Comment.objects.create(post=post, author=self.other, content='Visible', is_approved=True)
+        Comment.objects.create(post=post, name='Anónimo', content='Pendiente')
+        _, data = self.get_json(reverse('blog:api_post_comments', args=[post.slug]))
+        self.assertEqual([(c['author'], c['content']) for c in data['results']], [('otra', 'Visible')])
+
+        _, data = self.get_json(reverse('blog:api_tags'))
+        self.assertEqual([tag['slug'] for tag in data['results']], ['django', 'python'])
+        self.assertEqual(data['results'][0]['url'], reverse('blog:posts_by_tag', args=['django']))
+
+        _, data = self.get_json(reverse('blog:api_author', args=['autor']))
+        self.assertEqual((data['name'], data['posts']), ('Ana', 5))
+        self.assertEqual(data['posts_url'], reverse('blog:api_posts') + '?author=autor')
+
+
+
+class EngagementExportTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('autor', password='clave-segura-123')
+        self.reader = User.objects.create_user('lector', password='clave-segura-123')
+        self.post = create_post(self.author, 'Mi post')
+        other = create_post(self.reader, 'Ajeno')
+        Review.objects.create(post=self.post, user=self.reader, rating=4, comment='=HYPERLINK("http://x")')
+        Review.objects.create(post=other, user=self.author, rating=1)
+        Comment.objects.create(post=self.post, author=self.reader, content='Muy bueno', is_approved=True)
+        Comment.objects.create(post=self.post, name='Anónimo', content='Sin cuenta', is_approved=True)
+        Comment.objects.create(post=self.post, author=self.reader, content='Pendiente')
+        Reaction.objects.create(post=self.post, user=self.reader, reaction_type='❤️')
+
+    def read_csv(self, response):
+        self.assertTrue(response.streaming)
+        return list(csv.reader(StringIO(b''.join(response.streaming_content).decode('utf-8-sig'))))
+
+    def test_profile_export_streams_only_the_authors_engagement(self):
+        self.assertEqual(self.client.get(reverse('blog:engagement_export')).status_code, 302)
+        self.client.force_login(self.author)
+        response = self.client.get(reverse('blog:engagement_export'))
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('interaccion-autor.csv', response['Content-Disposition'])
+        rows = self.read_csv(response)
+        self.assertEqual(rows[0], list(engagement.HEADER))
+        self.assertEqual([(row[0], row[2], row[4], row[5], row[6]) for row in rows[1:]], [
+            ('reseña', 'mi-post', 'lector', '4', '\'=HYPERLINK("http://x")'),
+            ('comentario', 'mi-post', 'lector', '0', 'Muy bueno'),
+            ('comentario', 'mi-post', 'Anónimo', '0', 'Sin cuenta'),
+            ('reacción', 'mi-post', 'lector', '❤️', ''),
+        ])
+
+    def test_admin_action_and_command_match_the_view(self):
+        self.client.force_login(self.author)
+        expected = self.read_csv(self.client.get(reverse('blog:engagement_export')))
+
+        self.client.force_login(User.objects.create_superuser('admin', password='clave-segura-123'))
+        response = self.client.post(reverse('admin:blog_post_changelist'), {
+            'action': 'export_engagement', '_selected_action': [self.post.id],
+        })
+        self.assertEqual(self.read_csv(response), expected)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'autor.csv')
+            call_command('export_engagement', 'autor', path, stderr=StringIO())
+            with open(path, encoding='utf-8', newline='') as f:
+                self.assertEqual(list(csv.reader(f)), expected)
+        with self.assertRaises(CommandError):
+            call_command('export_engagement', 'nadie', stderr=StringIO())
+
+class ImageOptimizationTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media_root = directory.name
+        override = self.settings(MEDIA_ROOT=self.media_root, MEDIA_URL='/media/', BLOG_IMAGE_WIDTHS=(480, 960))
+        override.enable()
+        self.addCleanup(override.disable)
+        self.staff = User.objects.create_user('editor', password='clave-segura-123', is_staff=True)
+
+    def upload(self, size=(2000, 1000)):
+        from PIL import Image
+
+        exif = Image.Exif()
+        exif[0x0112] = 6                # orientación: girar 90°
+        exif[0x010F] = 'Cámara'
+        buffer = BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, format='JPEG', exif=exif)
+        buffer.name = 'foto.jpg'
+        buffer.seek(0)
+        self.client.force_login(self.staff)
+        response = self.client.post(reverse('ckeditor_upload') + '?responseType=json', {'upload': buffer})
+        return response.json()['url']
+
+    def test_upload_is_queued_and_optimized_in_background(self):
+        from PIL import Image
+
+        url = self.upload()
+        upload = UploadedImage.objects.get()
+        self.assertIsNone(upload.processed_at)
+        post = create_post(self.staff, content=f'<p><img src="{url}" alt="Foto"></p>')
+        self.assertNotIn('srcset', post.rendered_html)
+
+        out = StringIO()
+        call_command('optimize_images', stdout=out)
+        self.assertIn('1 imágenes optimizadas', out.getvalue())
+        upload.refresh_from_db()
+        self.assertIsNotNone(upload.processed_at)
+        # Girada según el EXIF (1000x2000) y luego reducida a BLOG_IMAGE_MAX_WIDTH
+        self.assertEqual((upload.width, upload.height), (1000, 2000))
+        with Image.open(os.path.join(self.media_root, upload.path)) as image:
+            self.assertEqual(image.size, (1000, 2000))
+            self.assertFalse(image.getexif())
+        self.assertEqual([width for _, width in upload.variants], [480, 960])
+        for path, width in upload.variants:
+            self.assertTrue(path.startswith('responsive/uploads/'))
+            with Image.open(os.path.join(self.media_root, path)) as image:
+                self.assertEqual(image.width, width)
+
+        post.refresh_from_db()
+        self.assertIn(
+            f'width="1000" height="2000" srcset="/media/{upload.variants[0][0]} 480w, '
+            f'/media/{upload.variants[1][0]} 960w, {url} 1000w" sizes="(max-width: 1000px) 100vw, 1000px"',
+            post.rendered_html,
+        )
+
+    @override_settings(BLOG_IMAGE_MAX_WIDTH=800)
+    def test_save_uses_processed_variants_without_opening_the_file(self):
+        url = self.upload(size=(1000, 3000))
+        images.process_pending()
+        upload = UploadedImage.objects.get()
+        self.assertEqual((upload.width, upload.height), (800, 267))
+        self.assertEqual([width for _, width in upload.variants], [480])
+        os.remove(os.path.join(self.media_root, upload.path))
+
+        post = create_post(self.staff, content=f'<img src="{url}" style="width: 400px">')
+        self.assertIn(
+            f'width="400" height="134" srcset="/media/{upload.variants[0][0]} 480w, {url} 800w" '
+            f'sizes="(max-width: 400px) 100vw, 400px"',
+            post.rendered_html,
+        )
+
+    def test_discover_queues_existing_uploads(self):
+        from PIL import Image
+
+        os.makedirs(os.path.join(self.media_root, 'uploads', '2024'))
+        Image.new('RGB', (10, 10)).save(os.path.join(self.media_root, 'uploads', '2024', 'vieja.png'))
+        Image.new('RGB', (10, 10)).save(os.path.join(self.media_root, 'uploads', '2024', 'vieja_thumb.jpg'))
+        call_command('optimize_images', '--discover', stdout=StringIO())
+        self.assertEqual(list(UploadedImage.objects.values_list('path', 'width')), [('uploads/2024/vieja.png', 10)])
+
+    def test_transparent_png_keeps_its_alpha(self):
+        from PIL import Image, PngImagePlugin
+
+        os.makedirs(os.path.join(self.media_root, 'uploads'))
+        text = PngImagePlugin.PngInfo()
+        text.add_text('Comment', 'ruta privada')
+        palette = Image.new('P', (1200, 600), 0)
+        palette.putpalette([255, 255, 255, 255, 0, 0])
+        palette.paste(1, (0, 0, 600, 600))
+        palette.save(os.path.join(self.media_root, 'uploads', 'paleta.png'), transparency=0, pnginfo=text,
+                     icc_profile=b'perfil')
+        alpha = Image.new('RGBA', (1200, 600), (255, 0, 0, 0))
+        alpha.paste((255, 0, 0, 255), (0, 0, 600, 600))
+        alpha.save(os.path.join(self.media_root, 'uploads', 'alfa.png'), pnginfo=text)
+        UploadedImage.objects.bulk_create([UploadedImage(path=f'uploads/{name}.png') for name in ('paleta', 'alfa')])
+
+        with self.settings(BLOG_IMAGE_MAX_WIDTH=1000):
+            images.process_pending()
+        for upload in UploadedImage.objects.all():
+            for path, width in [[upload.path, 1000]] + upload.variants:
+                with self.subTest(path=path), Image.open(os.path.join(self.media_root, path)) as image:
+                    self.assertEqual(image.width, width)
+                    self.assertNotIn('Comment', image.info)
+                    self.assertNotIn('icc_profile', image.info)
+                    rgba = image.convert('RGBA')
+                    self.assertEqual(rgba.getpixel((0, 0))[3], 255)
+                    self.assertEqual(rgba.getpixel((image.width - 1, 0))[3], 0)
+
+
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        override = self.settings(BLOG_PROFILE_DIR=self.directory)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.staff = User.objects.create_user('editor', password='clave-segura-123', is_staff=True)
+        self.reader = User.objects.create_user('lector', password='clave-segura-123')
+        self.post = create_post(self.staff)
+        self.url = reverse('blog:post_detail', args=[self.post.slug])
+
+    def profiles(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_staff_can_request_cprofile(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(self.url, {'_profile': '1'})
+        path = response['X-Profile-File']
+        self.assertEqual(self.profiles(), [os.path.basename(path) + '.collapsed', os.path.basename(path) + '.prof'])
+        functions = {name for _, _, name in pstats.Stats(path + '.prof').stats}
+        self.assertIn('post_detail', functions)
+        with open(path + '.collapsed') as f:
+            for line in f:
+                self.assertRegex(line, r'^\S.* \d+$')
+
+    def test_staff_can_request_sampling_profiler_by_header(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(self.url, headers={'X-Profile': 'sampling'})
+        self.assertTrue(response['X-Profile-File'].endswith('ms'))
+        self.assertEqual([name.rsplit('.', 1)[1] for name in self.profiles()], ['collapsed'])
+
+    def test_flag_is_ignored_for_non_staff(self):
+        self.client.force_login(self.reader)
+        response = self.client.get(self.url, {'_profile': '1'})
+        self.assertNotIn('X-Profile-File', response)
+        self.client.logout()
+        self.client.get(self.url, {'_profile': '1'})
+        self.assertEqual(self.profiles(), [])
+
+    @override_settings(BLOG_PROFILE_SAMPLE_RATE=1.0, BLOG_PROFILE_SLOW_MS=0)
+    def test_sampled_slow_requests_are_logged_with_profile(self):
+        with self.assertLogs('blog.profiling', 'WARNING') as logs:
+            response = self.client.get(self.url)
+        self.assertNotIn('X-Profile-File', response)
+        record = logs.records[0]
+        self.assertIn('Petición lenta GET', record.getMessage())
+        self.assertIn('post_detail', record.getMessage())
+        self.assertTrue(os.path.exists(record.profile + '.prof'))
+
+    @override_settings(BLOG_PROFILE_SAMPLE_RATE=1.0, BLOG_PROFILE_SLOW_MS=60000)
+    def test_sampled_fast_requests_are_discarded(self):
+        self.client.get(self.url)
+        self.assertEqual(self.profiles(), [])
+
+    def test_sampler_records_request_thread_stacks(self):
+        def busy_view_function():
+            end = time.perf_counter() + 0.1
+            while time.perf_counter() < end:
+                pass
+
+        sampler = profiling.SamplingProfiler(interval=0.001)
+        sampler.start()
+        busy_view_function()
+        sampler.stop()
+        self.assertTrue(any('busy_view_function' in stack for stack in sampler.samples))
+        self.assertIn('busy_view_function', sampler.top())
+
+    def test_sampler_follows_the_view_thread(self):
+        # Como con ASGI: el middleware en un hilo y la vista en otro
+        def busy_view_function():
+            sampler.follow_current_thread()
+            end = time.perf_counter() + 0.1
+            while time.perf_counter() < end:
+                pass
+
+        sampler = profiling.SamplingProfiler(interval=0.001)
+        sampler.start()
+        view_thread = threading.Thread(target=busy_view_function)
+        view_thread.start()
+        view_thread.join()
+        sampler.stop()
+        self.assertIn('busy_view_function', sampler.top())
+
+
+class TagStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('autor', password='clave-segura-123')
+        self.now = timezone.now()
+
+    def stats(self):
+        return {item.tag.name: (item.post_count, item.last_published) for item in TagStats.objects.select_related('tag')}
+
+    def test_tag_changes_update_stats(self):
+        first = create_post(self.author, 'Uno', published_date=self.now - timezone.timedelta(days=2))
+        second = create_post(self.author, 'Dos', published_date=self.now)
+        first.tags.add('django', 'python')
+        second.tags.add('django')
+        self.assertEqual(self.stats(), {'django': (2, self.now), 'python': (1, first.published_date)})
+
+        second.tags.remove('django')
+        self.assertEqual(self.stats()['django'], (1, first.published_date))
+        first.tags.set(['web'])
+        self.assertEqual(self.stats(), {'web': (1, first.published_date)})
+        first.tags.clear()
+        self.assertEqual(self.stats(), {})
+
+    def test_publishing_and_deleting_posts_update_stats(self):
+        post = create_post(self.author, 'Borrador', published=False, published_date=None)
+        post.tags.add('django')
+        self.assertEqual(self.stats(), {})
+
+        post.published, post.published_date = True, self.now
+        post.save()
+        self.assertEqual(self.stats(), {'django': (1, self.now)})
+        post.delete()
+        self.assertEqual(self.stats(), {})
+
+    def test_rebuild_after_bulk_load(self):
+        post = create_post(self.author, 'Uno')
+        tag = Tag.objects.create(name='sql', slug='sql')
+        # bulk_create no envía m2m_changed
+        TaggedItem.objects.bulk_create([
+            TaggedItem(content_type=ContentType.objects.get_for_model(Post), object_id=post.id, tag=tag)
+        ])
+        self.assertEqual(self.stats(), {})
+        call_command('rebuild_tag_stats', stdout=StringIO())
+        self.assertEqual(self.stats(), {'sql': (1, post.published_date)})
+
+    def test_cloud_weights(self):
+        for i in range(8):
+            post = create_post(self.author, f'Post {i}')
+            post.tags.add('django', *(['python'] if i < 2 else []))
+        cloud = TagStats.objects.cloud()
+        self.assertEqual([(item.tag.name, item.weight) for item in cloud], [('django', 5), ('python', 1)])
+
+    def test_tag_cloud_fragment_is_cached_until_stats_change(self):
+        create_post(self.author, 'Uno').tags.add('django')
+        response = self.client.get(reverse('blog:post_list'))
+        self.assertContains(response, reverse('blog:posts_by_tag', args=['django']))
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('blog:post_list'))
+        self.assertFalse([q for q in ctx.captured_queries if 'blog_tagstats' in q['sql']])
+
+        create_post(self.author, 'Dos').tags.add('rendimiento')
+        response = self.client.get(reverse('blog:post_list'))
+        self.assertContains(response, reverse('blog:posts_by_tag', args=['rendimiento']))
+
+    def test_tag_index_sorting(self):
+        older = create_post(self.author, 'Uno', published_date=self.now - timezone.timedelta(days=3))
+        newer = create_post(self.author, 'Dos', published_date=self.now)
+        older.tags.add('alfa', 'beta')
+        newer.tags.add('beta', 'gamma')
+        for sort, expected in [
+            ('name', ['alfa', 'beta', 'gamma']),
+            ('popular', ['beta', 'alfa', 'gamma']),
+            ('recent', ['beta', 'gamma', 'alfa']),
+        ]:
+            with self.subTest(sort=sort):
+                response = self.client.get(reverse('blog:tag_index'), {'sort': sort})
+                self.assertEqual([tag.name for tag in response.context['tags']], expected)
+        self.assertContains(response, '<span class="badge bg-primary rounded-pill">2</span>', html=True)
+
+    def test_posts_by_tag_uses_stored_count(self):
+        for i in range(12):
+            create_post(self.author, f'Post {i}').tags.add('django')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('blog:posts_by_tag', args=['django']), {'page': 2})
+        self.assertEqual(response.context['page_obj'].paginator.count, 12)
+        self.assertEqual(len(response.context['page_obj']), 2)
+        self.assertFalse([q for q in ctx.captured_queries if 'COUNT(*)' in q['sql']])
+
+
+class TagBitmapIndexTests(TestCase):
+    def setUp(self):
+        tag_bitmaps.index.reset()
+        self.author = User.objects.create_user('autor', password='clave-segura-123')
+        self.now = timezone.now()
+        self.posts = []
+        for i, tags in enumerate([('django', 'python'), ('python',), ('django',), ('django', 'python', 'sql')]):
+            post = create_post(self.author, f'Post {i}', published_date=self.now - timezone.timedelta(days=10 - i))
+            post.tags.add(*tags)
+            self.posts.append(post)
+        create_post(self.author, 'Borrador', published=False, published_date=None).tags.add('django', 'python')
+
+    def titles(self, expression, **params):
+        response = self.client.get(reverse('blog:posts_by_tags', args=[expression]), params)
+        self.assertEqual(response.status_code, 200)
+        return [post.title for post in response.context['page_obj']]
+
+    def test_and_or_match_database(self):
+        self.assertEqual(self.titles('django+python'), ['Post 3', 'Post 0'])
+        self.assertEqual(self.titles('python,sql'), ['Post 3', 'Post 1', 'Post 0'])
+        self.assertEqual(self.titles('django+python+sql'), ['Post 3'])
+        # Misma respuesta que el ORM con una consulta por etiqueta
+        expected = Post.objects.filter(published=True, tags__slug='django').filter(tags__slug='python')
+        self.assertEqual(self.titles('python+django'), [p.title for p in expected.order_by('-published_date')])
+
+    def test_unknown_tags(self):
+        self.assertEqual(self.client.get(reverse('blog:posts_by_tags', args=['django+nada'])).status_code, 404)
+        self.assertEqual(self.titles('sql,nada'), ['Post 3'])
+        self.assertEqual(self.client.get('/tag/django+python,sql/').status_code, 404)
+
+    def test_pagination_loads_one_page(self):
+        for i in range(12):
+            create_post(self.author, f'Extra {i}', published_date=self.now + timezone.timedelta(minutes=i)) \
+                .tags.add('django', 'python')
+        tag_bitmaps.index.ensure_built()
+        with CaptureQueriesContext(connection) as ctx:
+            titles = self.titles('django+python', page=2)
+        self.assertEqual(titles, ['Extra 1', 'Extra 0', 'Post 3', 'Post 0'])
+        posts_queries = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT "blog_post"')]
+        self.assertEqual(len(posts_queries), 1)
+        self.assertIn('"blog_post"."id" IN', posts_queries[0])
+        self.assertFalse([q for q in ctx.captured_queries if 'COUNT(' in q['sql'] and 'blog_review' not in q['sql']])
+
+    def test_signals_update_index_after_commit(self):
+        tag_bitmaps.index.ensure_built()
+        built_at = tag_bitmaps.index.built_at
+        with self.captureOnCommitCallbacks(execute=True):
+            self.posts[1].tags.add('django')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.posts[0].tags.remove('python')
+        with self.captureOnCommitCallbacks(execute=True):
+            newest = create_post(self.author, 'Nuevo')
+            newest.tags.add('django', 'python')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.posts[3].published = False
+            self.posts[3].save()
+        self.assertEqual(self.titles('django+python'), ['Nuevo', 'Post 1'])
+        # Todo se aplicó en su sitio, sin reconstruir
+        self.assertEqual(tag_bitmaps.index.built_at, built_at)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            newest.delete()
+        self.assertEqual(self.titles('django+python'), ['Post 1'])
+
+    def test_backdated_post_forces_rebuild(self):
+        tag_bitmaps.index.ensure_built()
+        with self.captureOnCommitCallbacks(execute=True):
+            create_post(self.author, 'Antiguo', published_date=self.now - timezone.timedelta(days=30)) \
+                .tags.add('sql')
+        self.assertIsNone(tag_bitmaps.index.built_at)
+        self.assertEqual(self.titles('sql,nada'), ['Post 3', 'Antiguo'])
+
+    def test_published_post_without_date_is_indexed_the_same_way(self):
+        undated = create_post(self.author, 'Sin fecha', published_date=None)
+        undated.tags.add('sql')
+        tag_bitmaps.index.ensure_built()
+        self.assertEqual(self.titles('sql,nada'), ['Post 3', 'Sin fecha'])
+        with self.captureOnCommitCallbacks(execute=True):
+            undated.tags.add('django')
+        self.assertEqual(self.titles('sql,nada'), ['Post 3', 'Sin fecha'])
+        # Uno nuevo sin fecha va antes que todos: se reconstruye y también entra
+        with self.captureOnCommitCallbacks(execute=True):
+            create_post(self.author, 'Otro sin fecha', published_date=None).tags.add('sql')
+        self.assertIsNone(tag_bitmaps.index.built_at)
+        self.assertEqual(self.titles('sql,nada'), ['Post 3', 'Otro sin fecha', 'Sin fecha'])
+
+    def test_changes_are_ignored_until_commit(self):
+        tag_bitmaps.index.ensure_built()
+        self.posts[2].tags.add('python')
+        self.assertEqual(self.titles('django+python'), ['Post 3', 'Post 0'])
+
+
+class SearchSuggestTests(TestCase):
+    def setUp(self):
+        suggest.index.reset()
+        self.author = User.objects.create_user('autor', password='clave-segura-123')
+        self.guide = create_post(self.author, 'Guía de Django', slug='guia-de-django', hot_score=5)
+        self.guide.tags.add('django')
+        create_post(self.author, 'Django avanzado', hot_score=9).tags.add('django', 'python')
+        create_post(self.author, 'Diseño web', slug='diseno-web', hot_score=1).tags.add('diseno')
+        create_post(self.author, 'Django en borrador', published=False, published_date=None)
+
+    def get(self, q):
+        response = self.client.get(reverse('blog:search_suggest'), {'q': q})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def titles(self, q):
+        return [post['title'] for post in self.get(q).json()['posts']]
+
+    def test_prefix_of_any_word_ranked_by_popularity(self):
+        self.assertEqual(self.titles('DJ'), ['Django avanzado', 'Guía de Django'])
+        self.assertEqual(self.titles('guia de dj'), ['Guía de Django'])
+        self.assertEqual(self.titles('dise'), ['Diseño web'])
+        self.assertEqual(self.titles('  '), [])
+        data = self.get('d').json()
+        self.assertEqual(
+            [(tag['name'], tag['posts']) for tag in data['tags']], [('django', 2), ('diseno', 1)]
+        )
+        self.assertEqual(data['tags'][0]['url'], reverse('blog:posts_by_tag', args=['django']))
+        self.assertEqual(data['posts'][0]['url'], reverse('blog:post_detail', args=['django-avanzado']))
+
+    def test_answers_from_memory_with_cache_headers(self):
+        suggest.index.ensure_built()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.get('django')
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertIn('max-age=60', response['Cache-Control'])
+        self.assertIn('public', response['Cache-Control'])
+
+    @override_settings(BLOG_SUGGEST_LIMITS={'posts': 1})
+    def test_long_ranges_are_memoized_and_invalidated(self):
+        for i in range(suggest.SCAN_LIMIT):
+            create_post(self.author, f'Dato {i}', hot_score=2)
+        suggest.index.ensure_built()
+        built_at = suggest.index.built_at
+        self.assertEqual(self.titles('d'), ['Django avanzado'])
+        self.assertIn('d', suggest.index.indexes[suggest.POSTS].memo)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.filter(title='Dato 7').update(hot_score=20)
+            post = Post.objects.get(title='Dato 7')
+            post.title = 'Dato estrella'
+            post.save()
+        self.assertEqual(self.titles('d'), ['Dato estrella'])
+        self.assertEqual(self.titles('estr'), ['Dato estrella'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            post.delete()
+        self.assertEqual(self.titles('d'), ['Django avanzado'])
+        self.assertEqual(suggest.index.built_at, built_at)
+
+    def test_signals_update_index_after_commit(self):
+        suggest.index.ensure_built()
+        with self.captureOnCommitCallbacks(execute=True):
+            draft = Post.objects.get(title='Django en borrador')
+            draft.publish()
+            draft.tags.add('django')
+        self.assertIn('Django en borrador', self.titles('django'))
+        self.assertEqual(self.get('djan').json()['tags'][0]['posts'], 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.guide.tags.clear()
+        self.assertEqual(self.get('djan').json()['tags'][0]['posts'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.get(name='diseno').delete()
+        self.assertEqual(self.get('dis').json()['tags'], [])
+
+        # Sin commit no se aplica nada
+        with self.captureOnCommitCallbacks(execute=False):
+            self.guide.title = 'Otra cosa'
+            self.guide.save()
+        self.assertIn('Guía de Django', self.titles('guia'))
+
+
+class UserSuggestTests(TestCase):
+    def setUp(self):
+        suggest.index.reset()
+        self.author = User.objects.create_user('autora', password='clave-segura-123', first_name='Lucía', last_name='Pérez')
+        self.luis = User.objects.create_user('luis', password='clave-segura-123', first_name='Luis', last_name='Gómez')
+        self.lucas = User.objects.create_user('lucas', password='clave-segura-123')
+        self.post = create_post(self.author)
+        Comment.objects.create(post=self.post, author=self.lucas, content='Hola', is_approved=True)
+        User.objects.filter(pk=self.luis.pk).update(last_login=timezone.now())
+        self.client.force_login(self.luis)
+
+    def usernames(self, q, **params):
+        response = self.client.get(reverse('blog:user_suggest'), {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [user['username'] for user in response.json()['users']]
+
+    def test_prefix_on_username_and_name(self):
+        self.assertEqual(self.usernames('@lu'), ['luis', 'lucas', 'autora'])
+        self.assertEqual(self.usernames('gom'), ['luis'])
+        self.assertEqual(self.usernames('lucia p'), ['autora'])
+        self.assertEqual(self.usernames(''), [])
+        response = self.client.get(reverse('blog:user_suggest'), {'q': 'aut'})
+        self.assertEqual(response.json()['users'], [{'username': 'autora', 'name': 'Lucía Pérez', 'participant': False}])
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_thread_participants_first(self):
+        cache.clear()
+        self.assertEqual(self.usernames('lu', post=self.post.id), ['lucas', 'autora', 'luis'])
+        with CaptureQueriesContext(connection) as ctx:
+            self.usernames('lu', post=self.post.id)
+        # Sesión y usuario: los participantes salen de la caché
+        self.assertEqual(len(ctx.captured_queries), 2)
+        for post in ('99999999999999999999', '²', 'x'):
+            self.assertEqual(self.usernames('lu', post=post), ['luis', 'lucas', 'autora'])
+
+    def test_users_are_updated_after_commit(self):
+        suggest.index.ensure_built()
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.create_user('lupe', password='clave-segura-123')
+            self.lucas.is_active = False
+            self.lucas.save()
+        self.assertEqual(self.usernames('lu'), ['luis', 'lupe', 'autora'])
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.get(username='lupe').delete()
+        self.assertEqual(self.usernames('lup'), [])
+
+    def test_requires_login(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('blog:user_suggest'), {'q': 'lu'}).status_code, 302)
+
+
+class RelatedPostsTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('autor', password='clave-segura-123')
+        self.now = timezone.now()
+        self.posts = {}
+        for i, (title, tags) in enumerate([
+            ('Base', ['django', 'python', 'orm']),
+            ('Raro', ['orm']),
+            ('Comun', ['django', 'python']),
+            ('Lejano', ['python']),
+            ('Nada', ['cocina']),
+        ]):
+            post = create_post(self.author, title, published_date=self.now - timezone.timedelta(days=i))
+            post.tags.add(*tags)
+            self.posts[title] = post
+        # Más posts con django y python para que sean etiquetas comunes
+        for i in range(6):
+            create_post(self.author, f'Relleno {i}', published_date=self.now - timezone.timedelta(days=10 + i)) \
+                .tags.add('django', 'python')
+
+    def related(self, title):
+        return [
+            link.related.title
+            for link in RelatedPost.objects.filter(post=self.posts[title]).select_related('related').order_by('rank')
+        ]
+
+    def test_compute_all_ranks_by_weighted_jaccard(self):
+        out = StringIO()
+        call_command('compute_related_posts', '--all', '--top-k', '3', stdout=out)
+        self.assertIn('11 posts', out.getvalue())
+        # Con Comun comparte dos etiquetas comunes, pero pesa más la rara (orm) de Raro
+        self.assertEqual(self.related('Base'), ['Raro', 'Comun', 'Relleno 0'])
+        self.assertEqual(self.related('Raro'), ['Base'])
+        self.assertEqual(self.related('Nada'), [])
+        self.assertFalse(StaleRelatedPost.objects.exists())
+
+    def test_stale_posts_are_recomputed_incrementally(self):
+        related.compute_all(k=3)
+        self.assertEqual(StaleRelatedPost.objects.count(), 0)
+        self.posts['Nada'].tags.add('orm')
+        self.assertEqual(set(StaleRelatedPost.objects.values_list('post_id', flat=True)), {self.posts['Nada'].id})
+
+        count = related.compute_stale(k=3)
+        self.assertIn('Nada', self.related('Raro'))
+        self.assertEqual(self.related('Nada')[0], 'Raro')
+        self.assertLess(count, len(self.posts) + 6)
+        self.assertFalse(StaleRelatedPost.objects.exists())
+        # Lo afectado queda como en un cálculo completo (el resto sólo difiere
+        # por el cambio de IDF de 'orm', que recoge el próximo --all)
+        incremental = {title: self.related(title) for title in ('Nada', 'Raro')}
+        related.compute_all(k=3)
+        self.assertEqual(incremental, {title: self.related(title) for title in ('Nada', 'Raro')})
+
+    def test_unpublished_and_deleted_posts_leave_the_lists(self):
+        related.compute_all(k=3)
+        raro = self.posts['Raro']
+        raro.published = False
+        raro.save()
+        response = self.client.get(self.posts['Base'].get_absolute_url())
+        self.assertNotIn('Raro', [link.related.title for link in response.context['related_posts']])
+
+        self.posts['Comun'].delete()
+        self.assertIn(self.posts['Base'].id, StaleRelatedPost.objects.values_list('post_id', flat=True))
+        related.compute_stale(k=3)
+        self.assertEqual(RelatedPost.objects.filter(post=raro).count(), 0)
+        self.assertNotIn('Comun', self.related('Base'))
+
+    def test_detail_loads_related_posts_in_one_query(self):
+        related.compute_all(k=3)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.posts['Base'].get_absolute_url())
+        self.assertContains(response, 'Posts relacionados')
+        self.assertContains(response, self.posts['Comun'].get_absolute_url())
+        queries = [q['sql'] for q in ctx.captured_queries if 'blog_relatedpost' in q['sql']]
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"blog_post"."content"', queries[0])
+
+
+class DuplicateDetectionTests(TestCase):
+    WORDS = ('django orm consulta índice caché plantilla vista modelo señal migración servidor cliente '
+             'petición respuesta sesión usuario etiqueta comentario reseña reacción').split()
+
+    def setUp(self):
+        self.author = User.objects.create_user('autor', password='clave-segura-123')
+        rng = random.Random(7)
+        self.text = ' '.join(rng.choice(self.WORDS) for _ in range(300))
+        self.original = create_post(self.author, 'Original', content=f'<p>{self.text}</p>')
+        other = ' '.join(rng.choice(self.WORDS) for _ in range(300))
+        create_post(self.author, 'Distinto', content=f'<p>{other}</p>')
+
+    def edited(self, changes):
+        words = self.text.split()
+        for i in range(0, len(words), len(words) // changes):
+            words[i] = 'cambio'
+        return '<p>' + ' '.join(words) + '</p>'
+
+    def test_signature_estimates_jaccard(self):
+        for changes in (3, 30):
+            with self.subTest(changes=changes):
+                a = duplicates.shingles(duplicates.plain_text(self.original.content))
+                b = duplicates.shingles(duplicates.plain_text(self.edited(changes)))
+                exact = len(a & b) / len(a | b)
+                estimate = duplicates.similarity(
+                    duplicates.signature(duplicates.plain_text(self.original.content)),
+                    duplicates.signature(duplicates.plain_text(self.edited(changes))),
+                )
+                self.assertAlmostEqual(estimate, exact, delta=0.15)
+
+    def test_posts_are_indexed_on_save(self):
+        self.assertEqual(PostMinHash.objects.count(), 2)
+        self.assertEqual(MinHashBucket.objects.filter(post=self.original).count(), duplicates.BANDS)
+        signature = PostMinHash.objects.get(post=self.original).signature
+        self.original.title = 'Mismo texto'
+        self.original.save()
+        self.assertEqual(PostMinHash.objects.get(post=self.original).signature, signature)
+
+    def test_signature_bytes_do_not_depend_on_the_platform(self):
+        sig = [1] + [0] * (duplicates.NUM_PERM - 2) + [0x01020304]
+        data = duplicates.pack(sig)
+        self.assertEqual(len(data), 4 * duplicates.NUM_PERM)
+        self.assertEqual((data[:4], data[-4:]), (b'\x01\x00\x00\x00', b'\x04\x03\x02\x01'))
+        self.assertEqual(duplicates.unpack(data), sig)
+
+    def test_find_similar_uses_bucket_index(self):
+        with CaptureQueriesContext(connection) as ctx:
+            similar = duplicates.find_similar(self.edited(3))
+        self.assertEqual([post.title for post, score in similar], ['Original'])
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(duplicates.find_similar(self.original.content, exclude=self.original.pk), [])
+
+    def test_create_and_update_views_warn(self):
+        self.client.force_login(self.author)
+        response = self.client.post(reverse('blog:post_create'), {
+            'title': 'Copia', 'content': self.edited(3), 'tags': 'django', 'published': 'on',
+        }, follow=True)
+        warnings = [str(m) for m in response.context['messages'] if m.level_tag == 'warning']
+        self.assertEqual(len(warnings), 1)
+        self.assertIn('"Original"', warnings[0])
+
+        copy = Post.objects.get(title='Copia')
+        response = self.client.post(reverse('blog:post_edit', args=[copy.slug]), {
+            'title': 'Copia', 'content': '<p>Un texto completamente nuevo y distinto</p>', 'tags': 'django',
+            'published': 'on',
+        }, follow=True)
+        self.assertFalse([m for m in response.context['messages'] if m.level_tag == 'warning'])
+
+    def test_find_duplicates_command(self):
+        create_post(self.author, 'Copia', content=self.edited(3))
+        create_post(self.author, 'Copia exacta', content=self.original.content)
+        # Cargado sin señales: el comando calcula las firmas que faltan
+        Post.objects.bulk_create([Post(
+            title='Importado', slug='importado', author=self.author, content=self.original.content,
+            published=True, published_date=timezone.now(),
+        )])
+        out = StringIO()
+        call_command('find_duplicates', stdout=out)
+        output = out.getvalue()
+        self.assertIn('Firmas calculadas para 1 posts', output)
+        self.assertIn('Grupo 1 (4 posts)', output)
+        self.assertNotIn('Distinto', output)
+        self.assertIn('1 grupos de posts casi duplicados', output)
+
+
+class TrendingTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('autor', password='clave-segura-123')
+        self.reader = User.objects.create_user('lector', password='clave-segura-123')
+        self.posts = [create_post(self.author, f'Post {i}') for i in range(3)]
+
+    def scores(self):
+        return {post.title: post.hot_score for post in Post.objects.filter(hot_score__gt=0)}
+
+    def test_engagement_updates_score_incrementally(self):
+        Reaction.objects.create(post=self.posts[0], user=self.reader, reaction_type='👍')
+        comment = Comment.objects.create(post=self.posts[1], author=self.reader, content='Hola')
+        CommentVote.objects.create(comment=comment, user=self.author, vote=1)
+        scores = self.scores()
+        self.assertAlmostEqual(scores['Post 0'], 1.0, places=3)
+        self.assertAlmostEqual(scores['Post 1'], 3.5, places=3)
+        self.assertNotIn('Post 2', scores)
+
+    @override_settings(BLOG_TRENDING_HALF_LIFE_HOURS=1)
+    def test_recent_engagement_outweighs_old(self):
+        trending.decay(timezone.now() - timezone.timedelta(hours=3))
+        trending.record(self.posts[0].id, 'comment', timezone.now() - timezone.timedelta(hours=2))
+        trending.record(self.posts[1].id, 'reaction', timezone.now())
+        # 3 * 2^-2 = 0.75 < 1
+        self.assertEqual([post.title for post in Post.objects.order_by('-hot_score')[:2]], ['Post 1', 'Post 0'])
+
+        # Reescalar no cambia el orden y deja las puntuaciones referidas a ahora
+        trending.decay()
+        scores = self.scores()
+        self.assertAlmostEqual(scores['Post 0'], 0.75, places=2)
+        self.assertAlmostEqual(scores['Post 1'], 1.0, places=2)
+
+        trending.decay(timezone.now() + timezone.timedelta(hours=20))
+        self.assertEqual(self.scores(), {})
+
+    @override_settings(BLOG_TRENDING_HALF_LIFE_HOURS=1)
+    def test_stale_reference_does_not_overflow(self):
+        # Más de 1024 vidas medias sin decay_hot_scores: 2 ** 1100 no cabe en un float
+        trending.decay(timezone.now() - timezone.timedelta(hours=1100))
+        Post.objects.filter(pk=self.posts[0].pk).update(hot_score=5)
+        Reaction.objects.create(post=self.posts[1], user=self.reader, reaction_type='👍')
+        self.assertEqual(self.scores(), {'Post 1': 1.0})
+        self.assertGreater(HotScoreState.objects.get().decayed_at, timezone.now() - timezone.timedelta(minutes=1))
+
+    def test_rebuild_matches_incremental_scores(self):
+        Reaction.objects.create(post=self.posts[0], user=self.reader, reaction_type='👍')
+        Review.objects.create(post=self.posts[2], user=self.reader, rating=5)
+        incremental = self.scores()
+        out = StringIO()
+        call_command('decay_hot_scores', '--rebuild', stdout=out)
+        self.assertIn('2 posts', out.getvalue())
+        rebuilt = self.scores()
+        self.assertEqual(rebuilt.keys(), incremental.keys())
+        for title in rebuilt:
+            self.assertAlmostEqual(rebuilt[title], incremental[title], places=3)
+
+    def test_keyset_pagination(self):
+        posts = [create_post(self.author, f'Tendencia {i}') for i in range(15)]
+        for i, post in enumerate(posts):
+            Post.objects.filter(pk=post.pk).update(hot_score=100 - i)
+        # Empate exacto en el corte de página
+        Post.objects.filter(pk=posts[10].pk).update(hot_score=100 - 9)
+
+        response = self.client.get(reverse('blog:trending'))
+        first = [post.title for post in response.context['posts']]
+        self.assertEqual(first, [f'Tendencia {i}' for i in range(9)] + ['Tendencia 10'])
+        cursor = response.context['next_cursor']
+        self.assertContains(response, f'?after={quote(cursor)}')
+
+        response = self.client.get(reverse('blog:trending'), {'after': cursor})
+        second = [post.title for post in response.context['posts']]
+        self.assertEqual(second, ['Tendencia 9'] + [f'Tendencia {i}' for i in range(11, 15)])
+        self.assertIsNone(response.context['next_cursor'])
+        self.assertFalse(set(first) & set(second))
+
+        for after in ('basura', '1:99999999999999999999'):
+            self.assertEqual(self.client.get(reverse('blog:trending'), {'after': after}).status_code, 200)
+
+
+class CommentThreadTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('autor', password='clave-segura-123')
+        self.reader = User.objects.create_user('lector', password='clave-segura-123')
+        self.post = create_post(self.author)
+
+    def reply(self, parent=None, content='Hola', is_approved=True, post=None):
+        return Comment.objects.create(
+            post=post or self.post, author=self.reader, parent=parent, content=content, is_approved=is_approved
+        )
+
+    def test_path_orders_thread_depth_first(self):
+        first = self.reply(content='1')
+        second = self.reply(content='2')
+        first_a = self.reply(first, '1.a')
+        second_a = self.reply(second, '2.a')
+        first_a_i = self.reply(first_a, '1.a.i')
+        first_b = self.reply(first, '1.b')
+
+        self.assertEqual(first_a_i.path, f'{first.id:010d}/{first_a.id:010d}/{first_a_i.id:010d}')
+        self.assertEqual([first_a_i.depth, first_a.depth, first.depth], [2, 1, 0])
+        self.assertEqual(first_a_i.ancestor_ids(), [first.id, first_a.id])
+        self.assertEqual(
+            [comment.content for comment in Comment.objects.filter(post=self.post).order_by('path')],
+            ['1', '1.a', '1.a.i', '1.b', '2', '2.a'],
+        )
+        self.assertEqual([comment.content for comment in first.subtree()], ['1', '1.a', '1.a.i', '1.b'])
+        self.assertEqual([comment.content for comment in first_a.subtree(include_self=False)], ['1.a.i'])
+        self.assertEqual(list(first_b.subtree(include_self=False)), [])
+        self.assertNotIn(second_a, first.subtree())
+
+    @override_settings(BLOG_COMMENT_MAX_DEPTH=2)
+    def test_replies_below_max_depth_attach_to_last_level(self):
+        root = self.reply()
+        level_1 = self.reply(root)
+        level_2 = self.reply(level_1)
+        too_deep = self.reply(level_2)
+        self.assertEqual(too_deep.depth, 2)
+        self.assertEqual(too_deep.parent_id, level_1.id)
+        self.assertEqual(too_deep.ancestor_ids(), [root.id, level_1.id])
+
+    def test_reply_counts_follow_approval_and_deletes(self):
+        root = self.reply()
+        child = self.reply(root)
+        pending = self.reply(child, is_approved=False)
+        grandchild = self.reply(child)
+        counts = lambda: dict(Comment.objects.values_list('id', 'reply_count'))
+        self.assertEqual(counts()[root.id], 2)
+        self.assertEqual(counts()[child.id], 1)
+
+        pending = Comment.objects.get(pk=pending.pk)
+        pending.is_approved = True
+        pending.save()
+        self.assertEqual(counts()[root.id], 3)
+
+        Comment.objects.get(pk=grandchild.pk).delete()
+        self.assertEqual(counts()[root.id], 2)
+        # El borrado en cascada descuenta todo el subárbol
+        Comment.objects.get(pk=child.pk).delete()
+        self.assertEqual(counts(), {root.id: 0})
+
+    def test_bulk_updates_can_be_recounted(self):
+        root = self.reply()
+        children = [self.reply(root, is_approved=False) for _ in range(3)]
+        Comment.objects.filter(pk__in=[child.pk for child in children[:2]]).update(is_approved=True)
+        Comment.recount_replies(Comment.objects.filter(pk__in=[child.pk for child in children]))
+        self.assertEqual(Comment.objects.get(pk=root.pk).reply_count, 2)
+
+        expected = list(Comment.objects.order_by('id').values_list('path', 'depth', 'reply_count'))
+        Comment.objects.update(path='', depth=0, reply_count=0)
+        self.assertEqual(Comment.rebuild_threads(), 4)
+        self.assertEqual(list(Comment.objects.order_by('id').values_list('path', 'depth', 'reply_count')), expected)
+
+    def test_post_detail_renders_threads(self):
+        root = self.reply(content='Raíz')
+        pending = self.reply(root, 'Pendiente', is_approved=False)
+        self.reply(pending, 'Bajo pendiente')
+        self.reply(root, 'Respuesta')
+        url = reverse('blog:post_detail', args=[self.post.slug])
+
+        response = self.client.get(url)
+        [shown] = response.context['comments']
+        self.assertEqual([reply.content for reply in shown.thread], ['Respuesta'])
+
+        self.client.force_login(self.author)
+        [shown] = self.client.get(url).context['comments']
+        self.assertEqual([reply.content for reply in shown.thread], ['Pendiente', 'Bajo pendiente', 'Respuesta'])
+
+        self.client.force_login(self.reader)
+        response = self.client.post(url, {'comment': '1', 'parent': root.id, 'content': 'Nueva'})
+        self.assertRedirects(response, url)
+        self.assertEqual(Comment.objects.get(content='Nueva').parent_id, root.id)
+
+        other = self.reply(post=create_post(self.author, 'Otro post'))
+        response = self.client.post(url, {'comment': '1', 'parent': other.id, 'content': 'Cruzada'})
+        self.assertEqual(response.status_code, 404)
+        for parent in ('abc', '99999999999999999999'):
+            response = self.client.post(url, {'comment': '1', 'parent': parent, 'content': 'Rota'})
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(Comment.objects.filter(content='Rota').exists())
+
+    @override_settings(BLOG_COMMENTS_PER_PAGE=2)
+    def test_threads_load_in_pages_by_best_order(self):
+        roots = [self.reply(content=f'Raíz {i}') for i in range(5)]
+        Comment.objects.filter(pk=roots[3].pk).update(pinned=True)
+        Comment.objects.filter(pk=roots[1].pk).update(wilson_score=0.5)
+        self.reply(roots[2], 'Respuesta a 2')
+        self.reply(roots[0], 'Respuesta a 0')
+        url = reverse('blog:post_detail', args=[self.post.slug])
+
+        response = self.client.get(url)
+        first = response.context['comments']
+        self.assertEqual([root.content for root in first], ['Raíz 3', 'Raíz 1'])
+        cursor = response.context['next_comments_cursor']
+        self.assertContains(response, f'data-after="{cursor}"')
+
+        pages = []
+        while cursor:
+            data = self.client.get(reverse('blog:post_comments', args=[self.post.slug]), {'after': cursor}).json()
+            pages.append(data['html'])
+            cursor = data['next_cursor']
+        self.assertEqual(len(pages), 2)
+        self.assertIn('Raíz 0', pages[0])
+        self.assertIn('Respuesta a 0', pages[0])
+        self.assertLess(pages[0].index('Raíz 0'), pages[0].index('Respuesta a 0'))
+        self.assertLess(pages[0].index('Respuesta a 0'), pages[0].index('Raíz 2'))
+        self.assertIn('Raíz 4', pages[1])
+        self.assertNotIn('Raíz 3', ''.join(pages))
+
+        # Un cursor inválido o fuera de rango vuelve a la primera página
+        for after in ('basura', '0:0.5:99999999999999999999:1', '1:0.5:1:99999999999999999999'):
+            response = self.client.get(reverse('blog:post_comments', args=[self.post.slug]), {'after': after})
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('Raíz 3', response.json()['html'])
+
+        # El JS de "Cargar más" va en el bloque extra_js, que base.html tiene que pintar
+        self.assertContains(self.client.get(url), "getElementById('load-more-comments')")
+
+    def test_vote_updates_stored_score(self):
+        comment = self.reply()
+        self.client.force_login(self.author)
+        url = reverse('blog:vote_comment', args=[comment.id])
+        self.assertEqual(self.client.post(url, {'vote': 1}).json()['score'], 1)
+        self.assertEqual(self.client.post(url, {'vote': -1}).json()['score'], -1)
+        self.assertEqual(self.client.post(url, {'vote': 0}).json()['score'], 0)
+        self.client.force_login(self.reader)
+        self.client.post(url, {'vote': 1})
+        comment.refresh_from_db()
+        self.assertEqual((comment.upvotes, comment.downvotes), (1, 0))
+        self.assertAlmostEqual(comment.wilson_score, 0.2065, places=4)
+
+        Comment.objects.update(upvotes=0, downvotes=0, wilson_score=0)
+        Comment.refresh_scores()
+        comment.refresh_from_db()
+        self.assertEqual((comment.upvotes, comment.downvotes), (1, 0))
+        self.assertAlmostEqual(comment.wilson_score, 0.2065, places=4)
+
+    def test_wilson_score_prefers_confidence_over_raw_sum(self):
+        self.assertEqual(wilson_lower_bound(0, 0), 0)
+        # La misma suma (+1) con mucha más incertidumbre en el primero
+        self.assertGreater(wilson_lower_bound(500, 499), wilson_lower_bound(1, 0))
+        self.assertGreater(wilson_lower_bound(90, 10), wilson_lower_bound(9, 1))
+        self.assertGreater(wilson_lower_bound(9, 1), wilson_lower_bound(2, 0))
+
+
+@override_settings(BLOG_COMMENTS_PER_PAGE=2)
+class ModerationQueueTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('autor', password='clave-segura-123')
+        self.reader = User.objects.create_user('lector', password='clave-segura-123')
+        self.post = create_post(self.author)
+        self.other_post = create_post(self.reader, title='Ajeno')
+        self.root = Comment.objects.create(post=self.post, author=self.reader, content='Raíz', is_approved=True)
+        self.client.force_login(self.author)
+
+    def comment(self, content, post=None, parent=None):
+        return Comment.objects.create(
+            post=post or self.post, author=self.reader, parent=parent, content=content, is_approved=False
+        )
+
+    def queue(self, after=''):
+        response = self.client.get(reverse('blog:moderation_queue'), {'after': after} if after else {})
+        return [comment.content for comment in response.context['comments']], response.context['next_cursor']
+
+    def test_lists_pending_comments_of_own_posts_newest_first(self):
+        for content in ['1', '2', '3']:
+            self.comment(content)
+        self.comment('ajeno', post=self.other_post)
+        Comment.objects.create(post=self.post, author=self.reader, content='rechazado', rejected=True)
+
+        first, cursor = self.queue()
+        self.assertEqual(first, ['3', '2'])
+        second, cursor = self.queue(cursor)
+        self.assertEqual(second, ['1'])
+        self.assertIsNone(cursor)
+        # Cursores inválidos o fuera de rango vuelven a la primera página
+        for after in ('basura', '99999999999999999999:1', '1:99999999999999999999'):
+            self.assertEqual(self.queue(after)[0], ['3', '2'])
+
+    def test_bulk_approve_updates_reply_counts(self):
+        replies = [self.comment(f'r{i}', parent=self.root) for i in range(3)]
+        foreign = self.comment('ajeno', post=self.other_post)
+        response = self.client.post(reverse('blog:moderation_queue'), {
+            'action': 'approve',
+            'comment_ids': [reply.id for reply in replies[:2]] + [foreign.id, '99999999999999999999', '²'],
+        })
+        self.assertRedirects(response, reverse('blog:moderation_queue'))
+        self.assertEqual(
+            set(Comment.objects.filter(is_approved=True, depth=1).values_list('content', flat=True)), {'r0', 'r1'}
+        )
+        self.root.refresh_from_db()
+        self.assertEqual(self.root.reply_count, 2)
+        self.assertEqual(self.queue()[0], ['r2'])
+
+    def test_bulk_reject_and_pin(self):
+        rejected, pinned = self.comment('fuera'), self.comment('destacado')
+        self.client.post(reverse('blog:moderation_queue'), {'action': 'reject', 'comment_ids': [rejected.id]})
+        self.client.post(reverse('blog:moderation_queue'), {'action': 'pin', 'comment_ids': [pinned.id]})
+        rejected.refresh_from_db()
+        pinned.refresh_from_db()
+        self.assertEqual((rejected.is_approved, rejected.rejected), (False, True))
+        self.assertEqual((pinned.is_approved, pinned.pinned), (True, True))
+        self.assertEqual(self.queue()[0], [])
+
+    def test_unknown_action_changes_nothing(self):
+        pending = self.comment('pendiente')
+        self.client.post(reverse('blog:moderation_queue'), {'action': 'delete', 'comment_ids': [pending.id]})
+        self.assertEqual(self.queue()[0], ['pendiente'])
+
+
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', password='clave-segura-123')
+        self.reader = User.objects.create_user('lector', password='clave-segura-123')
+        self.post = create_post(self.admin)
+        self.client.force_login(self.admin)
+
+    def add_rows(self, count):
+        for i in range(count):
+            user = User.objects.create_user(f'usuario{User.objects.count()}')
+            comment = Comment.objects.create(post=self.post, author=user, content=f'Comentario {i}', is_approved=True)
+            CommentVote.objects.create(comment=comment, user=self.reader, vote=1)
+            Reaction.objects.create(post=create_post(user, title=f'Post {user.username}'), user=user, reaction_type='👍')
+            Notification.objects.create(user=user, notification_type='comment', title='t', message='m')
+
+    def changelist(self, model, query=''):
+        url = reverse(f'admin:blog_{model}_changelist') + query
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, ctx.captured_queries
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        models = ['comment', 'commentvote', 'reaction', 'review', 'notification']
+        self.add_rows(2)
+        before = {model: len(self.changelist(model)[1]) for model in models}
+        self.add_rows(8)
+        for model in models:
+            with self.subTest(model=model):
+                self.assertEqual(len(self.changelist(model)[1]), before[model])
+
+    def test_search_uses_username_and_fulltext_index(self):
+        Comment.objects.create(post=self.post, author=self.reader, content='Muy buena explicación', is_approved=True)
+        other = User.objects.create_user('otro')
+        Comment.objects.create(post=self.post, author=other, content='Nada que ver', is_approved=True)
+
+        found = lambda query: [str(c.author) for c in self.changelist('comment', query)[0].context['cl'].result_list]
+        self.assertEqual(found('?q=explicacion'), ['lector'])
+        self.assertEqual(found('?q=expli'), ['lector'])
+        self.assertEqual(found('?q=otro'), ['otro'])
+        self.assertEqual(found('?q=lect'), ['lector'])
+        self.assertEqual(found('?q=ector'), [])
+
+        sql = next(q['sql'] for q in self.changelist('comment', '?q=buena')[1] if 'blog_comment_fts' in q['sql'])
+        with connection.cursor() as cursor:
+            plan = [row[-1] for row in cursor.execute('EXPLAIN QUERY PLAN ' + sql).fetchall()]
+        self.assertFalse([step for step in plan if step == 'SCAN blog_comment'], plan)
+
+    def test_review_and_notification_search_use_fulltext_indexes(self):
+        other = User.objects.create_user('otro')
+        Review.objects.create(post=self.post, user=self.reader, rating=5, comment='Me encantó la sección final')
+        Review.objects.create(post=create_post(other, title='Guía de tejido'), user=other, rating=2, comment='Regular')
+        Notification.objects.create(user=self.reader, notification_type='mention', title='Te mencionaron',
+                                    message='en un comentario largo')
+        Notification.objects.create(user=other, notification_type='reaction', title='Nueva reacción', message='👍')
+
+        found = lambda model, query: [
+            row.user.username for row in self.changelist(model, query)[0].context['cl'].result_list
+        ]
+        self.assertEqual(found('review', '?q=seccion'), ['lector'])
+        self.assertEqual(found('review', '?q=tejido'), ['otro'])
+        # Del post sólo cuenta el título
+        self.assertEqual(found('review', '?q=contenido'), [])
+        self.assertEqual(found('review', '?q=lec'), ['lector'])
+        self.assertEqual(found('notification', '?q=mencionaron'), ['lector'])
+        self.assertEqual(found('notification', '?q=largo'), ['lector'])
+        self.assertEqual(found('notification', '?q=reaccion'), ['otro'])
+
+        for model, table in [('review', 'blog_review'), ('notification', 'blog_notification')]:
+            with self.subTest(model=model):
+                sql = next(q['sql'] for q in self.changelist(model, '?q=final')[1] if f'{table}_fts' in q['sql'])
+                with connection.cursor() as cursor:
+                    plan = [row[-1] for row in cursor.execute('EXPLAIN QUERY PLAN ' + sql).fetchall()]
+                self.assertFalse([step for step in plan if step == f'SCAN {table}'], plan)
+
+    def test_post_search_uses_fulltext_index(self):
+        create_post(self.admin, 'Guía de tejido', content='<p>Agujas circulares</p>')
+        found = lambda query: [post.title for post in self.changelist('post', query)[0].context['cl'].result_list]
+        self.assertEqual(found('?q=tejido'), ['Guía de tejido'])
+        self.assertEqual(found('?q=circulares'), ['Guía de tejido'])
+        self.assertEqual(found('?q=guia agu'), ['Guía de tejido'])
+        self.assertEqual(found('?q=ejido'), [])
+
+        queries = self.changelist('post', '?q=circulares')[1]
+        self.assertFalse([q for q in queries if 'LIKE' in q['sql']])
+        sql = next(q['sql'] for q in queries if 'blog_post_fts' in q['sql'])
+        with connection.cursor() as cursor:
+            plan = [row[-1] for row in cursor.execute('EXPLAIN QUERY PLAN ' + sql).fetchall()]
+        self.assertFalse([step for step in plan if step == 'SCAN blog_post'], plan)
+
+    def test_fulltext_index_follows_writes_and_lost_triggers(self):
+        comment = Comment.objects.create(post=self.post, author=self.reader, content='primera versión')
+        matches = lambda term: list(Comment.objects.filter(pk__in=fulltext.matching_comments(term)))
+        self.assertEqual(matches('primera'), [comment])
+        comment.content = 'segunda versión'
+        comment.save()
+        self.assertEqual(matches('primera'), [])
+        self.assertEqual(matches('segunda'), [comment])
+
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER blog_comment_fts_insert')
+        lost = Comment.objects.create(post=self.post, author=self.reader, content='sin trigger')
+        self.assertEqual(matches('trigger'), [])
+        self.assertTrue(fulltext.install())
+        self.assertFalse(fulltext.install())
+        self.assertEqual(matches('trigger'), [lost])
+
+    def test_unfiltered_count_comes_from_statistics(self):
+        self.add_rows(3)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.assertEqual(estimated_row_count(Comment), 3)
+
+        paginator = type('Paginator', (EstimatedCountPaginator,), {'exact_below': 0})
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(paginator(Comment.objects.all(), 100).count, 3)
+        self.assertFalse([q for q in ctx.captured_queries if 'COUNT' in q['sql']])
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(paginator(Comment.objects.filter(is_approved=False), 100).count, 0)
+        self.assertTrue([q for q in ctx.captured_queries if 'COUNT' in q['sql']])
+
+    def test_approve_action_updates_reply_counts(self):
+        root = Comment.objects.create(post=self.post, author=self.reader, content='Raíz', is_approved=True)
+        reply = Comment.objects.create(post=self.post, author=self.reader, parent=root, content='Respuesta')
+        response = self.client.post(reverse('admin:blog_comment_changelist'), {
+            'action': 'approve_comments', '_selected_action': [reply.id],
+        }, follow=True)
+        self.assertContains(response, '1 comentarios aprobados.')
+        root.refresh_from_db()
+        self.assertEqual(root.reply_count, 1)
+
+        # Desde el filtro de pendientes: tras el update() el queryset del changelist ya no los trae
+        replies = [
+            Comment.objects.create(post=self.post, author=self.reader, parent=root, content=f'Pendiente {i}')
+            for i in range(2)
+        ]
+        response = self.client.post(reverse('admin:blog_comment_changelist') + '?is_approved__exact=0', {
+            'action': 'approve_comments', '_selected_action': [reply.id for reply in replies],
+        }, follow=True)
+        self.assertContains(response, '2 comentarios aprobados.')
+        root.refresh_from_db()
+        self.assertEqual(root.reply_count, 3)
+
+
+class ContentRenderingTests(SimpleTestCase):
+    def test_sanitizes_against_allowlist(self):
+        html, _, text = rendering.render(
+            '<p onclick="x()">Hola <b>mundo</p><script>alert(1)</script><iframe><p>oculto</p></iframe>'
+            '<marquee>texto</marquee><a href="java&#9;script:alert(1)">a</a>'
+            '<a href="https://example.com" target="_blank">b</a><!-- nota --><ul><li>sin cerrar'
+        )
+        self.assertEqual(
+            html,
+            '<p>Hola <b>mundo</b></p>texto<a>a</a>'
+            '<a href="https://example.com" target="_blank" rel="noopener noreferrer">b</a><ul><li>sin cerrar</li></ul>'
+        )
+        self.assertEqual(text, 'Hola mundo textoab sin cerrar')
+        self.assertEqual(rendering.render('&lt;script&gt;')[0], '&lt;script&gt;')
+
+    def test_headings_get_unique_anchors_and_toc(self):
+        html, toc, _ = rendering.render('<h2>Introducción</h2><h3>Uso <em>básico</em></h3><h2>Introducción</h2>')
+        self.assertEqual(
+            html,
+            '<h2 id="introduccion">Introducción</h2><h3 id="uso-basico">Uso <em>básico</em></h3>'
+            '<h2 id="introduccion-2">Introducción</h2>'
+        )
+        self.assertEqual([(entry['level'], entry['id'], entry['title']) for entry in toc], [
+            (2, 'introduccion', 'Introducción'), (3, 'uso-basico', 'Uso básico'), (2, 'introduccion-2', 'Introducción'),
+        ])
+
+    def test_images_are_lazy_and_sized(self):
+        from PIL import Image
+
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root, MEDIA_URL='/media/'):
+            os.makedirs(os.path.join(media_root, 'uploads'))
+            Image.new('RGB', (400, 300)).save(os.path.join(media_root, 'uploads', 'foto.png'))
+            html = rendering.render(
+                '<img src="/media/uploads/foto.png" alt="Foto">'
+                '<img src="/media/uploads/foto.png" style="width:200px">'
+                '<img src="https://example.com/x.jpg" width="10" height="20px">'
+                '<img src="/media/../settings.py"><img src="javascript:x">'
+            )[0]
+        self.assertEqual(html, (
+            '<img src="/media/uploads/foto.png" alt="Foto" width="400" height="300" loading="lazy" decoding="async">'
+            '<img src="/media/uploads/foto.png" width="200" height="150" loading="lazy" decoding="async">'
+            '<img src="https://example.com/x.jpg" width="10" height="20" loading="lazy" decoding="async">'
+            '<img src="/media/../settings.py" loading="lazy" decoding="async">'
+        ))
+
+
+class PostRenderingTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('autor', password='clave-segura-123')
+
+    def test_save_stores_rendered_fields(self):
+        post = create_post(self.author, content='<h2>Uno</h2><p>' + 'palabra ' * 450 + '<script>x</script></p>')
+        post.refresh_from_db()
+        self.assertNotIn('script', post.rendered_html)
+        self.assertEqual(post.toc, [{'level': 2, 'id': 'uno', 'title': 'Uno'}])
+        self.assertEqual(post.reading_time, 3)
+        self.assertEqual(post.summary, 'Uno ' + 'palabra ' * 28 + 'palabra…')
+
+        post.excerpt = 'Resumen propio'
+        post.save(update_fields=['excerpt'])
+        post.refresh_from_db()
+        self.assertEqual(post.summary, 'Resumen propio')
+
+        Post.objects.filter(pk=post.pk).update(content='<p>Cambiado</p>')
+        post.published = False
+        post.save(update_fields=['published'])
+        post.refresh_from_db()
+        self.assertIn('palabra', post.rendered_html)
+        call_command('render_posts', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.rendered_html, '<p>Cambiado</p>')
+
+    def test_detail_serves_stored_html(self):
+        post = create_post(self.author, content='<h2>Sección</h2><p onmouseover="x()">Texto</p>')
+        Post.objects.filter(pk=post.pk).update(content='<p>Sin renderizar</p>')
+        response = self.client.get(post.get_absolute_url())
+        self.assertContains(response, '<h2 id="seccion">Sección</h2><p>Texto</p>', html=False)
+        self.assertContains(response, '<a href="#seccion">Sección</a>', html=False)
+        self.assertNotContains(response, 'Sin renderizar')
+        self.assertNotContains(response, 'onmouseover')
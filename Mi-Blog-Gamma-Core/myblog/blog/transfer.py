@@ -0,0 +1,373 @@
+"""
+Exportación e importación de posts en JSONL (comandos export_posts e
+import_posts), para migrar contenido sin pasar por PostForm post a post.
+
+Cada línea es un post con todo lo suyo:
+
+    {"slug", "title", "author", "content", "excerpt", "published",
+     "created_date", "published_date", "updated_date", "cover_image",
+     "tags": [nombre], "comments": [...], "reviews": [...], "media": [ruta]}
+
+Los usuarios van por username. Los comentarios llevan su id y el de su
+padre en el origen sólo para rehacer los hilos. `media` son las rutas
+dentro de MEDIA_ROOT de la portada y de las imágenes que enlaza el
+contenido; los ficheros se copian aparte (con rsync de MEDIA_ROOT, p. ej.).
+
+La memoria no depende del número de posts:
+
+* export recorre los posts con .iterator() y por cada chunk trae las
+  etiquetas, comentarios y reseñas de esos posts en tres consultas.
+* import lee la entrada línea a línea y guarda cada chunk en una
+  transacción: bulk_create de los posts (ya renderizados y con sus fechas
+  originales), de sus TaggedItem, de los comentarios (un lote por nivel
+  de hilo, para conocer el id del padre) y de las reseñas. Los usuarios
+  que no existan se crean sin contraseña utilizable. Los posts cuyo slug
+  ya existe se saltan, así que repetir una importación no duplica nada.
+
+Con --checkpoint, tras cada chunk se apunta el byte de la entrada hasta el
+que se ha llegado y una importación interrumpida sigue desde ahí. Con
+--workers N, N procesos leen y renderizan los chunks (sanear el HTML es lo
+que más cuesta) mientras el principal los escribe en el orden del fichero.
+Escribe un solo proceso: en SQLite varios escritores a la vez acaban en
+"database is locked", y así el checkpoint sigue siendo una posición.
+
+bulk_create no manda señales: en cada chunk se rehacen los hilos, se
+guardan las firmas MinHash de los posts (blog/duplicates.py) y se marcan
+para compute_related_posts; al final se recalculan las TagStats de las
+etiquetas tocadas y las puntuaciones de tendencia.
+"""
+import itertools
+import json
+import multiprocessing
+import os
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections, transaction
+from django.utils.dateparse import parse_datetime
+from taggit.models import Tag, TaggedItem
+
+from . import duplicates, rendering, trending
+from .models import Comment, Post, Review, StaleRelatedPost, TagStats
+from .utils import historic_dates
+
+POST_COLUMNS = (
+    'id', 'slug', 'title', 'author__username', 'content', 'excerpt', 'published',
+    'created_date', 'published_date', 'updated_date', 'cover_image',
+)
+COMMENT_COLUMNS = (
+    'id', 'post_id', 'parent_id', 'author__username', 'name', 'email', 'content',
+    'created_date', 'is_approved', 'pinned', 'rejected',
+)
+REVIEW_COLUMNS = ('post_id', 'user__username', 'rating', 'comment', 'created_date')
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def encode_value(value):
+    # Con microsegundos: DjangoJSONEncoder los recorta a milisegundos
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} no es serializable')
+
+
+def media_references(content, cover_image):
+    """Rutas en MEDIA_ROOT de la portada y de las imágenes de `content`"""
+    paths = [cover_image] if cover_image else []
+    paths += filter(None, map(rendering.media_path, rendering.image_sources(content)))
+    return list(dict.fromkeys(paths))
+
+
+def group_rows(rows, key=0):
+    """{fila[key]: [filas]}"""
+    groups = {}
+    for row in rows:
+        groups.setdefault(row[key], []).append(row)
+    return groups
+
+
+# ---------------------------
+# Exportación
+# ---------------------------
+def export_records(posts=None, chunk_size=500):
+    """Un diccionario por post de `posts` (todos por defecto), en orden de id"""
+    posts = Post.objects.all() if posts is None else posts
+    rows = posts.order_by('id').values(*POST_COLUMNS)
+    content_type = ContentType.objects.get_for_model(Post)
+    for chunk in chunks(rows.iterator(chunk_size=chunk_size), chunk_size):
+        ids = [row['id'] for row in chunk]
+        tags = group_rows(
+            TaggedItem.objects.filter(content_type=content_type, object_id__in=ids)
+            .order_by('tag__name').values_list('object_id', 'tag__name')
+        )
+        # Por id: el padre siempre va antes que sus respuestas
+        comments = group_rows(
+            Comment.objects.filter(post_id__in=ids).order_by('id').values(*COMMENT_COLUMNS), key='post_id'
+        )
+        reviews = group_rows(
+            Review.objects.filter(post_id__in=ids).order_by('id').values(*REVIEW_COLUMNS), key='post_id'
+        )
+        for row in chunk:
+            post_id = row['id']
+            yield {
+                'slug': row['slug'],
+                'title': row['title'],
+                'author': row['author__username'],
+                'content': row['content'],
+                'excerpt': row['excerpt'],
+                'published': row['published'],
+                'created_date': row['created_date'],
+                'published_date': row['published_date'],
+                'updated_date': row['updated_date'],
+                'cover_image': row['cover_image'] or None,
+                'tags': [name for _, name in tags.get(post_id, [])],
+                'comments': [
+                    {
+                        'id': comment['id'], 'parent': comment['parent_id'], 'author': comment['author__username'],
+                        'name': comment['name'], 'email': comment['email'], 'content': comment['content'],
+                        'created_date': comment['created_date'], 'is_approved': comment['is_approved'],
+                        'pinned': comment['pinned'], 'rejected': comment['rejected'],
+                    }
+                    for comment in comments.get(post_id, [])
+                ],
+                'reviews': [
+                    {
+                        'user': review['user__username'], 'rating': review['rating'],
+                        'comment': review['comment'], 'created_date': review['created_date'],
+                    }
+                    for review in reviews.get(post_id, [])
+                ],
+                'media': media_references(row['content'], row['cover_image']),
+            }
+
+
+def export_posts(out, posts=None, chunk_size=500):
+    """Escribe en `out` una línea JSON por post; devuelve cuántos"""
+    count = 0
+    for record in export_records(posts, chunk_size):
+        out.write(json.dumps(record, ensure_ascii=False, default=encode_value) + '\n')
+        count += 1
+    return count
+
+
+# ---------------------------
+# Importación
+# ---------------------------
+def read_lines(path, start=0):
+    """(posición tras la línea, línea) de las líneas de `path` desde el byte `start`"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while line := f.readline():
+            yield f.tell(), line
+
+
+def prepare(lines):
+    """
+    Registros de unas líneas, con el HTML ya renderizado en 'rendered'. Es
+    lo que hacen los procesos de --workers: no escribe nada.
+    """
+    records = []
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        post = Post(content=record.get('content', ''), excerpt=record.get('excerpt', ''))
+        post.render_content()
+        record['rendered'] = {field: getattr(post, field) for field in Post.RENDERED_FIELDS}
+        records.append(record)
+    return records
+
+
+def prepared_chunks(path, start, chunk_size, workers):
+    """
+    (posición tras el chunk, registros) de cada chunk, en el orden del
+    fichero. Con varios workers hay como mucho dos chunks por proceso en
+    vuelo, para que la memoria no crezca si escribir va más lento.
+    """
+    batches = chunks(read_lines(path, start), chunk_size)
+    if workers <= 1:
+        for batch in batches:
+            yield batch[-1][0], prepare(line for _, line in batch)
+        return
+    # Los procesos hijos abren sus propias conexiones
+    connections.close_all()
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork')) as pool:
+        pending = deque()
+        for batch in batches:
+            pending.append((batch[-1][0], pool.submit(prepare, [line for _, line in batch])))
+            if len(pending) >= 2 * workers:
+                position, future = pending.popleft()
+                yield position, future.result()
+        while pending:
+            position, future = pending.popleft()
+            yield position, future.result()
+
+
+class Checkpoint:
+    """Hasta qué byte de la entrada se ha importado, en un fichero"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)['position']
+        except FileNotFoundError:
+            return 0
+
+    def save(self, position):
+        partial = f'{self.path}.{uuid.uuid4().hex}'
+        with open(partial, 'w') as f:
+            json.dump({'position': position}, f)
+        os.replace(partial, self.path)
+
+
+class Importer:
+    """Escribe chunks de registros de export_records; guarda los ids de usuario y etiqueta ya resueltos"""
+
+    def __init__(self, chunk_size=500):
+        self.chunk_size = chunk_size
+        self.user_ids = {}
+        self.tag_ids = {}
+        self.touched_tags = set()
+        self.imported = 0
+        self.skipped = 0
+        self.content_type = ContentType.objects.get_for_model(Post)
+
+    def run(self, path, checkpoint=None, workers=1):
+        start = checkpoint.load() if checkpoint is not None else 0
+        for position, records in prepared_chunks(path, start, self.chunk_size, workers):
+            with transaction.atomic():
+                self.import_chunk(records)
+            if checkpoint is not None:
+                checkpoint.save(position)
+        return self
+
+    def import_chunk(self, records):
+        existing = set(Post.objects.filter(slug__in=[r['slug'] for r in records]).values_list('slug', flat=True))
+        new = {}
+        for record in records:
+            if record['slug'] in existing or record['slug'] in new:
+                self.skipped += 1
+            else:
+                new[record['slug']] = record
+        if not new:
+            return
+        records = list(new.values())
+        self.resolve_users(
+            {r['author'] for r in records}
+            | {c['author'] for r in records for c in r.get('comments', ()) if c.get('author')}
+            | {v['user'] for r in records for v in r.get('reviews', ())}
+        )
+        self.resolve_tags({name for r in records for name in r.get('tags', ())})
+
+        with historic_dates(Post, Comment, Review):
+            Post.objects.bulk_create([self.build_post(r) for r in records], batch_size=self.chunk_size)
+            post_ids = dict(Post.objects.filter(slug__in=new).values_list('slug', 'id'))
+            TaggedItem.objects.bulk_create([
+                TaggedItem(content_type=self.content_type, object_id=post_ids[r['slug']], tag_id=self.tag_ids[name])
+                for r in records for name in dict.fromkeys(r.get('tags', ()))
+            ], batch_size=self.chunk_size)
+            self.create_comments(records, post_ids)
+            Review.objects.bulk_create([
+                Review(
+                    post_id=post_ids[r['slug']], user_id=self.user_ids[v['user']], rating=v['rating'],
+                    comment=v.get('comment', ''), created_date=parse_datetime(v['created_date']),
+                )
+                for r in records for v in r.get('reviews', ())
+            ], batch_size=self.chunk_size)
+        # En la misma transacción que el chunk: al reanudar estos posts ya se saltan
+        Comment.rebuild_threads(Comment.objects.filter(post_id__in=post_ids.values()))
+        duplicates.rebuild(Post.objects.filter(pk__in=post_ids.values()), batch_size=self.chunk_size)
+        StaleRelatedPost.mark(post_ids.values())
+        self.touched_tags.update(self.tag_ids[name] for r in records for name in r.get('tags', ()))
+        self.imported += len(records)
+
+    def build_post(self, record):
+        created = parse_datetime(record['created_date'])
+        return Post(
+            slug=record['slug'], title=record['title'], author_id=self.user_ids[record['author']],
+            content=record.get('content', ''), excerpt=record.get('excerpt', ''),
+            published=record.get('published', False),
+            created_date=created,
+            published_date=record.get('published_date') and parse_datetime(record['published_date']),
+            updated_date=record.get('updated_date') and parse_datetime(record['updated_date']) or created,
+            cover_image=record.get('cover_image') or '',
+            # bulk_create no pasa por Post.save(): el HTML ya viene de prepare()
+            **record['rendered'],
+        )
+
+    def create_comments(self, records, post_ids):
+        """
+        Un bulk_create por nivel de hilo: las raíces y luego las respuestas a
+        comentarios ya creados, con el id nuevo del padre. Necesita que
+        bulk_create devuelva los ids (SQLite >= 3.35, PostgreSQL).
+        """
+        pending = [(post_ids[r['slug']], c) for r in records for c in r.get('comments', ())]
+        new_ids = {}
+        while pending:
+            level = [(post_id, c) for post_id, c in pending if c.get('parent') is None or c['parent'] in new_ids]
+            if not level:
+                # Respuestas a comentarios que no vienen en la entrada: quedan como raíces
+                level = pending[:1]
+                level[0][1]['parent'] = None
+            created = Comment.objects.bulk_create([
+                Comment(
+                    post_id=post_id, parent_id=new_ids.get(c.get('parent')),
+                    author_id=self.user_ids[c['author']] if c.get('author') else None,
+                    name=c.get('name', ''), email=c.get('email', ''), content=c['content'],
+                    created_date=parse_datetime(c['created_date']), is_approved=c.get('is_approved', False),
+                    pinned=c.get('pinned', False), rejected=c.get('rejected', False),
+                )
+                for post_id, c in level
+            ], batch_size=self.chunk_size)
+            for (_, c), comment in zip(level, created):
+                new_ids[c['id']] = comment.pk
+            placed = {id(c) for _, c in level}
+            pending = [(post_id, c) for post_id, c in pending if id(c) not in placed]
+
+    def resolve_users(self, usernames):
+        missing = usernames - self.user_ids.keys()
+        if not missing:
+            return
+        self.user_ids.update(User.objects.filter(username__in=missing).values_list('username', 'id'))
+        missing -= self.user_ids.keys()
+        if missing:
+            password = make_password(None)
+            User.objects.bulk_create([User(username=name, password=password) for name in missing],
+                                     ignore_conflicts=True)
+            self.user_ids.update(User.objects.filter(username__in=missing).values_list('username', 'id'))
+
+    def resolve_tags(self, names):
+        missing = names - self.tag_ids.keys()
+        if not missing:
+            return
+        self.tag_ids.update(Tag.objects.filter(name__in=missing).values_list('name', 'id'))
+        for name in missing - self.tag_ids.keys():
+            # Una a una: Tag.save() se encarga de que el slug no se repita
+            self.tag_ids[name] = Tag.objects.get_or_create(name=name)[0].id
+
+
+def import_posts(path, chunk_size=500, checkpoint_path=None, workers=1):
+    """Importa un fichero de export_posts; devuelve (importados, saltados)"""
+    checkpoint = Checkpoint(checkpoint_path) if checkpoint_path else None
+    importer = Importer(chunk_size).run(path, checkpoint, workers)
+    if importer.imported:
+        finish(importer.touched_tags)
+    return importer.imported, importer.skipped
+
+
+def finish(tag_ids):
+    """Lo que harían las señales de los posts importados, una vez al final"""
+    TagStats.rebuild(tag_ids)
+    trending.rebuild()
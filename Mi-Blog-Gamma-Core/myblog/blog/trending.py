@@ -0,0 +1,126 @@
+"""
+Puntuación de tendencia (Post.hot_score) con decaimiento exponencial.
+
+Cada interacción suma su peso multiplicado por 2^(-edad / vida media), así
+que una reacción de hace una vida media cuenta la mitad que una de ahora.
+Para no reescribir todos los posts continuamente, las puntuaciones están
+referidas al instante `HotScoreState.decayed_at`:
+
+* una interacción en el instante t suma `peso * 2^((t - decayed_at) / vida media)`
+  con un UPDATE atómico (F) sobre su post. decayed_at se lee sin bloquear
+  la fila, para que las interacciones de todo el sitio no hagan cola tras
+  ella: si un decay() mueve la referencia entre la lectura y la suma, esa
+  interacción cuenta de más en el factor de un reescalado (un 3 % con el
+  cron cada hora y 24 h de vida media) y el orden apenas se resiente;
+* el comando decay_hot_scores (cron, p. ej. cada hora) multiplica todas las
+  puntuaciones por 2^(-(ahora - decayed_at) / vida media) y mueve
+  decayed_at a ahora, para que los factores no crezcan sin límite. Si el
+  cron deja de pasar, la propia interacción reescala antes de sumar cuando
+  la referencia tiene más de MAX_REFERENCE_AGE vidas medias (2^1024 ya no
+  cabe en un float).
+
+Entre dos reescalados el orden es el correcto en todo momento, porque todas
+las puntuaciones comparten la misma referencia.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Comment, CommentVote, HotScoreState, Post, Reaction, Review
+
+DEFAULT_WEIGHTS = {
+    'reaction': 1.0,
+    'comment': 3.0,
+    'review': 2.0,
+    'comment_vote': 0.5,
+}
+
+# Por debajo de esto (ya reescalado) la puntuación se deja en 0
+MIN_SCORE = 1e-3
+# Vidas medias tras las que record() reescala antes de sumar
+MAX_REFERENCE_AGE = 32
+
+
+def get_weights():
+    return {**DEFAULT_WEIGHTS, **getattr(settings, 'BLOG_TRENDING_WEIGHTS', {})}
+
+
+def get_half_life():
+    """Vida media en segundos"""
+    return getattr(settings, 'BLOG_TRENDING_HALF_LIFE_HOURS', 24) * 3600
+
+
+def growth(seconds):
+    return 2 ** (seconds / get_half_life())
+
+
+def locked_state(now):
+    """La fila de HotScoreState, bloqueada hasta el final de la transacción"""
+    state, _ = HotScoreState.objects.select_for_update().get_or_create(pk=1, defaults={'decayed_at': now})
+    return state
+
+
+def record(post_id, kind, when=None):
+    """Suma una interacción de tipo `kind` al post"""
+    weight = get_weights()[kind]
+    if not weight:
+        return
+    when = when or timezone.now()
+    state, _ = HotScoreState.objects.get_or_create(pk=1, defaults={'decayed_at': when})
+    elapsed = (when - state.decayed_at).total_seconds()
+    if elapsed > MAX_REFERENCE_AGE * get_half_life():
+        # Sólo el reescalado bloquea la fila
+        decay(when)
+        elapsed = 0
+    increment = weight * growth(elapsed)
+    Post.objects.filter(pk=post_id).update(hot_score=F('hot_score') + increment)
+
+
+def decay(now=None):
+    """Reescala todas las puntuaciones a `now`; devuelve el factor aplicado"""
+    now = now or timezone.now()
+    with transaction.atomic():
+        state = locked_state(now)
+        # Exponente negativo: tras mucho tiempo da 0.0 en lugar de desbordarse
+        factor = growth(-(now - state.decayed_at).total_seconds())
+        Post.objects.filter(hot_score__gt=0).update(hot_score=F('hot_score') * factor)
+        Post.objects.filter(hot_score__gt=0, hot_score__lt=MIN_SCORE).update(hot_score=0)
+        state.decayed_at = now
+        state.save(update_fields=['decayed_at'])
+    return factor
+
+
+def engagement_events():
+    """(tipo, post_id, fecha) de todas las interacciones guardadas"""
+    sources = [
+        ('reaction', Reaction.objects.values_list('post_id', 'created_date')),
+        ('comment', Comment.objects.values_list('post_id', 'created_date')),
+        ('review', Review.objects.values_list('post_id', 'created_date')),
+        ('comment_vote', CommentVote.objects.values_list('comment__post_id', 'created_date')),
+    ]
+    for kind, rows in sources:
+        for post_id, created in rows.iterator(chunk_size=5000):
+            yield kind, post_id, created
+
+
+def rebuild(now=None, batch_size=1000):
+    """Recalcula todas las puntuaciones desde las interacciones (tras cargas masivas)"""
+    now = now or timezone.now()
+    weights = get_weights()
+    half_life = get_half_life()
+    scores = defaultdict(float)
+    for kind, post_id, created in engagement_events():
+        age = (now - created).total_seconds()
+        # Lo muy antiguo ya no aporta nada y 2 ** -age se iría a cero de todas formas
+        if weights[kind] and age < 64 * half_life:
+            scores[post_id] += weights[kind] * 2 ** (-age / half_life)
+
+    with transaction.atomic():
+        Post.objects.filter(hot_score__gt=0).update(hot_score=0)
+        posts = [Post(pk=post_id, hot_score=score) for post_id, score in scores.items() if score >= MIN_SCORE]
+        Post.objects.bulk_update(posts, ['hot_score'], batch_size=batch_size)
+        HotScoreState.objects.update_or_create(pk=1, defaults={'decayed_at': now})
+    return len(posts)
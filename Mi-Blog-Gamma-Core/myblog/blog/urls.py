@@ -1,4 +1,4 @@
-from django.urls import path
+from django.urls import path, re_path
 from . import views
 
 app_name = 'blog'
@@ -6,8 +6,11 @@ app_name = 'blog'
 urlpatterns = [
     # Posts
     path('', views.post_list, name='post_list'),
+    path('trending/', views.trending, name='trending'),
+    path('search/suggest/', views.search_suggest, name='search_suggest'),
     path('post/create/', views.PostCreateView.as_view(), name='post_create'),
     path('post/<slug:slug>/', views.post_detail, name='post_detail'),
+    path('post/<slug:slug>/comments/', views.post_comments, name='post_comments'),
     path('post/<slug:slug>/edit/', views.PostUpdateView.as_view(), name='post_edit'),
     path('post/<slug:slug>/delete/', views.PostDeleteView.as_view(), name='post_delete'),
     
@@ -19,12 +22,19 @@ urlpatterns = [
     # Perfil
     path('profile/', views.profile, name='profile'),
     path('profile/edit/', views.profile_edit, name='profile_edit'),
+    path('profile/engagement.csv', views.engagement_export, name='engagement_export'),
     
     # Moderación
-    path('comment/<int:comment_id>/<str:action>/', views.moderate_comment, name='moderate_comment'),
+    # Sólo approve/reject: con <str:action> se quedaba también con vote/ y pin/
+    re_path(r'^comment/(?P<comment_id>\d+)/(?P<action>approve|reject)/$', views.moderate_comment,
+            name='moderate_comment'),
+    path('moderation/', views.moderation_queue, name='moderation_queue'),
     
     # Etiquetas
+    path('tags/', views.tag_index, name='tag_index'),
     path('tag/<slug:tag_slug>/', views.posts_by_tag, name='posts_by_tag'),
+    re_path(r'^tag/(?P<tag_expression>[-\w]+(?:\+[-\w]+)+|[-\w]+(?:,[-\w]+)+)/$',
+            views.posts_by_tags, name='posts_by_tags'),
     
     # Funcionalidades sociales
     path('post/<slug:slug>/react/', views.add_reaction, name='add_reaction'),
@@ -33,7 +43,20 @@ urlpatterns = [
     path('notifications/', views.notifications, name='notifications'),
     path('notification/<int:notification_id>/read/', views.mark_notification_read, name='mark_notification_read'),
     path('notifications/count/', views.notification_count, name='notification_count'),
+    path('users/suggest/', views.user_suggest, name='user_suggest'),
     path('subscriptions/', views.subscriptions, name='subscriptions'),
     path('rss/', views.rss_feed, name='rss_feed'),
     path('rss/<str:feed_type>/<str:feed_id>/', views.rss_feed, name='rss_feed_filtered'),
+    path('sitemap.xml', views.sitemap_index, name='sitemap_index'),
+    re_path(r'^sitemap-(?P<section>posts|tags)-(?P<number>\d{1,19})\.xml$', views.sitemap_section, name='sitemap_section'),
+    
+    # API JSON de sólo lectura
+    path('api/posts/', views.api_posts, name='api_posts'),
+    path('api/posts/<slug:slug>/', views.api_post, name='api_post'),
+    path('api/posts/<slug:slug>/comments/', views.api_post_comments, name='api_post_comments'),
+    path('api/tags/', views.api_tags, name='api_tags'),
+    path('api/authors/<str:username>/', views.api_author, name='api_author'),
+    
+    # Métricas
+    path('metrics/', views.metrics_summary, name='metrics_summary'),
 ]
\ No newline at end of file
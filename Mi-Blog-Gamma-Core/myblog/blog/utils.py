@@ -1,4 +1,6 @@
 import re
+from contextlib import contextmanager
+
 from django.contrib.auth.models import User
 from .models import Notification
 
@@ -62,3 +64,20 @@ def send_comment_notification(post, comment_author):
             message=f'{comment_author.first_name} {comment_author.last_name} comentó en tu post "{post.title}"',
             url=post.get_absolute_url()
         )
+
+
+@contextmanager
+def historic_dates(*models):
+    """Permite asignar fechas pasadas a campos auto_now/auto_now_add"""
+    fields = [
+        field for model in models for field in model._meta.fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
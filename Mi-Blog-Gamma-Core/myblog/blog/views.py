@@ -1,18 +1,33 @@
+import operator
+import os
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import reduce
+
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
+from django.template.loader import render_to_string
 from django.core.paginator import Paginator
 from django.contrib import messages
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.views import LoginView, LogoutView
 from django.views.generic import CreateView, UpdateView, DeleteView
 from django.urls import reverse_lazy, reverse
-from django.db.models import Q, Sum
-from django.db import models
-from django.http import JsonResponse
+from django.db.models import Q, Sum, Exists, OuterRef
+from django.db import models, transaction
+from django.http import FileResponse, Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
-from .models import Post, Comment, Profile, Review, Reaction, CommentVote, Notification, Subscription
+from django.utils.http import http_date
+from django.core.cache import cache
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import require_safe
+from django.contrib.contenttypes.models import ContentType
+from taggit.models import TaggedItem
+from .models import Post, Comment, Profile, Review, Reaction, CommentVote, Notification, Subscription, TagStats, RelatedPost
+from . import api, duplicates, engagement, metrics, sitemaps, suggest, tag_bitmaps
 from .utils import detect_mentions, send_reaction_notification, send_comment_notification
 from .forms import CommentForm, CustomUserCreationForm, ProfileForm, PostForm, ReviewForm
 
@@ -30,36 +45,227 @@ def post_list(request):
         )
     
     # Paginación
+    posts = posts.select_related('author').prefetch_related('tags').with_stats().without_body()
     paginator = Paginator(posts, 10)  # 10 posts por página
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     
     return render(request, 'blog/post_list.html', {
         'page_obj': page_obj,
-        'search_query': search_query
+        'search_query': search_query,
+        # Se evalúa sólo si el fragmento cacheado de la nube ha caducado
+        'tag_cloud': TagStats.objects.cloud,
+    })
+
+# Sólo depende de `q`: las cachés intermedias pueden compartirla un rato
+@cache_control(public=True, max_age=60)
+def search_suggest(request):
+    """Títulos y etiquetas que empiezan por lo escrito en el buscador (índice en memoria, sin consultas)"""
+    query = request.GET.get('q', '')
+    results = suggest.index.suggest(query)
+    return JsonResponse({
+        'query': query,
+        'tags': [
+            {'name': name, 'url': reverse('blog:posts_by_tag', args=[slug]), 'posts': count}
+            for name, slug, count in results[suggest.TAGS]
+        ],
+        'posts': [
+            {'title': title, 'url': reverse('blog:post_detail', args=[slug])}
+            for title, slug in results[suggest.POSTS]
+        ],
+    })
+
+def trending(request):
+    """Posts en tendencia por hot_score, con paginación por cursor (?after=puntuación:id)"""
+    per_page = 10
+    posts = (
+        Post.objects.filter(published=True, hot_score__gt=0)
+        .select_related('author').prefetch_related('tags').with_stats().without_body()
+        .order_by('-hot_score', '-id')
+    )
+    cursor = parse_cursor(request.GET.get('after', ''), float, int)
+    if cursor:
+        score, post_id = cursor
+        # Rango sobre el índice (hot_score, id); los empates exactos se descartan después
+        posts = posts.filter(hot_score__lte=score).exclude(hot_score=score, id__gte=post_id)
+    
+    page = list(posts[:per_page + 1])
+    next_cursor = None
+    if len(page) > per_page:
+        page = page[:per_page]
+        next_cursor = f'{page[-1].hot_score!r}:{page[-1].id}'
+    
+    return render(request, 'blog/trending.html', {
+        'posts': page,
+        'next_cursor': next_cursor,
+        'is_first_page': not cursor,
+    })
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+# Enteros que caben en una columna INTEGER de SQLite (64 bits con signo);
+# uno mayor en un filtro da OverflowError al ejecutar la consulta
+MAX_DB_INT = 2 ** 63
+
+
+def in_db_range(number):
+    return -MAX_DB_INT <= number < MAX_DB_INT
+
+
+def parse_id(value):
+    """Un id que llega en la petición, o None si no es un número que quepa en la columna"""
+    if not (value.isascii() and value.isdigit()):
+        return None
+    number = int(value)
+    return number if in_db_range(number) else None
+
+
+def get_comments_per_page():
+    return getattr(settings, 'BLOG_COMMENTS_PER_PAGE', 20)
+
+
+def visible_comments(request, post):
+    """
+    (comentarios que ve el usuario, puede moderar); el autor del post ve
+    también los pendientes. Sin filtrar por post: comment_threads_page pone
+    el post en cada condición para que SQLite elija el índice adecuado.
+    """
+    can_moderate = request.user.is_authenticated and request.user.id == post.author_id
+    comments = Comment.objects.select_related('author__profile')
+    if not can_moderate:
+        comments = comments.filter(is_approved=True)
+    return comments, can_moderate
+
+
+def comment_cursor(comment):
+    """Posición de una raíz en el orden -pinned, -wilson_score, created_date, id"""
+    micros = (comment.created_date - EPOCH) // timedelta(microseconds=1)
+    return f'{comment.pinned:d}:{comment.wilson_score!r}:{micros}:{comment.id}'
+
+
+def cursor_datetime(micros):
+    """Fecha de un cursor, en microsegundos desde EPOCH"""
+    return EPOCH + timedelta(microseconds=int(micros))
+
+
+def parse_cursor(value, *types):
+    """
+    Partes de un cursor "a:b:..." convertidas con `types` (int, float,
+    cursor_datetime...), o None si no tiene ese formato o algún valor se
+    sale de rango (timedelta da OverflowError con fechas imposibles; los
+    enteros tienen que caber en 64 bits)
+    """
+    parts = value.split(':')
+    if len(parts) != len(types):
+        return None
+    try:
+        values = tuple(convert(part) for convert, part in zip(types, parts))
+    except (ValueError, OverflowError):
+        return None
+    if not all(in_db_range(value) for value in values if isinstance(value, int)):
+        return None
+    return values
+
+
+def parse_comment_cursor(value):
+    cursor = parse_cursor(value, int, float, cursor_datetime, int)
+    if cursor is None:
+        return None
+    pinned, score, created_date, comment_id = cursor
+    return bool(pinned), score, created_date, comment_id
+
+
+def comment_threads_page(post, comments, after=None, per_page=None):
+    """
+    Una página de hilos del post: las raíces siguientes al cursor `after`
+    por el índice de "mejores comentarios" y, en una segunda consulta, las
+    respuestas de esas raíces (un rango de path por raíz) en orden de hilo.
+    Devuelve (raíces con `thread`, cursor de la siguiente página o None).
+    """
+    per_page = per_page or get_comments_per_page()
+    roots = comments.filter(post=post, depth=0).order_by('-pinned', '-wilson_score', 'created_date', 'id')
+    cursor = parse_comment_cursor(after) if after else None
+    if cursor:
+        pinned, score, created_date, comment_id = cursor
+        following = Q(created_date__gt=created_date) | Q(created_date=created_date, id__gt=comment_id)
+        following = Q(wilson_score__lt=score) | Q(wilson_score=score) & following
+        roots = roots.filter(Q(pinned__lt=pinned) | Q(pinned=pinned) & following)
+
+    roots = list(roots[:per_page + 1])
+    next_cursor = None
+    if len(roots) > per_page:
+        roots = roots[:per_page]
+        next_cursor = comment_cursor(roots[-1])
+
+    # Con el post en cada rama (y no fuera del OR) SQLite busca cada subárbol
+    # en el índice (post, path); ordenar esas pocas filas aquí le ahorra el
+    # B-tree temporal
+    subtrees = [
+        Q(post=post, path__gt=root.path + Comment.PATH_SEP, path__lt=root.path + '0')
+        for root in roots if root.path
+    ]
+    replies = comments.filter(reduce(operator.or_, subtrees)).order_by() if subtrees else []
+    replies = sorted(replies, key=lambda reply: reply.path)
+    return build_comment_threads(roots, replies), next_cursor
+
+
+def build_comment_threads(roots, replies):
+    """
+    Cuelga de cada raíz sus respuestas en orden de path (`root.thread`). Una
+    respuesta cuyo padre no se muestra (pendiente de aprobación) se oculta
+    con todo su subárbol.
+    """
+    shown = {}
+    for root in roots:
+        root.thread = []
+        shown[root.id] = root
+    for reply in replies:
+        if reply.parent_id in shown:
+            shown[reply.ancestor_ids()[0]].thread.append(reply)
+            shown[reply.id] = reply
+    return roots
+
+
+def user_comment_votes(user, roots):
+    """{comment_id: voto} del usuario para las raíces y sus respuestas (una consulta)"""
+    if not user.is_authenticated:
+        return {}
+    votes = {comment.id: 0 for root in roots for comment in [root, *root.thread]}
+    votes.update(
+        CommentVote.objects.filter(comment__in=votes.keys(), user=user).values_list('comment_id', 'vote')
+    )
+    return votes
+
+
+def post_comments(request, slug):
+    """Siguiente página de hilos de comentarios (?after=cursor), como fragmento HTML en JSON"""
+    post = get_object_or_404(Post.objects.only('id', 'author_id'), slug=slug, published=True)
+    comments, can_moderate = visible_comments(request, post)
+    roots, next_cursor = comment_threads_page(post, comments, request.GET.get('after'))
+    html = render_to_string('blog/comment_threads.html', {
+        'comments': roots,
+        'can_moderate': can_moderate,
+    }, request=request)
+    return JsonResponse({
+        'html': html,
+        'next_cursor': next_cursor,
+        'votes': user_comment_votes(request.user, roots),
     })
 
+
 def post_detail(request, slug):
     """Vista para mostrar un post específico con sus comentarios y reseñas"""
-    post = get_object_or_404(Post, slug=slug, published=True)
-    
-    # Obtener comentarios ordenados por mejores comentarios
-    comments = post.comments.filter(is_approved=True).annotate(
-        score=models.Sum('votes__vote')
-    ).order_by('-pinned', '-score', 'created_date')
+    post = get_object_or_404(
+        # Se pinta rendered_html; content sólo hace falta al editar
+        Post.objects.select_related('author').prefetch_related('tags').with_stats().defer('content'),
+        slug=slug, published=True
+    )
     
     new_comment = None
     user_review = None
     user_reaction = None
-    can_moderate = False
-
-    # Verificar si el usuario puede moderar comentarios
-    if request.user.is_authenticated and request.user == post.author:
-        can_moderate = True
-        # Mostrar todos los comentarios para moderación
-        comments = post.comments.all().annotate(
-            score=models.Sum('votes__vote')
-        ).order_by('-pinned', '-score', 'created_date')
+    # Primera página de hilos; el resto se pide a post_comments al pulsar "Cargar más"
+    comments, can_moderate = visible_comments(request, post)
+    comments, next_comments_cursor = comment_threads_page(post, comments)
 
     # Obtener reseña del usuario actual si existe
     if request.user.is_authenticated:
@@ -82,10 +288,17 @@ def post_detail(request, slug):
                 return redirect('blog:login')
             
             comment_form = CommentForm(data=request.POST)
+            parent = None
+            if request.POST.get('parent'):
+                parent_id = parse_id(request.POST['parent'])
+                if parent_id is None:
+                    return HttpResponseBadRequest('Comentario padre inválido')
+                parent = get_object_or_404(Comment, pk=parent_id, post=post)
             if comment_form.is_valid():
                 new_comment = comment_form.save(commit=False)
                 new_comment.post = post
                 new_comment.author = request.user
+                new_comment.parent = parent
                 new_comment.save()
                 
                 # Detectar menciones y crear notificaciones
@@ -126,11 +339,15 @@ def post_detail(request, slug):
         comment_form = CommentForm()
         review_form = ReviewForm()
 
-    # Preparar datos de votos del usuario para cada comentario
-    comment_votes = {}
-    if request.user.is_authenticated:
-        for comment in comments:
-            comment_votes[comment.id] = comment.get_user_vote(request.user)
+    # Preparar datos de votos del usuario para cada comentario (una sola consulta)
+    comment_votes = user_comment_votes(request.user, comments)
+
+    # Calculados fuera de línea (compute_related_posts); sólo lo que pinta la plantilla
+    related_posts = (
+        RelatedPost.objects.filter(post=post, related__published=True)
+        .select_related('related').only('related', 'related__title', 'related__slug', 'related__published_date')
+        .order_by('rank')
+    )
 
     return render(request, 'blog/post_detail.html', {
         'post': post,
@@ -143,7 +360,9 @@ def post_detail(request, slug):
         'user_reaction': user_reaction,
         'can_moderate': can_moderate,
         'reaction_types': Reaction.REACTION_TYPES,
-        'comment_votes': comment_votes
+        'comment_votes': comment_votes,
+        'next_comments_cursor': next_comments_cursor,
+        'related_posts': related_posts,
     })
 
 # Vistas de autenticación
@@ -200,7 +419,20 @@ def profile_edit(request):
     
     return render(request, 'blog/profile_edit.html', {'form': form})
 
+@login_required
+def engagement_export(request):
+    """CSV con las reseñas, comentarios y reacciones de los posts del usuario (ver blog/engagement.py)"""
+    posts = Post.objects.filter(author=request.user)
+    return engagement.csv_response(posts, f'interaccion-{request.user.username}.csv')
+
 # Vistas CRUD para posts
+def warn_near_duplicates(request, post):
+    """Avisa si el texto del post es casi igual al de otros publicados"""
+    similar = duplicates.find_similar(post.content, exclude=post.pk)
+    if similar:
+        titles = ', '.join(f'"{other.title}" ({score:.0%})' for other, score in similar)
+        messages.warning(request, f'Este post es muy parecido a: {titles}.')
+
 class PostCreateView(LoginRequiredMixin, CreateView):
     model = Post
     form_class = PostForm
@@ -212,7 +444,9 @@ class PostCreateView(LoginRequiredMixin, CreateView):
         if form.instance.published:
             form.instance.published_date = timezone.now()
         messages.success(self.request, '¡Tu post ha sido creado exitosamente!')
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        warn_near_duplicates(self.request, self.object)
+        return response
 
 class PostUpdateView(LoginRequiredMixin, UpdateView):
     model = Post
@@ -227,7 +461,9 @@ class PostUpdateView(LoginRequiredMixin, UpdateView):
         if form.instance.published and not form.instance.published_date:
             form.instance.published_date = timezone.now()
         messages.success(self.request, '¡Tu post ha sido actualizado!')
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        warn_near_duplicates(self.request, self.object)
+        return response
 
 class PostDeleteView(LoginRequiredMixin, DeleteView):
     model = Post
@@ -254,44 +490,198 @@ def moderate_comment(request, comment_id, action):
     
     if action == 'approve':
         comment.is_approved = True
-        comment.save()
+        comment.rejected = False
+        comment.save(update_fields=['is_approved', 'rejected'])
         messages.success(request, 'Comentario aprobado.')
     elif action == 'reject':
         comment.is_approved = False
-        comment.save()
+        comment.rejected = True
+        comment.save(update_fields=['is_approved', 'rejected'])
         messages.success(request, 'Comentario rechazado.')
     
     return redirect('blog:post_detail', slug=comment.post.slug)
 
+def moderation_cursor(comment):
+    """Posición de un comentario en la cola de moderación (-created_date, -id)"""
+    micros = (comment.created_date - EPOCH) // timedelta(microseconds=1)
+    return f'{micros}:{comment.id}'
+
+# Acción en bloque de la cola de moderación -> (cambios, texto del mensaje)
+MODERATION_ACTIONS = {
+    'approve': ({'is_approved': True}, 'aprobados'),
+    'reject': ({'rejected': True}, 'rechazados'),
+    'pin': ({'is_approved': True, 'pinned': True}, 'aprobados y fijados'),
+}
+
+@login_required
+def moderation_queue(request):
+    """
+    Comentarios pendientes de todos los posts del usuario, de más reciente a
+    más antiguo, con paginación por cursor (?after=microsegundos:id). El
+    índice parcial de pendientes lleva el post delante, así que cada post
+    del autor se lee por índice y sólo se ordenan sus pendientes. Un POST
+    aplica la acción a los marcados con un solo UPDATE y recalcula los
+    contadores de respuestas en la misma transacción.
+    """
+    per_page = get_comments_per_page()
+    pending = Comment.objects.filter(post__author=request.user, is_approved=False, rejected=False)
+
+    if request.method == 'POST':
+        action = MODERATION_ACTIONS.get(request.POST.get('action'))
+        comment_ids = [parse_id(value) for value in request.POST.getlist('comment_ids')]
+        comment_ids = [comment_id for comment_id in comment_ids if comment_id is not None]
+        if action is None or not comment_ids:
+            messages.error(request, 'Selecciona al menos un comentario y una acción.')
+            return redirect(request.get_full_path())
+        changes, label = action
+        with transaction.atomic():
+            updated = pending.filter(pk__in=comment_ids).update(**changes)
+            if updated and changes.get('is_approved'):
+                # update() no dispara las señales que mantienen reply_count
+                approved = Comment.objects.filter(pk__in=comment_ids, post__author=request.user, is_approved=True)
+                Comment.recount_replies(approved.order_by().only('path'))
+        messages.success(request, f'{updated} comentario(s) {label}.')
+        return redirect(request.get_full_path())
+
+    comments = (
+        pending.select_related('author', 'post')
+        .only('content', 'created_date', 'depth', 'author__username', 'post__title', 'post__slug')
+        .order_by('-created_date', '-id')
+    )
+    cursor = parse_cursor(request.GET.get('after', ''), cursor_datetime, int)
+    if cursor:
+        created_date, comment_id = cursor
+        comments = comments.filter(
+            Q(created_date__lt=created_date) | Q(created_date=created_date, id__lt=comment_id)
+        )
+
+    page = list(comments[:per_page + 1])
+    next_cursor = None
+    if len(page) > per_page:
+        page = page[:per_page]
+        next_cursor = moderation_cursor(page[-1])
+
+    return render(request, 'blog/moderation.html', {
+        'comments': page,
+        'next_cursor': next_cursor,
+        'is_first_page': not cursor,
+    })
+
+def published_posts_with_tag(tag):
+    """
+    Posts publicados con la etiqueta, ordenados por fecha de publicación.
+    Con EXISTS se recorre el índice de publicados en orden y se comprueba la
+    etiqueta por post, en lugar de unir TaggedItem y ordenar en memoria.
+    """
+    tagged = TaggedItem.objects.filter(
+        content_type=ContentType.objects.get_for_model(Post),
+        object_id=OuterRef('pk'),
+        tag=tag,
+    )
+    return Post.objects.filter(published=True).filter(Exists(tagged)).order_by('-published_date')
+
+class CountedPaginator(Paginator):
+    """Paginator con el total ya conocido: se ahorra el COUNT(*)"""
+
+    def __init__(self, object_list, per_page, count, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count = count
+
 # Vista para posts por etiqueta
 def posts_by_tag(request, tag_slug):
     """Vista para mostrar posts filtrados por etiqueta"""
     from taggit.models import Tag
-    tag = get_object_or_404(Tag, slug=tag_slug)
-    posts = Post.objects.filter(published=True, tags=tag).order_by('-published_date')
+    tag = get_object_or_404(Tag.objects.select_related('stats'), slug=tag_slug)
+    posts = (
+        published_posts_with_tag(tag).select_related('author').prefetch_related('tags')
+        .with_stats().without_body()
+    )
     
-    paginator = Paginator(posts, 10)
+    # TagStats ya sabe cuántos posts publicados tiene la etiqueta
+    stats = getattr(tag, 'stats', None)
+    if stats is not None:
+        paginator = CountedPaginator(posts, 10, stats.post_count)
+    else:
+        paginator = Paginator(posts, 10)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     
     return render(request, 'blog/posts_by_tag.html', {
         'tag': tag,
-        'page_obj': page_obj
+        'page_obj': page_obj,
+        'tag_cloud': TagStats.objects.cloud,
+    })
+
+def posts_by_tags(request, tag_expression):
+    """Posts con varias etiquetas: `a+b` (todas) o `a,b` (alguna)"""
+    from taggit.models import Tag
+    if '+' in tag_expression:
+        mode, slugs = tag_bitmaps.MATCH_ALL, tag_expression.split('+')
+    else:
+        mode, slugs = tag_bitmaps.MATCH_ANY, tag_expression.split(',')
+    slugs = list(dict.fromkeys(slugs))
+    tags = {tag.slug: tag for tag in Tag.objects.filter(slug__in=slugs)}
+    if not tags or (mode == tag_bitmaps.MATCH_ALL and len(tags) < len(slugs)):
+        raise Http404('Etiqueta no encontrada')
+    tags = [tags[slug] for slug in slugs if slug in tags]
+    
+    # Intersección o unión en memoria; la página se carga con un solo id__in
+    match = tag_bitmaps.index.match([tag.slug for tag in tags], mode)
+    posts = (
+        Post.objects.filter(published=True).select_related('author').prefetch_related('tags')
+        .with_stats().without_body()
+    )
+    paginator = Paginator(tag_bitmaps.IndexedPostList(match, posts), 10)
+    page_number = request.GET.get('page')
+    page_obj = paginator.get_page(page_number)
+    
+    return render(request, 'blog/posts_by_tag.html', {
+        'tags': tags,
+        'match_all': mode == tag_bitmaps.MATCH_ALL,
+        'page_obj': page_obj,
+        'tag_cloud': TagStats.objects.cloud,
+    })
+
+def tag_index(request):
+    """Vista con todas las etiquetas y su número de posts publicados"""
+    from taggit.models import Tag
+    sort = request.GET.get('sort')
+    if sort == 'popular':
+        items = TagStats.objects.select_related('tag').order_by('-post_count', 'tag_id')
+    elif sort == 'recent':
+        items = TagStats.objects.select_related('tag').order_by('-last_published', 'tag_id')
+    else:
+        # Por nombre se recorre el índice único de taggit_tag y no hace falta ordenar
+        sort = 'name'
+        items = Tag.objects.filter(stats__isnull=False).select_related('stats').order_by('name')
+    
+    paginator = Paginator(items, 100)
+    page_number = request.GET.get('page')
+    page_obj = paginator.get_page(page_number)
+    
+    return render(request, 'blog/tag_index.html', {
+        'page_obj': page_obj,
+        'tags': [item if sort == 'name' else item.tag for item in page_obj],
+        'sort': sort,
     })
 
 # Vistas para funcionalidades sociales
 
+def get_reaction_counts(post):
+    """Contadores de reacciones por tipo en una sola consulta agrupada"""
+    reaction_counts = {choice[0]: 0 for choice in Reaction.REACTION_TYPES}
+    reaction_counts.update(
+        Reaction.objects.filter(post=post).order_by()
+        .values_list('reaction_type').annotate(count=models.Count('id'))
+    )
+    return reaction_counts
+
 def add_reaction(request, slug):
     """Vista para agregar/quitar reacciones a posts"""
-    print(f"add_reaction called with slug: {slug}, method: {request.method}")
-    
     post = get_object_or_404(Post, slug=slug, published=True)
     
     # Obtener contadores actuales para cualquier método
-    reaction_counts = {}
-    for choice in Reaction.REACTION_TYPES:
-        count = Reaction.objects.filter(post=post, reaction_type=choice[0]).count()
-        reaction_counts[choice[0]] = count
+    reaction_counts = get_reaction_counts(post)
     
     if request.method == 'GET':
         # Devolver solo los contadores
@@ -302,7 +692,6 @@ def add_reaction(request, slug):
     
     if request.method == 'POST' and request.user.is_authenticated:
         reaction_type = request.POST.get('reaction_type')
-        print(f"Reaction type: {reaction_type}, User: {request.user}")
         
         if reaction_type in [choice[0] for choice in Reaction.REACTION_TYPES]:
             reaction, created = Reaction.objects.get_or_create(
@@ -327,10 +716,7 @@ def add_reaction(request, slug):
             send_reaction_notification(post, request.user, reaction_type)
         
         # Recalcular contadores después de la acción
-        reaction_counts = {}
-        for choice in Reaction.REACTION_TYPES:
-            count = Reaction.objects.filter(post=post, reaction_type=choice[0]).count()
-            reaction_counts[choice[0]] = count
+        reaction_counts = get_reaction_counts(post)
         
         return JsonResponse({
             'success': True,
@@ -355,11 +741,14 @@ def vote_comment(request, comment_id):
                 defaults={'vote': vote_value}
             )
             
+            previous = 0 if created else vote.vote
             if not created:
                 vote.vote = vote_value
                 vote.save()
             
-            # Obtener score actualizado
+            # Sólo este comentario: recuenta sus votos y guarda la puntuación Wilson
+            if vote_value != previous:
+                comment.refresh_score()
             score = comment.get_score()
             
             return JsonResponse({
@@ -381,7 +770,8 @@ def toggle_comment_pin(request, comment_id):
         return redirect('blog:post_detail', slug=comment.post.slug)
     
     comment.pinned = not comment.pinned
-    comment.save()
+    # Sólo el campo cambiado: no pisar los votos actualizados mientras tanto
+    comment.save(update_fields=['pinned'])
     
     action = 'fijado' if comment.pinned else 'desfijado'
     messages.success(request, f'Comentario {action}.')
@@ -411,6 +801,33 @@ def mark_notification_read(request, notification_id):
     
     return redirect('blog:notifications')
 
+def thread_participants(post_id):
+    """Autor y comentaristas (aprobados) de un post, cacheados un rato para el autocompletado"""
+    key = f'blog:participants:{post_id}'
+    participants = cache.get(key)
+    if participants is None:
+        commenters = Comment.objects.filter(post_id=post_id, is_approved=True).order_by().values_list('author_id')
+        author = Post.objects.filter(pk=post_id).order_by().values_list('author_id')
+        participants = {author_id for author_id, in commenters.union(author)}
+        cache.set(key, participants, 60)
+    return participants
+
+@login_required
+@cache_control(private=True, max_age=30)
+def user_suggest(request):
+    """Usuarios para autocompletar @menciones; primero quienes ya participan en el post ?post=<id>"""
+    query = request.GET.get('q', '').lstrip('@')
+    # Un ?post= que no sirve se ignora: salen los usuarios sin los participantes delante
+    post_id = parse_id(request.GET.get('post', ''))
+    participants = thread_participants(post_id) if query and post_id is not None else set()
+    return JsonResponse({
+        'query': query,
+        'users': [
+            {'username': username, 'name': name, 'participant': user_id in participants}
+            for user_id, username, name in suggest.index.suggest_users(query, participants)
+        ],
+    })
+
 @login_required
 def notification_count(request):
     """Vista para obtener el contador de notificaciones no leídas"""
@@ -420,7 +837,7 @@ def notification_count(request):
 @login_required
 def subscriptions(request):
     """Vista para gestionar suscripciones"""
-    user_subscriptions = request.user.subscriptions.all()
+    user_subscriptions = request.user.subscriptions.select_related('author')
     
     if request.method == 'POST':
         subscription_type = request.POST.get('subscription_type')
@@ -455,7 +872,9 @@ def subscriptions(request):
         return redirect('blog:subscriptions')
     
     # Obtener autores que han publicado posts
-    authors = User.objects.filter(post__published=True).distinct().order_by('first_name', 'last_name')
+    authors = User.objects.filter(
+        id__in=Post.objects.filter(published=True).values('author_id')
+    ).order_by('first_name', 'last_name')
     
     return render(request, 'blog/subscriptions.html', {
         'subscriptions': user_subscriptions,
@@ -470,15 +889,15 @@ def rss_feed(request, feed_type=None, feed_id=None):
     
     # Obtener posts según el tipo de feed
     if feed_type == 'author' and feed_id:
-        posts = Post.objects.filter(published=True, author_id=feed_id).order_by('-published_date')[:20]
+        posts = Post.objects.filter(published=True, author_id=feed_id).without_body().order_by('-published_date')[:20]
         feed_title = f"Posts de {User.objects.get(id=feed_id).username}"
     elif feed_type == 'tag' and feed_id:
         from taggit.models import Tag
         tag = get_object_or_404(Tag, slug=feed_id)
-        posts = Post.objects.filter(published=True, tags=tag).order_by('-published_date')[:20]
+        posts = published_posts_with_tag(tag).without_body()[:20]
         feed_title = f"Posts sobre {tag.name}"
     else:
-        posts = Post.objects.filter(published=True).order_by('-published_date')[:20]
+        posts = Post.objects.filter(published=True).without_body().order_by('-published_date')[:20]
         feed_title = "Todos los posts"
     
     # Generar RSS
@@ -492,10 +911,85 @@ def rss_feed(request, feed_type=None, feed_id=None):
         feed.add_item(
             title=post.title,
             link=request.build_absolute_uri(post.get_absolute_url()),
-            description=post.excerpt or post.content[:200],
+            description=post.summary,
             pubdate=post.published_date
         )
     
     response = HttpResponse(feed.writeString('utf-8'), content_type='application/rss+xml')
     response['Content-Disposition'] = 'attachment; filename="feed.xml"'
-    return response
\ No newline at end of file
+    return response
+
+def sitemap_index(request):
+    """Índice de sitemaps: un sitemap por segmento de cada sección (ver blog/sitemaps.py)"""
+    base_url = request.build_absolute_uri('/').rstrip('/')
+    chunks = (chunk.encode() for chunk in sitemaps.render_index(base_url))
+    return StreamingHttpResponse(chunks, content_type='application/xml')
+
+def sitemap_section(request, section, number):
+    """Un segmento del sitemap: del disco si no ha cambiado, si no generado en streaming"""
+    section_name, number = section, int(number)
+    section = sitemaps.SECTIONS[section_name]
+    # El tramo del segmento tiene que caber en la columna
+    if not in_db_range((number + 1) * sitemaps.get_segment_size()):
+        raise Http404('Segmento vacío')
+    count, lastmod, checksum = section.fingerprint(number)
+    if not count:
+        raise Http404('Segmento vacío')
+    base_url = request.build_absolute_uri('/').rstrip('/')
+    path = sitemaps.segment_path(section_name, number, base_url, count, lastmod, checksum)
+    if os.path.exists(path):
+        response = FileResponse(open(path, 'rb'), content_type='application/xml')
+    else:
+        chunks = sitemaps.write_through(sitemaps.render_segment(base_url, section, number), path)
+        response = StreamingHttpResponse(chunks, content_type='application/xml')
+    if lastmod:
+        response['Last-Modified'] = http_date(lastmod.timestamp())
+    return response
+
+# API JSON de sólo lectura (ver blog/api.py). no-cache: las cachés pueden
+# guardarla, pero revalidan con el ETag antes de servirla
+@require_safe
+@cache_control(public=True, no_cache=True)
+def api_posts(request):
+    """Posts publicados, del más reciente al más antiguo (?author=usuario, ?tag=slug)"""
+    filters = {}
+    if request.GET.get('author'):
+        filters['author__username'] = request.GET['author']
+    if request.GET.get('tag'):
+        filters['tags__slug'] = request.GET['tag']
+    return api.list_response(request, api.POSTS, **filters)
+
+@require_safe
+@cache_control(public=True, no_cache=True)
+def api_post(request, slug):
+    return api.detail_response(request, api.POSTS, defaults=api.POST_DETAIL_FIELDS, slug=slug)
+
+@require_safe
+@cache_control(public=True, no_cache=True)
+def api_post_comments(request, slug):
+    """Comentarios aprobados de un post, en orden de llegada"""
+    post_id = Post.objects.filter(slug=slug, published=True).values_list('id', flat=True).first()
+    if post_id is None:
+        return api.error('No encontrado', 404)
+    return api.list_response(request, api.COMMENTS, post_id=post_id)
+
+@require_safe
+@cache_control(public=True, no_cache=True)
+def api_tags(request):
+    """Etiquetas con posts publicados, por slug"""
+    return api.list_response(request, api.TAGS)
+
+@require_safe
+@cache_control(public=True, no_cache=True)
+def api_author(request, username):
+    """Ficha de un autor; sus posts están en posts_url"""
+    return api.detail_response(request, api.AUTHORS, username=username)
+
+@staff_member_required
+def metrics_summary(request):
+    """Resumen JSON de las métricas por vista (solo staff)"""
+    return JsonResponse({
+        'window_seconds': metrics.registry.window_seconds,
+        'windows': metrics.registry.windows,
+        'views': metrics.registry.summary(),
+    })
@@ -43,12 +43,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "blog.middleware.QueryTimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
+    "blog.middleware.ReadReplicaMiddleware",
+    "blog.middleware.ProfilingMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
@@ -80,9 +83,84 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
-    }
+    },
+    # Réplica de solo lectura: copia local de SQLite que se refresca con la
+    # API de backup (python manage.py refresh_replica)
+    "replica": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "db_replica.sqlite3",
+        "TEST": {"MIRROR": "default"},
+    },
 }
 
+DATABASE_ROUTERS = ["blog.routers.PrimaryReplicaRouter"]
+
+# Alias usado por las vistas de solo lectura (None = todo va a 'default')
+BLOG_READ_DATABASE = "replica"
+
+# Segundos que un usuario lee del primario después de escribir
+BLOG_READ_YOUR_WRITES_SECONDS = 5
+
+# Histogramas de QueryTimingMiddleware: ventanas de 60 s, se guardan las 5 últimas
+BLOG_METRICS_WINDOW_SECONDS = 60
+BLOG_METRICS_WINDOWS = 5
+
+# Perfilado de peticiones (ProfilingMiddleware): los staff lo piden con
+# ?_profile=1; además se perfila esta fracción de todas las peticiones y se
+# guardan y registran las que tarden más de BLOG_PROFILE_SLOW_MS
+BLOG_PROFILE_DIR = BASE_DIR / "profiles"
+BLOG_PROFILER = "cprofile"  # o "sampling"
+BLOG_PROFILE_SAMPLE_RATE = 0.0
+BLOG_PROFILE_SLOW_MS = 500
+BLOG_PROFILE_SAMPLING_INTERVAL = 0.001
+
+# Índice en memoria de /tag/a+b/ y /tag/a,b/ (blog.tag_bitmaps): cada proceso
+# lo reconstruye pasado este tiempo para ver lo que escriben los demás
+BLOG_TAG_INDEX_MAX_AGE = 600
+
+# Autocompletado de /search/suggest/ (blog.suggest): índice por proceso que se
+# reconstruye pasado este tiempo y sugerencias de cada tipo por respuesta
+BLOG_SUGGEST_INDEX_MAX_AGE = 600
+BLOG_SUGGEST_LIMITS = {"posts": 7, "tags": 3}
+
+# sitemap.xml (blog.sitemaps): URLs por segmento (tramo de ids), carpeta donde
+# se guardan los segmentos generados y segundos que se cachea el índice
+BLOG_SITEMAP_SEGMENT_SIZE = 10000
+BLOG_SITEMAP_DIR = BASE_DIR / "sitemaps"
+BLOG_SITEMAP_INDEX_TTL = 600
+
+# API JSON (blog.api): filas por página por defecto y máximo que se puede
+# pedir con ?limit=
+BLOG_API_PAGE_SIZE = 20
+BLOG_API_MAX_PAGE_SIZE = 100
+
+# Posts relacionados que se guardan por post (comando compute_related_posts)
+BLOG_RELATED_POSTS = 5
+
+# Jaccard estimado (MinHash) a partir del cual dos posts son casi duplicados
+BLOG_DUPLICATE_THRESHOLD = 0.8
+
+# Tendencias (blog.trending): cada interacción pierde la mitad de su peso en
+# este tiempo; decay_hot_scores reescala las puntuaciones periódicamente
+BLOG_TRENDING_HALF_LIFE_HOURS = 24
+BLOG_TRENDING_WEIGHTS = {"reaction": 1.0, "comment": 3.0, "review": 2.0, "comment_vote": 0.5}
+
+# Niveles de respuesta por debajo de un comentario raíz; una respuesta más
+# profunda se cuelga del último nivel permitido
+BLOG_COMMENT_MAX_DEPTH = 5
+
+# Hilos de comentarios (raíces) que post_detail pinta de entrada; el resto se
+# pide por páginas de este tamaño a /post/<slug>/comments/
+BLOG_COMMENTS_PER_PAGE = 20
+
+# Imágenes subidas con CKEditor (comando optimize_images): ancho máximo del
+# original, anchos de las variantes para srcset, calidad JPEG/WebP y carpeta
+# de las variantes dentro de MEDIA_ROOT
+BLOG_IMAGE_MAX_WIDTH = 1600
+BLOG_IMAGE_WIDTHS = (480, 960)
+BLOG_IMAGE_QUALITY = 82
+BLOG_IMAGE_VARIANTS_PATH = "responsive/"
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -133,7 +211,8 @@ LOGOUT_REDIRECT_URL = '/'
 
 # CKEditor settings
 CKEDITOR_UPLOAD_PATH = "uploads/"
-CKEDITOR_IMAGE_BACKEND = "pillow"
+# Sube como el backend de Pillow y encola la imagen para optimize_images (blog/images.py)
+CKEDITOR_IMAGE_BACKEND = "blog.images.UploadBackend"
 CKEDITOR_CONFIGS = {
     'default': {
         'toolbar': 'full',